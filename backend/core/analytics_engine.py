@@ -0,0 +1,245 @@
+"""
+Columnar analytics computations (NumPy/pandas).
+
+Reports stream only the fields they need from MongoDB through a batched cursor
+into column arrays, then compute with vectorized operations instead of looping
+over documents in Python. Functions here are pure apart from the `*_frame`
+loaders, so the same maths serves the API and background jobs.
+"""
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+import os
+
+import numpy as np
+import pandas as pd
+
+# Documents fetched per cursor round-trip when building frames
+FRAME_BATCH_SIZE = int(os.environ.get('ANALYTICS_BATCH_SIZE', '10000'))
+
+EXCLUDED_STATUSES = ["cancelled", "refunded"]
+
+
+async def stream_frame(collection, query: dict, columns: List[str], batch_size: int = FRAME_BATCH_SIZE) -> pd.DataFrame:
+    """Load `columns` of every matching document into a DataFrame (missing fields become None)"""
+    projection = {"_id": 0, **{c: 1 for c in columns}}
+    data: Dict[str, list] = {c: [] for c in columns}
+    cursor = collection.find(query, projection).batch_size(batch_size)
+    async for doc in cursor:
+        for column in columns:
+            data[column].append(doc.get(column))
+    return pd.DataFrame(data, columns=columns)
+
+
+def to_utc(values: pd.Series) -> pd.Series:
+    """Parse a column of datetimes and/or ISO strings into UTC timestamps (NaT when unparseable)"""
+    return pd.to_datetime(values, utc=True, errors="coerce", format="mixed")
+
+
+def numeric(frame: pd.DataFrame, column: str, default: float = 0) -> pd.Series:
+    return pd.to_numeric(frame[column], errors="coerce").fillna(default)
+
+
+async def products_frame(db, columns: Iterable[str], query: Optional[dict] = None) -> pd.DataFrame:
+    return await stream_frame(db.products, query or {}, list(dict.fromkeys(["id", *columns])))
+
+
+# Order time as a sortable "YYYY-MM-DDTHH:MM:SS" string; created_at is stored as a date or an ISO
+# string and $toString renders dates in the same ISO form
+ORDER_TIME_EXPR = {"$substrCP": [{"$toString": "$created_at"}, 0, 19]}
+
+
+async def aggregate_frame(collection, pipeline: List[dict], columns: List[str],
+                          batch_size: int = FRAME_BATCH_SIZE) -> pd.DataFrame:
+    """Stream the output of an aggregation pipeline into a DataFrame"""
+    data: Dict[str, list] = {c: [] for c in columns}
+    cursor = collection.aggregate(pipeline, allowDiskUse=True, batchSize=batch_size)
+    async for doc in cursor:
+        for column in columns:
+            data[column].append(doc.get(column))
+    return pd.DataFrame(data, columns=columns)
+
+
+def _sales_match(store_id: Optional[str]) -> dict:
+    match = {"status": {"$nin": EXCLUDED_STATUSES}, "customer_id": {"$ne": None}}
+    if store_id:
+        match["store_id"] = store_id
+    return match
+
+
+async def customer_months_frame(db, store_id: Optional[str] = None) -> pd.DataFrame:
+    """Revenue per (customer, calendar month of order), in one $group over orders"""
+    return await aggregate_frame(db.orders, [
+        {"$match": _sales_match(store_id)},
+        {"$group": {
+            "_id": {"customer_id": "$customer_id", "month": {"$substrCP": [ORDER_TIME_EXPR, 0, 7]}},
+            "revenue": {"$sum": {"$ifNull": ["$total", 0]}}
+        }},
+        {"$project": {"_id": 0, "customer_id": "$_id.customer_id", "month": "$_id.month", "revenue": 1}}
+    ], ["customer_id", "month", "revenue"])
+
+
+def units_sold_from_rollups(rows: Iterable[dict]) -> pd.Series:
+    """Units sold per product id, summed over the product breakdowns of sales rollup rows"""
+    product_ids, quantities = [], []
+    for row in rows:
+        for entry in (row.get("products") or {}).values():
+            product_ids.append(entry.get("product_id"))
+            quantities.append(entry.get("quantity", 0))
+    if not product_ids:
+        return pd.Series(dtype="float64")
+    return pd.Series(quantities, index=product_ids, dtype="float64").groupby(level=0).sum()
+
+
+def records(frame: pd.DataFrame) -> List[dict]:
+    """Rows as JSON-ready dicts (missing values become None)"""
+    return frame.astype(object).where(frame.notna(), None).to_dict("records")
+
+
+def period_change(current, previous) -> np.ndarray:
+    """Percent change per KPI; 100 when the previous value is 0 and the current is positive"""
+    current = np.asarray(current, dtype="float64")
+    previous = np.asarray(previous, dtype="float64")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        change = np.round((current - previous) / previous * 100, 1)
+    return np.where(previous == 0, np.where(current > 0, 100, 0), change)
+
+
+def inventory_turnover(products: pd.DataFrame, units_sold: pd.Series, days: int) -> pd.DataFrame:
+    """Turnover rate and days of stock per product, most units sold first"""
+    stock = numeric(products, "stock").to_numpy()
+    sold = units_sold.reindex(products["id"]).fillna(0).to_numpy()
+
+    total = stock + sold
+    avg_stock = np.where(total > 0, total / 2, 1)  # Simple average
+    turnover_rate = sold / avg_stock
+    with np.errstate(divide="ignore", invalid="ignore"):
+        days_of_stock = np.where(sold > 0, stock / (sold / days), 999)
+
+    result = pd.DataFrame({
+        "product_id": products["id"],
+        "name": products["name"],
+        "sku": products["sku"],
+        "current_stock": products["stock"].fillna(0),
+        "units_sold": sold.astype("int64"),
+        "turnover_rate": np.round(turnover_rate, 2),
+        "days_of_stock": np.round(np.minimum(days_of_stock, 999), 0),
+        "status": np.select(  # Classified on the exact value; only the output is rounded
+            [(days_of_stock >= 30) & (days_of_stock <= 90), days_of_stock < 30], ["healthy", "low"], "excess"
+        )
+    })
+    return result.sort_values("units_sold", ascending=False, kind="stable")
+
+
+def reorder_suggestions(products: pd.DataFrame, units_sold: pd.Series, window_days: int = 30) -> pd.DataFrame:
+    """Products at or below their reorder point, most urgent first"""
+    stock = numeric(products, "stock").to_numpy()
+    lead_time = numeric(products, "lead_time_days", 7).to_numpy()
+    safety_stock = numeric(products, "safety_stock", 5).to_numpy()
+    daily_rate = units_sold.reindex(products["id"]).fillna(0).to_numpy() / window_days
+
+    reorder_point = daily_rate * lead_time + safety_stock
+    suggested = np.maximum(0, np.trunc(daily_rate * 30 - stock + safety_stock))  # 30 days of stock
+    urgency = np.select([stock <= 0, stock <= safety_stock], ["critical", "high"], "medium")
+
+    result = pd.DataFrame({
+        "product_id": products["id"],
+        "name": products["name"],
+        "sku": products["sku"],
+        "current_stock": products["stock"].fillna(0),
+        "reorder_point": np.round(reorder_point, 0),
+        "daily_sales_rate": np.round(daily_rate, 2),
+        "suggested_quantity": suggested.astype("int64"),
+        "urgency": urgency
+    })[(stock <= reorder_point) & (suggested > 0)]
+    order = result["urgency"].map({"critical": 0, "high": 1, "medium": 2})
+    return result.iloc[np.argsort(order.to_numpy(), kind="stable")]
+
+
+SEGMENTS = {
+    "vip": {"name": "VIP", "criteria": "10+ orders or $1000+ spent"},
+    "loyal": {"name": "Loyal", "criteria": "5-9 orders or $500-999 spent"},
+    "regular": {"name": "Regular", "criteria": "2-4 orders"},
+    "new": {"name": "New", "criteria": "1 order"},
+    "at_risk": {"name": "At Risk", "criteria": "No orders in 90+ days"},
+    "inactive": {"name": "Inactive", "criteria": "No orders in 180+ days"}
+}
+
+
+def customer_segments(customers: pd.DataFrame, now: datetime) -> List[dict]:
+    """
+    Count customers and their revenue per segment.
+
+    `customers` has the maintained lifetime stats of every customer (total_orders,
+    total_spent, last_order_at); customers without orders fall into the recency segments.
+    """
+    stats = customers.rename(columns={"total_orders": "order_count", "last_order_at": "last_order"})
+    order_count = numeric(stats, "order_count").to_numpy()
+    total_spent = numeric(stats, "total_spent").to_numpy()
+    last_order = to_utc(stats["last_order"])
+    days_since = ((pd.Timestamp(now) - last_order) / pd.Timedelta(days=1)).fillna(999).to_numpy()
+    days_since = np.floor(days_since)
+
+    segment = np.select(
+        [
+            (order_count >= 10) | (total_spent >= 1000),
+            (order_count >= 5) | (total_spent >= 500),
+            order_count >= 2,
+            days_since >= 180,
+            days_since >= 90
+        ],
+        ["vip", "loyal", "regular", "inactive", "at_risk"],
+        "new"
+    )
+    totals = pd.DataFrame({"segment": segment, "revenue": total_spent}).groupby("segment")["revenue"].agg(["size", "sum"])
+
+    return [{
+        **info,
+        "count": int(totals["size"].get(key, 0)),
+        "revenue": round(float(totals["sum"].get(key, 0)), 2)
+    } for key, info in SEGMENTS.items()]
+
+
+def cohort_retention(customers: pd.DataFrame, activity: pd.DataFrame, period: str = "monthly",
+                     limit: int = 12) -> List[dict]:
+    """
+    Retention matrix of the latest `limit` signup cohorts.
+
+    `customers` has id/created_at, `activity` the customer_months_frame of their
+    orders. Offsets are calendar months between signup and order for both monthly
+    and weekly cohorts.
+    """
+    signups = customers.assign(signup=to_utc(customers["created_at"])).dropna(subset=["signup"])
+    if signups.empty:
+        return []
+    signups["cohort"] = signups["signup"].dt.strftime("%Y-%m" if period == "monthly" else "%Y-W%W")
+    sizes = signups.groupby("cohort").size()
+    latest = sorted(sizes.index, reverse=True)[:limit]
+
+    activity = activity.merge(
+        signups[["id", "signup", "cohort"]], left_on="customer_id", right_on="id"
+    )
+    activity = activity[activity["cohort"].isin(latest)]
+    month = pd.to_datetime(activity["month"], format="%Y-%m", errors="coerce")
+    activity = activity.assign(year=month.dt.year, month_number=month.dt.month).dropna(subset=["year"])
+    activity["offset"] = (
+        (activity["year"] - activity["signup"].dt.year) * 12
+        + (activity["month_number"] - activity["signup"].dt.month)
+    ).astype("int64")
+    activity["revenue"] = numeric(activity, "revenue")
+    matrix = activity.groupby(["cohort", "offset"]).agg(
+        customers=("customer_id", "nunique"), revenue=("revenue", "sum")
+    )
+
+    result = []
+    for cohort in latest:
+        size = int(sizes[cohort])
+        retention = {}
+        if cohort in matrix.index.get_level_values(0):
+            for offset, row in matrix.loc[cohort].iterrows():
+                retention[f"month_{offset}"] = {
+                    "customers": int(row["customers"]),
+                    "rate": round(float(row["customers"]) / size * 100, 1) if size > 0 else 0,
+                    "revenue": round(float(row["revenue"]), 2)
+                }
+        result.append({"cohort": cohort, "total_customers": size, "retention": retention})
+    return result
@@ -0,0 +1,106 @@
+"""
+Streaming bulk CSV imports.
+
+Uploaded CSVs are read from the spooled upload instead of being decoded into
+memory whole; batches of rows are parsed in a worker thread so reading a large
+upload (which spools to disk) never blocks the event loop. Writes go out as
+unordered `bulk_write` batches.
+A `replace` import writes into a staging collection that is renamed over the
+live one when complete, so readers see either the old table or the new one,
+never a half-empty table.
+"""
+from contextlib import asynccontextmanager
+from itertools import islice
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+from uuid import uuid4
+import asyncio
+import csv
+import io
+import logging
+import os
+
+from fastapi import UploadFile
+
+logger = logging.getLogger(__name__)
+
+# Operations per bulk_write round-trip
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', '2000'))
+# CSV rows parsed per worker-thread hop
+CSV_PARSE_BATCH_ROWS = int(os.environ.get('CSV_PARSE_BATCH_ROWS', '1000'))
+
+
+async def _parsed_rows(reader: csv.DictReader, batch_rows: int) -> AsyncIterator[Dict[str, str]]:
+    while True:
+        batch = await asyncio.to_thread(list, islice(reader, batch_rows))
+        if not batch:
+            return
+        for row in batch:
+            yield row
+
+
+@asynccontextmanager
+async def csv_rows(file: UploadFile, batch_rows: int = CSV_PARSE_BATCH_ROWS) -> AsyncIterator[AsyncIterator[Dict[str, str]]]:
+    """Rows of an uploaded CSV (UTF-8, BOM tolerated) as dicts, parsed off the event loop in batches"""
+    await asyncio.to_thread(file.file.seek, 0)
+    text = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+    try:
+        yield _parsed_rows(csv.DictReader(text), batch_rows)
+    finally:
+        text.detach()  # Leave the upload open for Starlette to close
+
+
+class BulkWriter:
+    """Collects write operations and sends them as unordered bulk_write batches"""
+
+    def __init__(self, collection, batch_size: int = IMPORT_BATCH_SIZE,
+                 on_progress: Optional[Callable[[dict], Awaitable[Any]]] = None):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.on_progress = on_progress
+        self._ops: List[Any] = []
+        self.counts = {"written": 0, "inserted": 0, "upserted": 0, "modified": 0, "batches": 0}
+
+    async def add(self, op):
+        self._ops.append(op)
+        if len(self._ops) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        if not self._ops:
+            return
+        ops, self._ops = self._ops, []
+        result = await self.collection.bulk_write(ops, ordered=False)
+        self.counts["written"] += len(ops)
+        self.counts["inserted"] += result.inserted_count
+        self.counts["upserted"] += result.upserted_count
+        self.counts["modified"] += result.modified_count
+        self.counts["batches"] += 1
+        logger.info(f"Import into {self.collection.name}: {self.counts['written']} operations written")
+        if self.on_progress:
+            await self.on_progress(dict(self.counts))
+
+
+async def _copy_indexes(source, target):
+    for name, spec in (await source.index_information()).items():
+        if name == "_id_":
+            continue
+        options = {k: v for k, v in spec.items() if k in ("unique", "sparse", "expireAfterSeconds", "partialFilterExpression")}
+        await target.create_index(spec["key"], name=name, **options)
+
+
+@asynccontextmanager
+async def staged_collection(db, name: str):
+    """
+    Staging copy of collection `name` (same indexes) for a full replace.
+
+    Fill the yielded collection; on success it atomically replaces the live
+    collection, on error it is dropped and the live data is untouched.
+    """
+    staging = await db.create_collection(f"{name}_staging_{uuid4().hex[:8]}")
+    await _copy_indexes(db[name], staging)
+    try:
+        yield staging
+    except Exception:
+        await staging.drop()
+        raise
+    await staging.rename(name, dropTarget=True)
@@ -0,0 +1,44 @@
+"""
+Catalog attributes snapshotted onto order lines.
+
+Sales reports attribute revenue by category and brand and compute margin from
+cost. Copying those attributes onto each line when the order is placed keeps
+historical reports stable when products are recategorised or repriced, and
+saves reports a product lookup per line.
+"""
+from typing import Any, Dict, List
+
+LINE_SNAPSHOT_FIELDS = ("category_id", "category_name", "brand", "cost")
+
+
+async def line_attributes(db, product_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Category, brand and cost of each product as they are now, for snapshotting onto order lines"""
+    product_ids = [pid for pid in dict.fromkeys(product_ids) if pid]
+    if not product_ids:
+        return {}
+    products = await db.products.find(
+        {"id": {"$in": product_ids}}, {"_id": 0, "id": 1, "category_id": 1, "brand": 1, "cost_price": 1}
+    ).to_list(None)
+    category_ids = list({p["category_id"] for p in products if p.get("category_id")})
+    names = {}
+    if category_ids:
+        categories = await db.categories.find(
+            {"id": {"$in": category_ids}}, {"_id": 0, "id": 1, "name": 1}
+        ).to_list(None)
+        names = {c["id"]: c.get("name") for c in categories}
+    return {
+        p["id"]: {
+            "category_id": p.get("category_id"),
+            "category_name": names.get(p.get("category_id")),
+            "brand": p.get("brand"),
+            "cost": p.get("cost_price")
+        } for p in products
+    }
+
+
+async def snapshot_line_attributes(db, items: List[Dict[str, Any]]) -> None:
+    """Copy category/brand/cost onto order lines so reports do not depend on later catalog edits"""
+    attributes = await line_attributes(db, [item.get("product_id") for item in items])
+    empty = dict.fromkeys(LINE_SNAPSHOT_FIELDS)
+    for item in items:
+        item.update(attributes.get(item.get("product_id"), empty))
@@ -0,0 +1,251 @@
+"""
+Columnar (Parquet / Arrow IPC) exports for analytics consumers.
+
+Orders, order lines, products and customers are written with typed columns in
+record batches straight from a cursor, so BI jobs load them without re-parsing
+CSV. Exports are incremental: rows changed after the `since` watermark and up
+to the export's own watermark (returned to the caller) are included, and the
+next run passes that watermark back as `since`. Rows can appear in two
+consecutive deltas, so consumers upsert by id (order lines by order_id).
+
+The watermark trails the clock by COLUMNAR_WATERMARK_LAG_SECONDS. Exports read
+from secondaries, and a write stamps updated_at before it commits and replicates;
+a watermark of "now" would skip such rows for good once the next delta starts
+after it. Rows newer than the watermark simply arrive in the next delta.
+
+Stock writes (orders, POS sales and returns, purchase receipts) move a product's
+updated_at, so stock levels in the products delta stay current. Cart holds
+(`reserved`) do not, and are deliberately not a products column.
+"""
+from datetime import datetime, timezone, timedelta
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+import logging
+import os
+
+from core.exports import iter_cursor
+from core.rollups import as_datetime
+
+logger = logging.getLogger(__name__)
+
+PYARROW_AVAILABLE = False
+pa = None
+pq = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    logger.warning("pyarrow package not installed. Parquet/Arrow exports disabled.")
+
+# Rows per record batch (and Parquet row group)
+COLUMNAR_BATCH_ROWS = int(os.environ.get('COLUMNAR_BATCH_ROWS', '10000'))
+# How far the export watermark trails the clock; must exceed replication lag plus the longest in-flight write
+COLUMNAR_WATERMARK_LAG_SECONDS = int(os.environ.get('COLUMNAR_WATERMARK_LAG_SECONDS', '300'))
+
+COLUMNAR_MEDIA_TYPES = {
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+
+def _string(value: Any) -> Optional[str]:
+    return None if value is None else str(value)
+
+
+def _float(value: Any) -> Optional[float]:
+    try:
+        return None if value is None or value == "" else float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _int(value: Any) -> Optional[int]:
+    number = _float(value)
+    return None if number is None else int(number)
+
+
+def _bool(value: Any) -> Optional[bool]:
+    return None if value is None else bool(value)
+
+
+def _strings(value: Any) -> Optional[List[str]]:
+    if value is None:
+        return None
+    return [str(v) for v in value] if isinstance(value, (list, tuple)) else [str(value)]
+
+
+# Column type name: (value converter, Arrow type factory)
+COLUMN_TYPES: Dict[str, Tuple[Callable[[Any], Any], Callable[[], Any]]] = {
+    "string": (_string, lambda: pa.string()),
+    "float": (_float, lambda: pa.float64()),
+    "int": (_int, lambda: pa.int64()),
+    "bool": (_bool, lambda: pa.bool_()),
+    "timestamp": (as_datetime, lambda: pa.timestamp("us", tz="UTC")),
+    "strings": (_strings, lambda: pa.list_(pa.string())),
+}
+
+ORDER_COLUMNS = [
+    ("id", "string"), ("order_number", "string"), ("store_id", "string"),
+    ("customer_id", "string"), ("customer_email", "string"), ("customer_name", "string"),
+    ("status", "string"), ("payment_status", "string"), ("payment_method", "string"), ("channel", "string"),
+    ("subtotal", "float"), ("shipping", "float"), ("tax", "float"), ("discount", "float"), ("total", "float"),
+    ("refund_amount", "float"), ("item_count", "int"), ("unit_count", "int"),
+    ("created_at", "timestamp"), ("updated_at", "timestamp"),
+]
+
+ORDER_LINE_COLUMNS = [
+    ("order_id", "string"), ("line_number", "int"), ("store_id", "string"), ("order_status", "string"),
+    ("product_id", "string"), ("product_name", "string"), ("sku", "string"),
+    ("category_id", "string"), ("category_name", "string"), ("brand", "string"),
+    ("quantity", "int"), ("price", "float"), ("cost", "float"), ("line_total", "float"),
+    ("ordered_at", "timestamp"), ("updated_at", "timestamp"),
+]
+
+PRODUCT_COLUMNS = [
+    ("id", "string"), ("store_id", "string"), ("sku", "string"), ("name", "string"),
+    ("brand", "string"), ("category_id", "string"), ("category_ids", "strings"), ("tags", "strings"),
+    ("price", "float"), ("compare_price", "float"), ("cost_price", "float"),
+    ("stock", "int"), ("is_active", "bool"), ("track_inventory", "bool"),
+    ("created_at", "timestamp"), ("updated_at", "timestamp"),
+]
+
+CUSTOMER_COLUMNS = [
+    ("id", "string"), ("store_id", "string"), ("email", "string"), ("name", "string"), ("phone", "string"),
+    ("country", "string"), ("status", "string"),
+    ("total_orders", "int"), ("total_spent", "float"), ("refunded_amount", "float"), ("average_order_value", "float"),
+    ("first_order_at", "timestamp"), ("last_order_at", "timestamp"),
+    ("created_at", "timestamp"), ("updated_at", "timestamp"),
+]
+
+
+def _order_row(order: dict) -> Iterable[dict]:
+    items = order.get("items") or []
+    yield {
+        **order,
+        "channel": order.get("channel") or ("pos" if order.get("source") == "pos" else "online"),
+        "shipping": order.get("shipping", order.get("shipping_cost")),
+        "item_count": len(items),
+        "unit_count": sum(_int(item.get("quantity")) or 0 for item in items)
+    }
+
+
+def _order_lines(order: dict) -> Iterable[dict]:
+    for number, item in enumerate(order.get("items") or [], start=1):
+        quantity = _int(item.get("quantity")) or 0
+        price = _float(item.get("price")) or 0
+        yield {
+            **item,
+            "order_id": order.get("id"),
+            "line_number": number,
+            "store_id": order.get("store_id"),
+            "order_status": order.get("status"),
+            "line_total": round(quantity * price, 2),
+            "ordered_at": order.get("created_at"),
+            "updated_at": order.get("updated_at")
+        }
+
+
+def _document(doc: dict) -> Iterable[dict]:
+    yield doc
+
+
+# name: (collection, columns, rows per document)
+DATASETS: Dict[str, Tuple[str, List[Tuple[str, str]], Callable[[dict], Iterable[dict]]]] = {
+    "orders": ("orders", ORDER_COLUMNS, _order_row),
+    "order_lines": ("orders", ORDER_LINE_COLUMNS, _order_lines),
+    "products": ("products", PRODUCT_COLUMNS, _document),
+    "customers": ("customers", CUSTOMER_COLUMNS, _document),
+}
+
+
+def export_watermark(now: Optional[datetime] = None) -> datetime:
+    """Upper bound of a delta: rows updated up to this point have replicated to the export secondaries"""
+    return (now or datetime.now(timezone.utc)) - timedelta(seconds=COLUMNAR_WATERMARK_LAG_SECONDS)
+
+
+def watermark_query(since: Optional[datetime], until: datetime, store_id: Optional[str] = None) -> dict:
+    """
+    Documents updated in (since, until], or every document for a full export without `since`.
+
+    updated_at is stored as a date or an ISO string, so both forms are matched.
+    """
+    def window(convert):
+        bounds = {"$lte": convert(until)}
+        if since:
+            bounds["$gt"] = convert(since)
+        return {"updated_at": bounds}
+
+    query = {"$or": [window(lambda d: d), window(lambda d: d.isoformat())]} if since else {}
+    if store_id:
+        query["store_id"] = store_id
+    return query
+
+
+def arrow_schema(columns: List[Tuple[str, str]]):
+    return pa.schema([(name, COLUMN_TYPES[kind][1]()) for name, kind in columns])
+
+
+def _record_batch(columns: List[Tuple[str, str]], rows: List[dict], schema):
+    arrays = []
+    for name, kind in columns:
+        convert = COLUMN_TYPES[kind][0]
+        arrays.append(pa.array([convert(row.get(name)) for row in rows], type=schema.field(name).type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+class _ByteSink:
+    """Write-only file object whose bytes are drained after each batch"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        self._buffer += data
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def writable(self) -> bool:
+        return True
+
+    def take(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+async def columnar_chunks(db, dataset: str, format: str = "parquet", since: Optional[datetime] = None,
+                          until: Optional[datetime] = None, store_id: Optional[str] = None) -> AsyncIterator[bytes]:
+    """Encode a dataset as Parquet or an Arrow IPC stream, yielding bytes after every record batch"""
+    collection, columns, rows_of = DATASETS[dataset]
+    schema = arrow_schema(columns)
+    sink = _ByteSink()
+    out = pa.PythonFile(sink, mode="w")
+    if format == "parquet":
+        writer = pq.ParquetWriter(out, schema, compression="zstd")
+    else:
+        writer = pa.ipc.new_stream(out, schema)
+
+    cursor = db[collection].find(watermark_query(since, until, store_id), {"_id": 0})
+    rows: List[dict] = []
+    async for doc in iter_cursor(cursor):
+        rows.extend(rows_of(doc))
+        if len(rows) >= COLUMNAR_BATCH_ROWS:
+            writer.write_batch(_record_batch(columns, rows, schema))
+            rows = []
+            yield sink.take()
+    if rows:
+        writer.write_batch(_record_batch(columns, rows, schema))
+    writer.close()
+    yield sink.take()
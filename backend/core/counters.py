@@ -0,0 +1,89 @@
+"""
+Atomic per-store sequence counters (order, transaction, quote, return and PO numbers).
+
+Each (store_id, name) pair owns one document in the `counters` collection whose
+`value` is advanced with a single findOneAndUpdate/$inc, so allocating a number is
+O(1) and collision-free across workers. Workers may optionally reserve a block of
+numbers at a time to take the counter document off the hot path; unused numbers in
+a block are skipped if the worker restarts.
+"""
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+import asyncio
+import os
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+# Numbers reserved per round-trip; 1 keeps numbering strictly gap-free
+DEFAULT_BLOCK_SIZE = int(os.environ.get('SEQUENCE_BLOCK_SIZE', '1'))
+
+# Per-worker reserved ranges: (db name, store_id, name) -> [next value, last value]
+_blocks: Dict[Tuple[str, str, str], list] = {}
+_locks: Dict[Tuple[str, str, str], asyncio.Lock] = {}
+
+
+def _counter_id(store_id: str, name: str) -> str:
+    return f"{store_id}:{name}"
+
+
+async def _reserve(db, store_id: str, name: str, count: int,
+                   seed: Optional[Callable[[], Awaitable[int]]]) -> int:
+    """Atomically reserve `count` numbers and return the first one"""
+    counter_id = _counter_id(store_id, name)
+    update = {
+        "$inc": {"value": count},
+        "$set": {"updated_at": datetime.now(timezone.utc)}
+    }
+    doc = await db.counters.find_one_and_update(
+        {"_id": counter_id}, update, return_document=ReturnDocument.AFTER
+    )
+    if doc is None:
+        # First use of this sequence - start after any numbers issued before counters existed
+        initial = await seed() if seed else 0
+        try:
+            await db.counters.insert_one({
+                "_id": counter_id,
+                "store_id": store_id,
+                "name": name,
+                "value": initial,
+                "created_at": datetime.now(timezone.utc)
+            })
+        except DuplicateKeyError:
+            pass  # Another worker seeded it first
+        doc = await db.counters.find_one_and_update(
+            {"_id": counter_id}, update, return_document=ReturnDocument.AFTER
+        )
+    return doc["value"] - count + 1
+
+
+async def next_sequence(
+    db,
+    store_id: str,
+    name: str,
+    seed: Optional[Callable[[], Awaitable[int]]] = None,
+    block_size: Optional[int] = None
+) -> int:
+    """
+    Return the next number (1-based) of the `name` sequence for a store.
+
+    `seed` is awaited once, when the counter document is first created, and should
+    return the last number already in use. With `block_size` > 1 the worker reserves
+    that many numbers per database round-trip and hands them out locally.
+    """
+    block_size = max(1, block_size or DEFAULT_BLOCK_SIZE)
+    if block_size == 1:
+        return await _reserve(db, store_id, name, 1, seed)
+
+    key = (db.name, store_id, name)
+    lock = _locks.setdefault(key, asyncio.Lock())
+    async with lock:
+        block = _blocks.get(key)
+        if not block or block[0] > block[1]:
+            first = await _reserve(db, store_id, name, block_size, seed)
+            block = [first, first + block_size - 1]
+            _blocks[key] = block
+        value = block[0]
+        block[0] += 1
+        return value
+
@@ -0,0 +1,154 @@
+"""
+Materialized per-customer lifetime stats.
+
+Customer documents carry total_orders, total_spent, refunded_amount,
+first_order_at, last_order_at and average_order_value. They are kept current by
+single-document pipeline updates when orders are placed, cancelled, refunded or
+returned, so top-customer and segment reports read customers through an index
+instead of scanning orders.
+
+Customers are matched the same way orders create them: by email, within the
+order's store. Orders from before stores existed count for the customer with
+that email only when a single store has one. Cancelled and refunded orders do not count
+towards orders/spend; refunded amounts are tracked separately.
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+import logging
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import PyMongoError
+
+from core.database import store_scope
+from core.rollups import EXCLUDED_STATUSES, as_datetime, refunded_amount
+
+logger = logging.getLogger(__name__)
+
+GUEST_EMAILS = ("pos@store.local",)
+
+
+def customer_query(email: str, store_id: Optional[str] = None) -> dict:
+    query = {"email": email}
+    if store_id:
+        query.update(store_scope(store_id))
+    return query
+
+
+def order_stats(order: dict) -> Tuple[int, float, float]:
+    """(orders, spent, refunded) one order contributes to its customer's lifetime stats"""
+    counted = order.get("status") not in EXCLUDED_STATUSES
+    return (1 if counted else 0), ((order.get("total") or 0) if counted else 0), refunded_amount(order)
+
+
+def stats_pipeline(
+    orders: int = 0,
+    spent: float = 0,
+    refunded: float = 0,
+    ordered_at: Optional[datetime] = None,
+    on_insert: Optional[Dict[str, Any]] = None
+) -> List[dict]:
+    """
+    Update pipeline applying a delta to a customer's lifetime stats.
+
+    With `on_insert` the pipeline also works as an upsert: a new customer starts
+    from those fields. Average order value is derived in the same atomic update.
+    """
+    pipeline = []
+    if on_insert:
+        # Every customer has an id, so a missing one means the upsert is inserting
+        exists = {"$ifNull": ["$id", False]}
+        pipeline.append({"$set": {
+            field: {"$cond": [exists, f"${field}", {"$literal": value}]} for field, value in on_insert.items()
+        }})
+    stats = {
+        "total_orders": {"$add": [{"$ifNull": ["$total_orders", 0]}, orders]},
+        "total_spent": {"$add": [{"$ifNull": ["$total_spent", 0]}, spent]},
+        "refunded_amount": {"$add": [{"$ifNull": ["$refunded_amount", 0]}, refunded]},
+        "updated_at": {"$literal": datetime.now(timezone.utc)}
+    }
+    if ordered_at:
+        stats["first_order_at"] = {"$min": ["$first_order_at", {"$literal": ordered_at}]}
+        stats["last_order_at"] = {"$max": ["$last_order_at", {"$literal": ordered_at}]}
+    pipeline.append({"$set": stats})
+    pipeline.append({"$set": {"average_order_value": {"$cond": [
+        {"$gt": ["$total_orders", 0]},
+        {"$round": [{"$divide": ["$total_spent", "$total_orders"]}, 2]},
+        0
+    ]}}})
+    return pipeline
+
+
+def customer_upsert(customer: Dict[str, Any], order: Dict[str, Any], store_id: Optional[str] = None) -> Tuple[dict, list]:
+    """Build the (filter, pipeline) pair that adds an order to an existing customer or inserts a new one"""
+    on_insert = {
+        k: v for k, v in customer.items()
+        if k not in ("email", "store_id", "total_orders", "total_spent", "updated_at")
+    }
+    if store_id:
+        on_insert["store_id"] = store_id  # The default store's filter does not set it on insert
+    orders, spent, refunded = order_stats(order)
+    return customer_query(customer["email"], store_id), stats_pipeline(
+        orders, spent, refunded, as_datetime(order.get("created_at")), on_insert
+    )
+
+
+async def customer_stores(db, emails: List[str]) -> Dict[str, Set[Optional[str]]]:
+    """Stores that have a customer with each email (None for customers from before stores existed)"""
+    stores: Dict[str, Set[Optional[str]]] = {}
+    async for customer in db.customers.find({"email": {"$in": emails}}, {"_id": 0, "email": 1, "store_id": 1}):
+        stores.setdefault(customer["email"], set()).add(customer.get("store_id") or None)
+    return stores
+
+
+async def _stats_customer(db, order: dict) -> Optional[dict]:
+    """
+    Filter for the customer an order's stats belong to, or None if they go to nobody.
+
+    Legacy orders without a store are credited to the customer with that email only
+    when exactly one store has one, the same rule the backfill applies.
+    """
+    email = order.get("customer_email")
+    if not email or email in GUEST_EMAILS:
+        return None
+    if order.get("store_id"):
+        return customer_query(email, order["store_id"])
+    stores = (await customer_stores(db, [email])).get(email, set())
+    return customer_query(email, stores.pop()) if len(stores) == 1 else None
+
+
+async def record_customer_change(db, before: Optional[dict] = None, after: Optional[dict] = None):
+    """
+    Move an order's contribution to customer stats from `before` to `after` (existing customers only).
+
+    When the change moves the order to another customer (email or store edited), its
+    stats leave the old customer and are added to the new one. The old customer's
+    first/last order dates are left as they are; a backfill recomputes them.
+    """
+    order = after or before
+    try:
+        old_customer = await _stats_customer(db, before) if before else None
+        new_customer = await _stats_customer(db, after) if after else None
+        updates = []
+        if old_customer is not None and old_customer == new_customer:
+            delta = [n - o for n, o in zip(order_stats(after), order_stats(before))]
+            if any(delta):
+                updates.append((new_customer, stats_pipeline(*delta)))
+        else:
+            if old_customer is not None and any(order_stats(before)):
+                updates.append((old_customer, stats_pipeline(*[-v for v in order_stats(before)])))
+            if new_customer is not None:
+                updates.append((new_customer, stats_pipeline(
+                    *order_stats(after), ordered_at=as_datetime(after.get("created_at"))
+                )))
+        for query, pipeline in updates:
+            await db.customers.update_one(query, pipeline)
+    except PyMongoError as e:
+        logger.error(f"Customer stats update failed for order {order.get('id')}: {e}")
+
+
+async def ensure_customer_stats_indexes(db):
+    """Top-N and recency queries over customers, per store and across stores"""
+    for field in ("total_spent", "total_orders", "last_order_at"):
+        await db.customers.create_index([("store_id", ASCENDING), (field, DESCENDING)])
+        await db.customers.create_index([(field, DESCENDING)])
+    await db.customers.create_index([("email", ASCENDING), ("store_id", ASCENDING)])
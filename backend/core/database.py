@@ -1,7 +1,19 @@
 """
 Database connection and shared dependencies for the application.
+
+Workloads get their own connection pools so long-running reports and exports
+cannot take connections or primary capacity from storefront requests:
+
+- ``oltp``: storefront, checkout and admin CRUD; reads and writes on the primary.
+- ``analytics``: dashboards and reports; prefers secondaries, short time budget.
+- ``export``: bulk exports; prefers secondaries, small pool, long time budget.
+
+Each role is configured through ``DB_<ROLE>_POOL_SIZE``, ``DB_<ROLE>_READ_PREFERENCE``
+and ``DB_<ROLE>_TIMEOUT_MS`` (0 disables the budget). Writes always go to the
+primary whatever the read preference.
 """
 from motor.motor_asyncio import AsyncIOMotorClient
+from typing import Dict
 import os
 from pathlib import Path
 from dotenv import load_dotenv
@@ -11,8 +23,61 @@ load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+DB_NAME = os.environ['DB_NAME']
+
+# Default store ID for backward compatibility (Tools In A Box)
+DEFAULT_STORE_ID = "675b5810-f110-42f0-9cac-00cf353f04a5"
+
+
+def store_scope(store_id: str) -> dict:
+    """Filter on a store; documents from before stores existed have no store_id and belong to the default store"""
+    if store_id == DEFAULT_STORE_ID:
+        return {"store_id": {"$in": [store_id, None]}}
+    return {"store_id": store_id}
+
+# role: (max pool size, read preference, time budget in ms)
+POOL_DEFAULTS = {
+    "oltp": (100, "primary", 0),
+    "analytics": (10, "secondaryPreferred", 30000),
+    "export": (5, "secondaryPreferred", 0),
+}
+
+_clients: Dict[str, AsyncIOMotorClient] = {}
+
+
+def get_client(role: str = "oltp") -> AsyncIOMotorClient:
+    """Client (and connection pool) for a workload role, created on first use"""
+    if role not in POOL_DEFAULTS:
+        raise ValueError(f"Unknown database role: {role}")
+    if role not in _clients:
+        pool_size, read_preference, timeout_ms = POOL_DEFAULTS[role]
+        prefix = f"DB_{role.upper()}_"
+        options = {
+            "maxPoolSize": int(os.environ.get(prefix + "POOL_SIZE", pool_size)),
+            "readPreference": os.environ.get(prefix + "READ_PREFERENCE", read_preference),
+            "appname": f"celora-{role}",
+        }
+        timeout_ms = int(os.environ.get(prefix + "TIMEOUT_MS", timeout_ms))
+        if timeout_ms:
+            # Client-side operation timeout; the server is sent the remaining budget as maxTimeMS
+            options["timeoutMS"] = timeout_ms
+        _clients[role] = AsyncIOMotorClient(mongo_url, **options)
+    return _clients[role]
+
+
+def get_db(role: str = "oltp"):
+    return get_client(role)[DB_NAME]
+
+
+def close_clients():
+    for role in list(_clients):
+        _clients.pop(role).close()
+
+
+client = get_client("oltp")
+db = get_db("oltp")
+analytics_db = get_db("analytics")
+export_db = get_db("export")
 
 # Directory paths
 UPLOADS_DIR = ROOT_DIR / "uploads"
@@ -0,0 +1,291 @@
+"""
+Background export jobs.
+
+Large exports run outside the request: a job is queued in the `export_jobs`
+collection, a worker streams the report into a gzip file under EXPORTS_DIR and
+records progress on the job as it goes, and the finished file is served with
+HTTP Range support so interrupted downloads can resume. The admin UI polls the
+job instead of holding a connection open for the whole export.
+
+Each claim of a job gets a new `attempt` id. Progress and completion updates only
+apply while the job still carries the worker's attempt, and every attempt writes
+its own partial file, so a worker whose stalled job was requeued stops at its
+next chunk without touching the new worker's output.
+"""
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Optional
+from uuid import uuid4
+import asyncio
+import gzip
+import logging
+import os
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+
+from core.exports import EXPORT_MEDIA_TYPES, iter_cursor
+from core.export_reports import EXPORT_REPORTS, report_chunks, report_cursor, report_query
+
+logger = logging.getLogger(__name__)
+
+EXPORTS_DIR = Path(os.environ.get('EXPORTS_DIR', Path(__file__).parent.parent / "exports"))
+# Exports running at once per process; further jobs wait in the queue
+EXPORT_JOB_WORKERS = int(os.environ.get('EXPORT_JOB_WORKERS', '2'))
+EXPORT_RETENTION_HOURS = int(os.environ.get('EXPORT_RETENTION_HOURS', '24'))
+# A running job not updated for this long is assumed dead and requeued
+EXPORT_STALL_MINUTES = 10
+# How often stalled jobs are requeued and expired files removed
+EXPORT_SWEEP_MINUTES = int(os.environ.get('EXPORT_SWEEP_MINUTES', '5'))
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+
+ACTIVE_STATUSES = ("queued", "running")
+
+_slots = asyncio.Semaphore(EXPORT_JOB_WORKERS)
+# Keep references to running jobs so they are not garbage collected
+_tasks = set()
+# Jobs with a task in this process; the sweeper never requeues these
+_active_ids = set()
+
+
+def export_path(job: dict) -> Path:
+    return EXPORTS_DIR / f"{job['id']}.{job['format']}.gz"
+
+
+def public_job(job: dict) -> dict:
+    return {k: v for k, v in job.items() if k != "_id"}
+
+
+def _start(db, source_db, job_id: str):
+    if job_id in _active_ids:
+        return
+    task = asyncio.create_task(run_export_job(db, source_db, job_id))
+    _tasks.add(task)
+    _active_ids.add(job_id)
+    task.add_done_callback(_tasks.discard)
+    task.add_done_callback(lambda _: _active_ids.discard(job_id))
+
+
+async def create_export_job(
+    db,
+    source_db,
+    report: str,
+    format: str = "csv",
+    params: Optional[Dict[str, Any]] = None,
+    store_id: Optional[str] = None
+) -> dict:
+    """Queue an export of `report` and start it as soon as a worker slot is free"""
+    if report not in EXPORT_REPORTS:
+        raise HTTPException(status_code=400, detail=f"Unknown export: {report}")
+    if format not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unsupported export format: {format}")
+
+    now = datetime.now(timezone.utc)
+    job = {
+        "id": str(uuid4()),
+        "report": report,
+        "format": format,
+        "params": params or {},
+        "store_id": store_id,
+        "status": "queued",
+        "total": None,
+        "processed": 0,
+        "progress": 0,
+        "file_name": f"{report}_export_{now.strftime('%Y%m%d_%H%M%S')}.{format}.gz",
+        "size": None,
+        "error": None,
+        "created_at": now,
+        "updated_at": now,
+        "started_at": None,
+        "completed_at": None,
+        "expires_at": None
+    }
+    await db.export_jobs.insert_one(job)
+    _start(db, source_db, job["id"])
+    return public_job(job)
+
+
+async def _counted(docs: AsyncIterator[dict], counter: Dict[str, int]) -> AsyncIterator[dict]:
+    async for doc in docs:
+        counter["processed"] += 1
+        yield doc
+
+
+async def run_export_job(db, source_db, job_id: str):
+    """Write the job's report to a gzip file, recording progress after every chunk"""
+    async with _slots:
+        now = datetime.now(timezone.utc)
+        attempt = str(uuid4())
+        job = await db.export_jobs.find_one_and_update(
+            {"id": job_id, "status": "queued"},
+            {"$set": {"status": "running", "attempt": attempt, "started_at": now, "updated_at": now}},
+            return_document=ReturnDocument.AFTER
+        )
+        if not job:
+            return  # Cancelled, or claimed by another worker
+        claim = {"id": job_id, "status": "running", "attempt": attempt}
+
+        EXPORTS_DIR.mkdir(parents=True, exist_ok=True)
+        path = export_path(job)
+        partial = path.with_name(f"{path.name}.{attempt}.part")
+        report, params, store_id = job["report"], job["params"], job.get("store_id")
+        counter = {"processed": 0}
+        try:
+            collection = source_db[EXPORT_REPORTS[report]["collection"]]
+            total = await collection.count_documents(report_query(report, params, store_id))
+            await db.export_jobs.update_one(claim, {"$set": {"total": total}})
+
+            docs = _counted(iter_cursor(report_cursor(source_db, report, params, store_id)), counter)
+            cancelled = False
+            with gzip.open(partial, "wb") as out:
+                async for chunk in report_chunks(report, docs, job["format"]):
+                    await asyncio.to_thread(out.write, chunk)
+                    cancelled = not await db.export_jobs.find_one_and_update(
+                        claim,
+                        {"$set": {
+                            "processed": counter["processed"],
+                            "progress": round(counter["processed"] / total * 100, 1) if total else 0,
+                            "updated_at": datetime.now(timezone.utc)
+                        }}
+                    )
+                    if cancelled:
+                        break
+            if cancelled:
+                partial.unlink(missing_ok=True)  # Cancelled, or requeued and now another attempt's
+                return
+
+            now = datetime.now(timezone.utc)
+            completed = await db.export_jobs.update_one(claim, {"$set": {
+                "status": "completed",
+                "processed": counter["processed"],
+                "progress": 100,
+                "size": partial.stat().st_size,
+                "updated_at": now,
+                "completed_at": now,
+                "expires_at": now + timedelta(hours=EXPORT_RETENTION_HOURS)
+            }})
+            if not completed.matched_count:
+                partial.unlink(missing_ok=True)
+                return
+            os.replace(partial, path)
+        except Exception as e:
+            # Any error (including a bad row in a report) fails the job; left running it would be retried forever
+            logger.exception(f"Export job {job_id} failed: {e}")
+            partial.unlink(missing_ok=True)
+            await db.export_jobs.update_one({"id": job_id, "attempt": attempt}, {"$set": {
+                "status": "failed", "error": str(e), "updated_at": datetime.now(timezone.utc)
+            }})
+
+
+async def cancel_export_job(db, job_id: str) -> Optional[dict]:
+    """Stop an active job, or delete a finished job and its file"""
+    job = await db.export_jobs.find_one_and_update(
+        {"id": job_id, "status": {"$in": list(ACTIVE_STATUSES)}},
+        {"$set": {"status": "cancelled", "updated_at": datetime.now(timezone.utc)}},
+        return_document=ReturnDocument.AFTER
+    )
+    if job:
+        return public_job(job)
+    job = await db.export_jobs.find_one_and_delete({"id": job_id})
+    if job:
+        export_path(job).unlink(missing_ok=True)
+        return {**public_job(job), "status": "deleted"}
+    return None
+
+
+async def resume_export_jobs(db, source_db):
+    """Restart queued and stalled jobs (e.g. after a restart) and remove expired export files"""
+    now = datetime.now(timezone.utc)
+    stalled = now - timedelta(minutes=EXPORT_STALL_MINUTES)
+    try:
+        await db.export_jobs.update_many(
+            {"status": "running", "updated_at": {"$lt": stalled}, "id": {"$nin": list(_active_ids)}},
+            {"$set": {"status": "queued", "attempt": None, "processed": 0, "progress": 0, "updated_at": now}}
+        )
+        async for job in db.export_jobs.find({"status": "queued"}, {"_id": 0, "id": 1}):
+            _start(db, source_db, job["id"])
+
+        async for job in db.export_jobs.find({"status": "completed", "expires_at": {"$lt": now}}, {"_id": 0}):
+            export_path(job).unlink(missing_ok=True)
+            await db.export_jobs.update_one({"id": job["id"]}, {"$set": {"status": "expired", "updated_at": now}})
+    except PyMongoError as e:
+        logger.error(f"Resuming export jobs failed: {e}")
+
+
+async def run_export_job_sweeper(db, source_db, interval_minutes: int = EXPORT_SWEEP_MINUTES):
+    """Background loop doing what startup does: requeue stalled jobs, start queued ones, expire old files"""
+    while True:
+        await asyncio.sleep(interval_minutes * 60)
+        try:
+            await resume_export_jobs(db, source_db)
+        except Exception as e:
+            logger.exception(f"Export job sweep failed: {e}")
+
+
+async def ensure_export_job_indexes(db):
+    await db.export_jobs.create_index("id", unique=True)
+    await db.export_jobs.create_index([("status", 1), ("updated_at", 1)])
+    await db.export_jobs.create_index([("created_at", -1)])
+
+
+def _parse_range(range_header: str, size: int) -> Optional[tuple]:
+    """(start, end) of a single `bytes=` range, None to serve the whole file; 416 if unsatisfiable"""
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None  # Multiple ranges are not supported; send everything
+    first, _, last = spec.strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        else:
+            start, end = max(size - int(last), 0), size - 1  # Suffix range: the last N bytes
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+
+def _read_file(path: Path, start: int, length: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(DOWNLOAD_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def download_export(job: dict, range_header: Optional[str] = None, if_range: Optional[str] = None) -> StreamingResponse:
+    """Serve a finished export, honouring `Range` (and `If-Range`) for resumable downloads"""
+    if job["status"] != "completed":
+        raise HTTPException(status_code=409, detail=f"Export is {job['status']}")
+    path = export_path(job)
+    if not path.exists():
+        raise HTTPException(status_code=410, detail="Export file is no longer available")
+
+    size = path.stat().st_size
+    etag = f'"{job["id"]}-{size}"'
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Content-Disposition": f"attachment; filename={job['file_name']}"
+    }
+    byte_range = None
+    if range_header and (not if_range or if_range == etag):
+        byte_range = _parse_range(range_header, size)
+
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(_read_file(path, 0, size), media_type="application/gzip", headers=headers)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        _read_file(path, start, end - start + 1), status_code=206, media_type="application/gzip", headers=headers
+    )
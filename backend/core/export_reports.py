@@ -0,0 +1,154 @@
+"""
+Row layouts of the standard exports.
+
+Shared by the streamed download endpoints and background export jobs, so a
+report has the same columns whichever way it is fetched. Reports without a
+`header` export whole documents (CSV columns are the first document's fields).
+"""
+from datetime import datetime, timezone, timedelta
+from typing import Any, Dict, List, Optional
+
+from core.exports import export_cell, export_chunks, export_response, iter_cursor
+
+
+def _period_start(period: str) -> datetime:
+    days = int(period.replace("d", "")) if period.endswith("d") and period[:-1].isdigit() else 30
+    return datetime.now(timezone.utc) - timedelta(days=days)
+
+
+ORDER_HEADER = ["Order Number", "Customer", "Email", "Total", "Status", "Payment Status", "Date"]
+
+
+def order_row(order: dict) -> List[Any]:
+    return [
+        order.get("order_number", ""),
+        order.get("customer_name", ""),
+        order.get("customer_email", ""),
+        order.get("total", 0),
+        order.get("status", ""),
+        order.get("payment_status", ""),
+        export_cell(order.get("created_at", ""))
+    ]
+
+
+def sales_query(period: str = "30d") -> dict:
+    return {
+        "created_at": {"$gte": _period_start(period).isoformat()},
+        "status": {"$nin": ["cancelled", "refunded"]}
+    }
+
+
+SALES_HEADER = ["Order ID", "Date", "Customer", "Email", "Items", "Subtotal", "Shipping", "Tax", "Total", "Status", "Channel"]
+
+
+def sales_row(order: dict) -> List[Any]:
+    return [
+        order.get("order_number", order.get("id")),
+        str(export_cell(order.get("created_at")))[:10],
+        order.get("customer_name", ""),
+        order.get("customer_email", ""),
+        len(order.get("items", [])),
+        order.get("subtotal", 0),
+        order.get("shipping_cost", 0),
+        order.get("tax", 0),
+        order.get("total", 0),
+        order.get("status", ""),
+        order.get("channel", "online")
+    ]
+
+
+def customer_report_fields(customer: dict) -> dict:
+    # Order data comes from the maintained lifetime stats
+    last_order = customer.get("last_order_at")
+    customer["order_count"] = customer.get("total_orders", 0)
+    customer["total_spent"] = customer.get("total_spent", 0)
+    customer["last_order"] = last_order.isoformat() if isinstance(last_order, datetime) else (last_order or "")
+    return customer
+
+
+CUSTOMER_HEADER = ["Customer ID", "Name", "Email", "Phone", "Orders", "Total Spent", "Last Order", "Created At"]
+
+
+def customer_row(customer: dict) -> List[Any]:
+    customer = customer_report_fields(customer)
+    return [
+        customer.get("id"),
+        customer.get("name", ""),
+        customer.get("email", ""),
+        customer.get("phone", ""),
+        customer.get("order_count", 0),
+        round(customer.get("total_spent", 0), 2),
+        customer.get("last_order", "")[:10] if customer.get("last_order") else "",
+        str(export_cell(customer.get("created_at")))[:10]
+    ]
+
+
+INVENTORY_HEADER = ["SKU", "Name", "Category", "Stock", "Cost", "Price", "Stock Value", "Status"]
+
+
+def inventory_row(product: dict) -> List[Any]:
+    stock = product.get("stock", 0)
+    cost = product.get("cost", product.get("price", 0))
+    status = "In Stock" if stock > 10 else "Low Stock" if stock > 0 else "Out of Stock"
+    return [
+        product.get("sku", ""),
+        product.get("name", ""),
+        product.get("category", ""),
+        stock,
+        cost,
+        product.get("price", 0),
+        round(stock * cost, 2),
+        status
+    ]
+
+
+# name: collection, query(params), sort, CSV header/row, NDJSON document
+EXPORT_REPORTS: Dict[str, Dict[str, Any]] = {
+    "products": {"collection": "products"},
+    "orders": {
+        "collection": "orders", "sort": [("created_at", -1)],
+        "header": ORDER_HEADER, "row": order_row
+    },
+    "customers": {
+        "collection": "customers",
+        "header": CUSTOMER_HEADER, "row": customer_row, "document": customer_report_fields
+    },
+    "sales": {
+        "collection": "orders", "query": lambda params: sales_query(params.get("period", "30d")),
+        "sort": [("created_at", -1)], "header": SALES_HEADER, "row": sales_row
+    },
+    "inventory": {
+        "collection": "products",
+        "header": INVENTORY_HEADER, "row": inventory_row
+    },
+}
+
+
+def report_query(name: str, params: Optional[Dict[str, Any]] = None, store_id: Optional[str] = None) -> dict:
+    params = params or {}
+    build = EXPORT_REPORTS[name].get("query")
+    query = build(params) if build else {}
+    if store_id:
+        query["store_id"] = store_id
+    return query
+
+
+def report_cursor(db, name: str, params: Optional[Dict[str, Any]] = None, store_id: Optional[str] = None):
+    report = EXPORT_REPORTS[name]
+    cursor = db[report["collection"]].find(report_query(name, params, store_id), {"_id": 0})
+    if report.get("sort"):
+        cursor = cursor.sort(report["sort"])
+    return cursor
+
+
+def report_chunks(name: str, docs, format: str = "csv"):
+    """CSV/NDJSON chunks of a report's documents"""
+    report = EXPORT_REPORTS[name]
+    return export_chunks(docs, format, report.get("header"), report.get("row"), report.get("document"))
+
+
+def stream_report(db, name: str, filename: str, format: str = "csv",
+                  params: Optional[Dict[str, Any]] = None, store_id: Optional[str] = None):
+    """Streamed CSV/NDJSON download of a report"""
+    chunks = report_chunks(name, iter_cursor(report_cursor(db, name, params, store_id)), format)
+    return export_response(chunks, f"{filename}.{format}", format)
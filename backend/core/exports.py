@@ -0,0 +1,138 @@
+"""
+Streaming export engine.
+
+Exports iterate a Motor cursor in batches and yield encoded CSV or NDJSON
+chunks through a StreamingResponse, so memory stays flat whatever the row count
+and the first bytes go out as soon as the first batch arrives.
+"""
+from datetime import datetime
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Iterable, List, Optional
+import csv
+import io
+import json
+import os
+
+from fastapi.responses import StreamingResponse
+
+# Documents per cursor round-trip, and rows per chunk written to the response
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', '1000'))
+
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def export_cell(value: Any) -> Any:
+    """Flatten a document value for a CSV cell"""
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, list):
+        return ", ".join(str(v) for v in value)
+    if isinstance(value, dict):
+        return json.dumps(value, default=str)
+    return value
+
+
+async def iter_cursor(cursor, batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[dict]:
+    """Documents of a Motor cursor, fetched `batch_size` at a time"""
+    async for doc in cursor.batch_size(batch_size):
+        yield doc
+
+
+async def csv_chunks(header: Optional[List[str]], rows: AsyncIterable[Iterable[Any]],
+                     chunk_rows: int = EXPORT_BATCH_SIZE) -> AsyncIterator[bytes]:
+    """Encode rows as CSV, yielding one chunk per `chunk_rows` rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(header)
+    pending = 0
+    async for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= chunk_rows:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+async def ndjson_chunks(docs: AsyncIterable[dict], chunk_rows: int = EXPORT_BATCH_SIZE) -> AsyncIterator[bytes]:
+    """Encode documents as newline-delimited JSON, yielding one chunk per `chunk_rows` documents"""
+    lines = []
+    async for doc in docs:
+        lines.append(json.dumps(doc, default=str))
+        if len(lines) >= chunk_rows:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+            lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+async def _mapped(docs: AsyncIterable[dict], transform: Callable[[dict], Any]) -> AsyncIterator[Any]:
+    async for doc in docs:
+        yield transform(doc)
+
+
+def export_response(chunks: AsyncIterable[bytes], filename: str, format: str = "csv") -> StreamingResponse:
+    return StreamingResponse(
+        chunks,
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+
+def export_chunks(
+    docs: AsyncIterable[dict],
+    format: str = "csv",
+    header: Optional[List[str]] = None,
+    row: Optional[Callable[[dict], Iterable[Any]]] = None,
+    document: Optional[Callable[[dict], dict]] = None
+) -> AsyncIterator[bytes]:
+    """
+    Encode documents as CSV or NDJSON chunks.
+
+    CSV rows come from `row(doc)` under `header`; without a `row` whole documents
+    are written, with the first document's fields as columns. NDJSON lines are
+    `document(doc)` (the document itself by default).
+    """
+    if format not in EXPORT_MEDIA_TYPES:
+        raise ValueError(f"Unsupported export format: {format}")
+    if format == "ndjson":
+        return ndjson_chunks(_mapped(docs, document) if document else docs)
+    if row is None:
+        return csv_chunks(None, dict_rows(docs))
+    return csv_chunks(header, _mapped(docs, row))
+
+
+async def dict_rows(docs: AsyncIterable[dict]) -> AsyncIterator[List[Any]]:
+    """Header row taken from the first document's keys, then each document's values in that order"""
+    fields = None
+    async for doc in docs:
+        if fields is None:
+            fields = list(doc.keys())
+            yield fields
+        yield [export_cell(doc.get(field)) for field in fields]
+
+
+def stream_export(
+    cursor,
+    filename: str,
+    format: str = "csv",
+    header: Optional[List[str]] = None,
+    row: Optional[Callable[[dict], Iterable[Any]]] = None,
+    document: Optional[Callable[[dict], dict]] = None
+) -> StreamingResponse:
+    """Stream a cursor as a CSV or NDJSON download (see export_chunks); `filename` is given without extension"""
+    chunks = export_chunks(iter_cursor(cursor), format, header, row, document)
+    return export_response(chunks, f"{filename}.{format}", format)
+
+
+def stream_documents(cursor, filename: str, format: str = "csv") -> StreamingResponse:
+    """Stream whole documents; CSV columns are the fields of the first document"""
+    return stream_export(cursor, filename, format)
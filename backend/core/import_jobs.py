@@ -0,0 +1,292 @@
+"""
+Background import jobs.
+
+An uploaded CSV is saved under IMPORTS_DIR and queued in the `import_jobs`
+collection; a worker reads it row by row and writes it in bulk batches. After
+every batch the job records its counts, new row errors and a checkpoint (the
+byte offset and row number reached), all in one update. A job that dies with
+its process is requeued (on startup and by a periodic sweep) and continues from
+its checkpoint instead of from the first row. Cancelling a job stops it at the
+next checkpoint.
+
+Each claim of a job gets a new `attempt` id and checkpoints only save while the
+job still carries it, so a worker whose stalled job was requeued stops at its
+next batch instead of racing the worker that resumed it.
+"""
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+from typing import Any, Awaitable, BinaryIO, Callable, Dict, List, Optional
+from uuid import uuid4
+import asyncio
+import csv
+import logging
+import os
+import shutil
+
+from fastapi import HTTPException, UploadFile
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+
+from core.product_import import IMPORT_ERROR_DETAILS
+
+logger = logging.getLogger(__name__)
+
+IMPORTS_DIR = Path(os.environ.get('IMPORTS_DIR', Path(__file__).parent.parent / "imports"))
+# Imports running at once per process; further jobs wait in the queue
+IMPORT_JOB_WORKERS = int(os.environ.get('IMPORT_JOB_WORKERS', '1'))
+# A running job not updated for this long is assumed dead and requeued
+IMPORT_STALL_MINUTES = 10
+# How often stalled jobs are requeued
+IMPORT_SWEEP_MINUTES = int(os.environ.get('IMPORT_SWEEP_MINUTES', '5'))
+
+ACTIVE_STATUSES = ("queued", "running")
+
+# Importer factories by job kind, registered by the routes that own the column mapping.
+# A factory gets (db, job) and returns an importer with add_row/flush and its counts.
+IMPORT_HANDLERS: Dict[str, Callable[[Any, dict], Awaitable[Any]]] = {}
+
+_slots = asyncio.Semaphore(IMPORT_JOB_WORKERS)
+# Keep references to running jobs so they are not garbage collected
+_tasks = set()
+# Jobs with a task in this process; the sweeper never requeues these
+_active_ids = set()
+
+
+def register_import_handler(kind: str, factory: Callable[[Any, dict], Awaitable[Any]]):
+    IMPORT_HANDLERS[kind] = factory
+
+
+def import_path(job: dict) -> Path:
+    return IMPORTS_DIR / f"{job['id']}.csv"
+
+
+def public_job(job: dict) -> dict:
+    return {k: v for k, v in job.items() if k != "_id"}
+
+
+class _Lines:
+    """Decoded lines of a binary file for csv.reader, tracking the byte offset consumed"""
+
+    def __init__(self, f: BinaryIO):
+        self.f = f
+        self.offset = f.tell()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        line = self.f.readline()
+        if not line:
+            raise StopIteration
+        # The csv module pulls one line at a time, so after each record the
+        # offset is exactly where the next record starts
+        self.offset += len(line)
+        return line.decode("utf-8-sig" if self.offset == len(line) else "utf-8")
+
+
+def _stage_upload(file: UploadFile, path: Path) -> dict:
+    """Copy the upload to disk; returns its size, header and where the data rows start"""
+    file.file.seek(0)
+    with open(path, "wb") as out:
+        shutil.copyfileobj(file.file, out)
+    with open(path, "rb") as f:
+        lines = _Lines(f)
+        columns = next(csv.reader(lines), None)
+        return {"size": path.stat().st_size, "columns": columns, "offset": lines.offset}
+
+
+def _start(db, job_id: str):
+    if job_id in _active_ids:
+        return
+    task = asyncio.create_task(run_import_job(db, job_id))
+    _tasks.add(task)
+    _active_ids.add(job_id)
+    task.add_done_callback(_tasks.discard)
+    task.add_done_callback(lambda _: _active_ids.discard(job_id))
+
+
+async def create_import_job(
+    db,
+    kind: str,
+    file: UploadFile,
+    options: Optional[Dict[str, Any]] = None,
+    store_id: Optional[str] = None
+) -> dict:
+    """Save the upload and queue its import; it starts as soon as a worker slot is free"""
+    if kind not in IMPORT_HANDLERS:
+        raise HTTPException(status_code=400, detail=f"Unknown import: {kind}")
+
+    job_id = str(uuid4())
+    IMPORTS_DIR.mkdir(parents=True, exist_ok=True)
+    path = import_path({"id": job_id})
+    try:
+        staged = await asyncio.to_thread(_stage_upload, file, path)
+    except (UnicodeDecodeError, csv.Error) as e:
+        path.unlink(missing_ok=True)
+        raise HTTPException(status_code=400, detail=f"Error parsing CSV: {str(e)}")
+    if not staged["columns"]:
+        path.unlink(missing_ok=True)
+        raise HTTPException(status_code=400, detail="CSV file is empty")
+
+    now = datetime.now(timezone.utc)
+    job = {
+        "id": job_id,
+        "kind": kind,
+        "file_name": file.filename,
+        "options": options or {},
+        "store_id": store_id,
+        "columns": staged["columns"],
+        "size": staged["size"],
+        "status": "queued",
+        "processed": 0,
+        "created": 0,
+        "updated": 0,
+        "errors": 0,
+        "error_details": [],
+        "progress": 0,
+        "checkpoint": {"offset": staged["offset"], "row": 1},
+        "error": None,
+        "created_at": now,
+        "updated_at": now,
+        "started_at": None,
+        "completed_at": None
+    }
+    await db.import_jobs.insert_one(job)
+    _start(db, job_id)
+    return public_job(job)
+
+
+async def _save_checkpoint(db, job: dict, importer, offset: int, row: int, new_errors: List[dict]) -> bool:
+    """Record counts, new row errors and the checkpoint (`row` is the last row written); False if cancelled"""
+    return bool(await db.import_jobs.find_one_and_update(
+        {"id": job["id"], "status": "running", "attempt": job["attempt"]},
+        {
+            "$set": {
+                "processed": row - 1,
+                "created": importer.created,
+                "updated": importer.updated,
+                "errors": importer.error_count,
+                "progress": round(offset / job["size"] * 100, 1) if job["size"] else 0,
+                "checkpoint": {"offset": offset, "row": row},
+                "updated_at": datetime.now(timezone.utc)
+            },
+            "$push": {"error_details": {"$each": new_errors, "$slice": IMPORT_ERROR_DETAILS}}
+        }
+    ))
+
+
+async def _cancelled(db, job_id: str) -> bool:
+    """Whether a job this worker lost was cancelled; a requeued job still needs its file"""
+    return bool(await db.import_jobs.count_documents({"id": job_id, "status": "cancelled"}))
+
+
+async def run_import_job(db, job_id: str):
+    """Import the job's staged file from its checkpoint, saving a new checkpoint after every batch"""
+    async with _slots:
+        now = datetime.now(timezone.utc)
+        job = await db.import_jobs.find_one_and_update(
+            {"id": job_id, "status": "queued"},
+            {"$set": {"status": "running", "attempt": str(uuid4()), "updated_at": now}},
+            return_document=ReturnDocument.AFTER
+        )
+        if not job:
+            return  # Cancelled, or claimed by another worker
+        if not job.get("started_at"):
+            await db.import_jobs.update_one({"id": job_id}, {"$set": {"started_at": now}})
+
+        path = import_path(job)
+        skip_errors = job["options"].get("skip_errors", True)
+        checkpoint = job["checkpoint"]
+        try:
+            importer = await IMPORT_HANDLERS[job["kind"]](db, job)
+            importer.created, importer.updated, importer.error_count = job["created"], job["updated"], job["errors"]
+
+            failed = None
+            with open(path, "rb") as f:
+                f.seek(checkpoint["offset"])
+                lines = _Lines(f)
+                row_num = checkpoint["row"]
+                for row_num, row in enumerate(csv.DictReader(lines, fieldnames=job["columns"]), start=checkpoint["row"] + 1):
+                    batches = importer.batches
+                    if not await importer.add_row(row_num, row) and not skip_errors:
+                        failed = importer.errors[-1]
+                        break
+                    if importer.batches != batches:
+                        # The batch ended with this row; everything up to it is written
+                        new_errors, importer.errors = importer.errors, []
+                        if not await _save_checkpoint(db, job, importer, lines.offset, row_num, new_errors):
+                            logger.info(f"Import job {job_id} stopped at row {row_num}")
+                            if await _cancelled(db, job_id):
+                                path.unlink(missing_ok=True)
+                            return
+                await importer.flush()
+                await _save_checkpoint(db, job, importer, lines.offset, row_num, importer.errors)
+
+            now = datetime.now(timezone.utc)
+            result = {"updated_at": now, "completed_at": now}
+            if failed:
+                result.update(status="failed", error=f"Error at row {failed['row']}: {failed['error']}")
+            else:
+                result.update(status="completed", progress=100)
+            finished = await db.import_jobs.update_one(
+                {"id": job_id, "status": "running", "attempt": job["attempt"]}, {"$set": result}
+            )
+            if finished.matched_count or await _cancelled(db, job_id):
+                path.unlink(missing_ok=True)
+        except Exception as e:
+            # Any error (including one raised by an importer) fails the job; left running it would be retried forever
+            logger.exception(f"Import job {job_id} failed: {e}")
+            marked = await db.import_jobs.update_one({"id": job_id, "attempt": job["attempt"]}, {"$set": {
+                "status": "failed", "error": str(e), "updated_at": datetime.now(timezone.utc)
+            }})
+            # A requeued job's file belongs to the worker that resumed it
+            if marked.matched_count or await _cancelled(db, job_id):
+                path.unlink(missing_ok=True)
+
+
+async def cancel_import_job(db, job_id: str) -> Optional[dict]:
+    """Stop an active job (rows already written stay imported), or delete a finished job"""
+    job = await db.import_jobs.find_one_and_update(
+        {"id": job_id, "status": {"$in": list(ACTIVE_STATUSES)}},
+        {"$set": {"status": "cancelled", "updated_at": datetime.now(timezone.utc)}}
+    )
+    if job:
+        if job["status"] == "queued":
+            import_path(job).unlink(missing_ok=True)  # A running job removes its file when it stops
+        return {**public_job(job), "status": "cancelled"}
+    job = await db.import_jobs.find_one_and_delete({"id": job_id})
+    if job:
+        import_path(job).unlink(missing_ok=True)
+        return {**public_job(job), "status": "deleted"}
+    return None
+
+
+async def resume_import_jobs(db):
+    """Restart queued jobs and stalled ones (e.g. after a crash), continuing from their checkpoints"""
+    now = datetime.now(timezone.utc)
+    stalled = now - timedelta(minutes=IMPORT_STALL_MINUTES)
+    try:
+        await db.import_jobs.update_many(
+            {"status": "running", "updated_at": {"$lt": stalled}, "id": {"$nin": list(_active_ids)}},
+            {"$set": {"status": "queued", "attempt": None, "updated_at": now}}
+        )
+        async for job in db.import_jobs.find({"status": "queued"}, {"_id": 0, "id": 1}):
+            _start(db, job["id"])
+    except PyMongoError as e:
+        logger.error(f"Resuming import jobs failed: {e}")
+
+
+async def run_import_job_sweeper(db, interval_minutes: int = IMPORT_SWEEP_MINUTES):
+    """Background loop requeueing stalled jobs and starting queued ones, as startup does"""
+    while True:
+        await asyncio.sleep(interval_minutes * 60)
+        try:
+            await resume_import_jobs(db)
+        except Exception as e:
+            logger.exception(f"Import job sweep failed: {e}")
+
+
+async def ensure_import_job_indexes(db):
+    await db.import_jobs.create_index("id", unique=True)
+    await db.import_jobs.create_index([("status", 1), ("updated_at", 1)])
+    await db.import_jobs.create_index([("created_at", -1)])
@@ -0,0 +1,242 @@
+"""
+Stock reservation ledger.
+
+Carts hold stock for a limited time so concurrent buyers cannot oversell a SKU.
+Each hold is one document in `stock_reservations` keyed by (cart_id, product_id),
+and the sum of a product's active holds is mirrored in its `reserved` counter so
+availability is a single-document read: available = stock - reserved.
+
+A hold's `reserved` field is the part of it already added to the product's counter.
+It is raised only after the counter's $inc succeeded and lowered before the counter
+is, and releases give back exactly that much; a crash between the two writes can
+leave the counter too high (underselling until stock is recounted) but never too low.
+
+Holds are taken with a conditional $inc on the product (free stock must cover the
+request), refreshed when checkout starts, claimed by the order pipeline and
+released by a background sweeper once they expire.
+"""
+from datetime import datetime, timezone, timedelta
+from typing import Dict, List, Optional
+import asyncio
+import logging
+import os
+
+from fastapi import HTTPException
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+CART_HOLD_MINUTES = int(os.environ.get('CART_HOLD_MINUTES', '15'))
+CHECKOUT_HOLD_MINUTES = int(os.environ.get('CHECKOUT_HOLD_MINUTES', '10'))
+SWEEP_INTERVAL_SECONDS = int(os.environ.get('RESERVATION_SWEEP_SECONDS', '30'))
+SWEEP_BATCH_SIZE = 500
+
+
+def free_stock_expr(quantity: int) -> dict:
+    """$expr that is true when stock not held by other carts covers `quantity`"""
+    return {"$gte": [
+        {"$subtract": [{"$ifNull": ["$stock", 0]}, {"$ifNull": ["$reserved", 0]}]},
+        quantity
+    ]}
+
+
+def reservable_filter(product_id: str, quantity: int, store_id: Optional[str] = None) -> dict:
+    """Match a product only if `quantity` more units can be held (untracked and backorder always can)"""
+    query = {
+        "id": product_id,
+        "$or": [
+            {"$expr": free_stock_expr(quantity)},
+            {"track_inventory": False},
+            {"allow_backorder": True}
+        ]
+    }
+    if store_id:
+        query["store_id"] = store_id
+    return query
+
+
+def held_units(hold: dict) -> int:
+    """Units of a hold counted in its product's `reserved` (holds from before the field: all of them)"""
+    return max(hold.get("reserved", hold.get("quantity", 0)), 0)
+
+
+def available_stock(product: dict) -> int:
+    """Units that can still be added to a cart"""
+    return (product.get("stock") or 0) - (product.get("reserved") or 0)
+
+
+async def ensure_inventory_indexes(db):
+    await db.stock_reservations.create_index(
+        [("cart_id", ASCENDING), ("product_id", ASCENDING)], unique=True
+    )
+    await db.stock_reservations.create_index([("expires_at", ASCENDING)])
+
+
+async def _not_enough_stock(db, product_id: str) -> HTTPException:
+    product = await db.products.find_one({"id": product_id}, {"_id": 0, "stock": 1, "reserved": 1})
+    available = max(0, available_stock(product)) if product else 0
+    return HTTPException(
+        status_code=409,
+        detail={"message": "Not enough stock available", "product_id": product_id, "available": available}
+    )
+
+
+async def hold_stock(
+    db,
+    cart_id: str,
+    product_id: str,
+    quantity: int,
+    store_id: Optional[str] = None,
+    absolute: bool = False
+) -> int:
+    """
+    Hold stock for a cart line and return the cart's held quantity afterwards.
+
+    By default `quantity` is added to the existing hold (add-to-cart); with
+    `absolute=True` the hold is set to `quantity` (quantity updates). Raises a 409
+    HTTPException with the available quantity if the product cannot cover it.
+    """
+    if quantity < 0 or (quantity == 0 and not absolute):
+        raise HTTPException(status_code=400, detail="Quantity must be positive")
+    expires_at = datetime.now(timezone.utc) + timedelta(minutes=CART_HOLD_MINUTES)
+    key = {"cart_id": cart_id, "product_id": product_id}
+
+    on_insert = {"created_at": datetime.now(timezone.utc), "reserved": 0}
+
+    if not absolute:
+        # The hold exists before the counter moves; its `reserved` only follows once the counter has
+        hold = await db.stock_reservations.find_one_and_update(
+            key,
+            {"$inc": {"quantity": quantity}, "$set": {"expires_at": expires_at}, "$setOnInsert": on_insert},
+            upsert=True, return_document=ReturnDocument.AFTER
+        )
+        await _reserve(db, key, product_id, quantity, store_id)
+        return hold["quantity"]
+
+    before = await db.stock_reservations.find_one_and_update(
+        key,
+        {"$set": {"quantity": quantity, "expires_at": expires_at}, "$setOnInsert": on_insert},
+        upsert=True, return_document=ReturnDocument.BEFORE
+    )
+    delta = quantity - (before["quantity"] if before else 0)
+    if delta > 0:
+        await _reserve(db, key, product_id, delta, store_id)
+    elif delta < 0:
+        # Only what the hold has in the counter, and no more than it no longer needs, is given back
+        release = min(held_units(before), -delta)
+        if release:
+            await db.stock_reservations.update_one(key, {"$inc": {"reserved": -release}})
+            await db.products.update_one({"id": product_id}, {"$inc": {"reserved": -release}})
+    return quantity
+
+
+async def _reserve(db, key: dict, product_id: str, quantity: int, store_id: Optional[str]):
+    """Add `quantity` units already on the hold to the product's counter, or take them off the hold (409)"""
+    result = await db.products.update_one(
+        reservable_filter(product_id, quantity, store_id), {"$inc": {"reserved": quantity}}
+    )
+    if result.matched_count == 0:
+        await db.stock_reservations.update_one(key, {"$inc": {"quantity": -quantity}})
+        await db.stock_reservations.delete_one({**key, "quantity": {"$lte": 0}})
+        raise await _not_enough_stock(db, product_id)
+    await db.stock_reservations.update_one(key, {"$inc": {"reserved": quantity}})
+
+
+async def unhold_stock(db, cart_id: str, product_id: str, quantity: int) -> int:
+    """
+    Give back up to `quantity` units held for a cart line, e.g. when the cart write
+    they were held for did not happen. Unlike a hold this is unconditional, so it
+    works even when the product is oversold. Returns the units given back.
+    """
+    key = {"cart_id": cart_id, "product_id": product_id}
+    before = await db.stock_reservations.find_one_and_update(key, {"$inc": {"quantity": -quantity}})
+    if not before:
+        return 0  # Already released (expired or claimed)
+    released = min(quantity, held_units(before))
+    if released:
+        await db.stock_reservations.update_one(key, {"$inc": {"reserved": -released}})
+    await db.stock_reservations.delete_one({**key, "quantity": {"$lte": 0}})
+    if released:
+        await db.products.update_one({"id": product_id}, {"$inc": {"reserved": -released}})
+    return released
+
+
+async def release_holds(db, cart_id: str, product_ids: Optional[List[str]] = None) -> int:
+    """Release a cart's holds (all of them, or only for `product_ids`); returns units released"""
+    query = {"cart_id": cart_id}
+    if product_ids is not None:
+        query["product_id"] = {"$in": product_ids}
+    holds = await db.stock_reservations.find(query, {"_id": 1}).to_list(None)
+    released = await asyncio.gather(*[_release(db, {"_id": h["_id"]}) for h in holds])
+    return sum(released)
+
+
+async def _release(db, query: dict) -> int:
+    """Delete one hold and give its units back; a hold is only ever released once"""
+    hold = await db.stock_reservations.find_one_and_delete(query)
+    units = held_units(hold) if hold else 0
+    if units:
+        await db.products.update_one({"id": hold["product_id"]}, {"$inc": {"reserved": -units}})
+    return units
+
+
+async def extend_holds(db, cart_id: str, minutes: int = CHECKOUT_HOLD_MINUTES) -> int:
+    """Refresh a cart's holds when checkout starts so they outlive payment"""
+    expires_at = datetime.now(timezone.utc) + timedelta(minutes=minutes)
+    result = await db.stock_reservations.update_many(
+        {"cart_id": cart_id, "expires_at": {"$lt": expires_at}}, {"$set": {"expires_at": expires_at}}
+    )
+    return result.modified_count
+
+
+async def claim_holds(db, cart_id: str, product_ids: List[str], session=None) -> Dict[str, int]:
+    """
+    Take ownership of a cart's holds for the given products (at order placement).
+
+    Claimed holds are deleted; the caller is responsible for decrementing each
+    product's `reserved` counter by the returned quantity (the units the hold had
+    in the counter).
+    """
+    if session is not None:
+        holds = await db.stock_reservations.find(
+            {"cart_id": cart_id, "product_id": {"$in": product_ids}}, session=session
+        ).to_list(None)
+        if holds:
+            await db.stock_reservations.delete_many(
+                {"_id": {"$in": [h["_id"] for h in holds]}}, session=session
+            )
+    else:
+        holds = await asyncio.gather(*[
+            db.stock_reservations.find_one_and_delete({"cart_id": cart_id, "product_id": pid})
+            for pid in product_ids
+        ])
+    return {h["product_id"]: held_units(h) for h in holds if h and held_units(h) > 0}
+
+
+async def release_expired_holds(db) -> int:
+    """Release every hold whose time is up; returns the number of holds released"""
+    now = datetime.now(timezone.utc)
+    released = 0
+    while True:
+        expired = await db.stock_reservations.find(
+            {"expires_at": {"$lte": now}}, {"_id": 1}
+        ).limit(SWEEP_BATCH_SIZE).to_list(SWEEP_BATCH_SIZE)
+        if not expired:
+            return released
+        await asyncio.gather(*[_release(db, {"_id": h["_id"], "expires_at": {"$lte": now}}) for h in expired])
+        released += len(expired)
+        if len(expired) < SWEEP_BATCH_SIZE:
+            return released
+
+
+async def run_reservation_sweeper(db, interval: int = SWEEP_INTERVAL_SECONDS):
+    """Background loop releasing expired holds"""
+    while True:
+        try:
+            released = await release_expired_holds(db)
+            if released:
+                logger.info(f"Released {released} expired stock reservations")
+        except PyMongoError as e:
+            logger.error(f"Reservation sweep failed: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,29 @@
+"""
+Batched lookups by id.
+
+Collect the ids a response needs and fetch them with one `$in` query instead of
+a find_one per item.
+"""
+from typing import Any, Dict, Iterable, Optional
+
+from core.database import store_scope
+
+
+async def find_by_ids(collection, ids: Iterable, projection: Optional[Dict[str, Any]] = None,
+                      key: str = "id", query: Optional[Dict[str, Any]] = None) -> Dict[Any, Optional[dict]]:
+    """{id: document or None} for every distinct id, from a single `$in` query"""
+    ids = [i for i in dict.fromkeys(ids) if i is not None]
+    if not ids:
+        return {}
+    fields = {"_id": 0, **(projection or {})}
+    if projection and not any(v == 0 for k, v in projection.items() if k != "_id"):
+        fields[key] = 1  # Inclusion projections must keep the key
+    docs = await collection.find({**(query or {}), key: {"$in": ids}}, fields).to_list(None)
+    found = {doc.get(key): doc for doc in docs}
+    return {i: found.get(i) for i in ids}
+
+
+async def products_by_id(db, ids: Iterable, projection: Optional[Dict[str, Any]] = None,
+                         store_id: Optional[str] = None) -> Dict[str, Optional[dict]]:
+    """Products by id, e.g. products_by_id(db, ids, {"name": 1, "price": 1})"""
+    return await find_by_ids(db.products, ids, projection, query=store_scope(store_id) if store_id else None)
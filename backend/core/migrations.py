@@ -0,0 +1,161 @@
+"""
+One-off data migrations.
+
+Each migration runs once per database; completion is recorded in the
+`migrations` collection so restarts and additional workers skip it. Migrations
+must be safe to re-run after a partial failure.
+"""
+from datetime import datetime, timezone, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+import logging
+
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from core.catalog import LINE_SNAPSHOT_FIELDS, line_attributes
+from core.customer_stats import GUEST_EMAILS, customer_query, customer_stores, order_stats
+from core.rollups import as_datetime, rebuild_rollups
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_BATCH_SIZE = 1000
+MIGRATION_STALL_MINUTES = 60
+
+
+async def backfill_order_line_attributes(db) -> int:
+    """Snapshot category/brand/cost onto the lines of orders placed before snapshots existed"""
+    query = {"items": {"$elemMatch": {"category_id": {"$exists": False}}}}
+    cursor = db.orders.find(query, {"_id": 1, "items": 1}).batch_size(MIGRATION_BATCH_SIZE)
+    updated = 0
+    batch = []
+    async for order in cursor:
+        batch.append(order)
+        if len(batch) >= MIGRATION_BATCH_SIZE:
+            updated += await _snapshot_batch(db, batch)
+            batch = []
+    if batch:
+        updated += await _snapshot_batch(db, batch)
+
+    # Category reports read the rollups, so rebuild them from the migrated lines
+    await rebuild_rollups(db)
+    return updated
+
+
+async def _snapshot_batch(db, orders: List[dict]) -> int:
+    attributes = await line_attributes(
+        db, [item.get("product_id") for order in orders for item in (order.get("items") or [])]
+    )
+    empty = dict.fromkeys(LINE_SNAPSHOT_FIELDS)
+    ops = []
+    for order in orders:
+        items = [
+            item if "category_id" in item else {**item, **attributes.get(item.get("product_id"), empty)}
+            for item in order.get("items") or []
+        ]
+        ops.append(UpdateOne({"_id": order["_id"]}, {"$set": {"items": items}}))
+    result = await db.orders.bulk_write(ops, ordered=False)
+    return result.modified_count
+
+
+def _empty_stats() -> dict:
+    return {"total_orders": 0, "total_spent": 0, "refunded_amount": 0, "first_order_at": None, "last_order_at": None}
+
+
+def _merge_stats(into: dict, entry: dict):
+    for field in ("total_orders", "total_spent", "refunded_amount"):
+        into[field] += entry[field]
+    into["first_order_at"] = min(filter(None, [into["first_order_at"], entry["first_order_at"]]), default=None)
+    into["last_order_at"] = max(filter(None, [into["last_order_at"], entry["last_order_at"]]), default=None)
+
+
+async def _assign_storeless_stats(db, stats: Dict[Tuple[Optional[str], str], dict]):
+    """
+    Credit stats of legacy orders without a store to the customer with that email,
+    but only when exactly one store has such a customer; otherwise they are skipped.
+    """
+    storeless = {email: stats.pop((store_id, email)) for store_id, email in list(stats) if store_id is None}
+    emails = list(storeless)
+    stores: Dict[str, set] = {}
+    for i in range(0, len(emails), MIGRATION_BATCH_SIZE):
+        stores.update(await customer_stores(db, emails[i:i + MIGRATION_BATCH_SIZE]))
+
+    ambiguous = 0
+    for email, entry in storeless.items():
+        candidates = stores.get(email, set())
+        if len(candidates) == 1:
+            _merge_stats(stats.setdefault((candidates.pop(), email), _empty_stats()), entry)
+        elif candidates:
+            ambiguous += 1
+    if ambiguous:
+        logger.warning(f"Customer stats: skipped orders without a store for {ambiguous} emails found in several stores")
+
+
+async def backfill_customer_stats(db) -> int:
+    """Recompute every customer's lifetime stats from their orders"""
+    stats: Dict[Tuple[Optional[str], str], dict] = {}
+    cursor = db.orders.find(
+        {"customer_email": {"$nin": [None, *GUEST_EMAILS]}},
+        {"_id": 0, "store_id": 1, "customer_email": 1, "status": 1, "total": 1,
+         "payment_status": 1, "refund_amount": 1, "created_at": 1}
+    ).batch_size(MIGRATION_BATCH_SIZE)
+    async for order in cursor:
+        orders, spent, refunded = order_stats(order)
+        ordered_at = as_datetime(order.get("created_at"))
+        _merge_stats(
+            stats.setdefault((order.get("store_id") or None, order["customer_email"]), _empty_stats()),
+            {"total_orders": orders, "total_spent": spent, "refunded_amount": refunded,
+             "first_order_at": ordered_at, "last_order_at": ordered_at}
+        )
+    await _assign_storeless_stats(db, stats)
+
+    ops = []
+    updated = 0
+    for (store_id, email), entry in stats.items():
+        entry["average_order_value"] = round(entry["total_spent"] / entry["total_orders"], 2) if entry["total_orders"] else 0
+        ops.append(UpdateOne(customer_query(email, store_id), {"$set": entry}))
+        if len(ops) >= MIGRATION_BATCH_SIZE:
+            updated += (await db.customers.bulk_write(ops, ordered=False)).modified_count
+            ops = []
+    if ops:
+        updated += (await db.customers.bulk_write(ops, ordered=False)).modified_count
+    return updated
+
+
+# (name, migration) in the order they must run
+MIGRATIONS: List[Tuple[str, Callable[..., Awaitable[int]]]] = [
+    ("2026-10-order-line-attributes", backfill_order_line_attributes),
+    ("2026-10-customer-lifetime-stats", backfill_customer_stats),
+]
+
+
+async def run_migrations(db):
+    """Run every migration not yet recorded as applied"""
+    for name, migrate in MIGRATIONS:
+        if await db.migrations.find_one({"_id": name, "status": "applied"}):
+            continue
+        try:
+            # Claim the migration so concurrent workers do not run it twice
+            await db.migrations.insert_one({
+                "_id": name, "status": "running", "started_at": datetime.now(timezone.utc)
+            })
+        except DuplicateKeyError:
+            # Retry after a failure, or take over a run whose worker died
+            stalled = datetime.now(timezone.utc) - timedelta(minutes=MIGRATION_STALL_MINUTES)
+            claimed = await db.migrations.find_one_and_update(
+                {"_id": name, "$or": [{"status": "failed"}, {"status": "running", "started_at": {"$lt": stalled}}]},
+                {"$set": {"status": "running", "started_at": datetime.now(timezone.utc)}}
+            )
+            if not claimed:
+                continue  # Running elsewhere
+        try:
+            count = await migrate(db)
+        except Exception as e:
+            # Any failure must release the claim, or retries wait out MIGRATION_STALL_MINUTES
+            logger.exception(f"Migration {name} failed: {e}")
+            await db.migrations.update_one({"_id": name}, {"$set": {"status": "failed", "error": str(e)}})
+            return
+        await db.migrations.update_one(
+            {"_id": name},
+            {"$set": {"status": "applied", "count": count, "applied_at": datetime.now(timezone.utc)}}
+        )
+        logger.info(f"Applied migration {name} ({count} documents)")
@@ -0,0 +1,34 @@
+"""
+Propagation of order changes to derived data.
+
+Anything maintained from orders (sales rollups, customer lifetime stats) is
+updated here when an existing order changes, so endpoints that edit orders only
+need to call `update_order_fields` or `order_changed`.
+"""
+from datetime import datetime, timezone
+from typing import Optional
+
+from pymongo import ReturnDocument
+
+from core.customer_stats import record_customer_change
+from core.rollups import ORDER_ROLLUP_PROJECTION, record_order_change
+
+ORDER_EVENT_PROJECTION = {**ORDER_ROLLUP_PROJECTION, "customer_email": 1}
+
+
+async def order_changed(db, before: Optional[dict] = None, after: Optional[dict] = None):
+    """Apply an order's change (created: only `after`, deleted: only `before`) to derived data"""
+    await record_order_change(db, before, after)
+    await record_customer_change(db, before, after)
+
+
+async def update_order_fields(db, query: dict, fields: dict) -> Optional[dict]:
+    """$set `fields` on one order and propagate the change; returns the order as it was"""
+    # Incremental exports pick changed orders up by updated_at
+    fields = {"updated_at": datetime.now(timezone.utc), **fields}
+    before = await db.orders.find_one_and_update(
+        query, {"$set": fields}, projection=ORDER_EVENT_PROJECTION, return_document=ReturnDocument.BEFORE
+    )
+    if before is not None:
+        await order_changed(db, before, {**before, **fields})
+    return before
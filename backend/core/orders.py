@@ -0,0 +1,241 @@
+"""
+Order placement pipeline shared by checkout, merchant-created orders and quote conversion.
+
+Everything an order touches - conditional stock decrements, the order document, the
+customer upsert and cart cleanup - is written in a fixed number of round-trips
+regardless of cart size. On a replica set the writes run in one multi-document
+transaction; on a standalone server oversold lines are compensated instead.
+
+When the order comes from a cart, the cart's stock holds (see core.inventory) are
+claimed so the held units count towards the line instead of against it. Placed
+orders are added to the sales rollups (see core.rollups).
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import os
+
+from fastapi import HTTPException
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+from core.catalog import snapshot_line_attributes
+from core.customer_stats import customer_upsert
+from core.database import store_scope
+from core.inventory import claim_holds, free_stock_expr, held_units
+from core.rollups import record_order_change
+
+logger = logging.getLogger(__name__)
+
+# "auto" uses transactions when the server is a replica set member, "off" never does
+ORDER_TRANSACTIONS = os.environ.get('ORDER_TRANSACTIONS', 'auto').lower()
+TRANSACTION_RETRIES = 3
+
+_transactions_supported: Optional[bool] = None
+
+
+async def supports_transactions(client) -> bool:
+    """Detect (once per process) whether multi-document transactions are available"""
+    global _transactions_supported
+    if ORDER_TRANSACTIONS == 'off':
+        return False
+    if _transactions_supported is None:
+        try:
+            hello = await client.admin.command('hello')
+            _transactions_supported = bool(hello.get('setName'))
+        except PyMongoError:
+            _transactions_supported = False
+    return _transactions_supported
+
+
+def merge_lines(lines: List[Tuple[str, int]]) -> Dict[str, int]:
+    """Combine cart lines for the same product so each product is decremented once"""
+    merged: Dict[str, int] = {}
+    for product_id, quantity in lines:
+        merged[product_id] = merged.get(product_id, 0) + quantity
+    return merged
+
+
+def stock_decrement_filter(product_id: str, quantity: int, store_id: Optional[str] = None, held: int = 0) -> dict:
+    """
+    Match a product only if it can cover `quantity` (untracked and backorder products always can).
+    Stock held by other carts is not available; `held` units already held by this order are.
+    """
+    query = {
+        "id": product_id,
+        "$or": [
+            {"$expr": free_stock_expr(quantity - held)},
+            {"track_inventory": False},
+            {"allow_backorder": True}
+        ]
+    }
+    if store_id:
+        query.update(store_scope(store_id))
+    return query
+
+
+def stock_restore(product_id: str, quantity: int) -> UpdateOne:
+    """Give back a decrement made for an order that was not placed"""
+    return UpdateOne({"id": product_id}, {
+        "$inc": {"stock": quantity, "sales_count": -quantity},
+        "$set": {"updated_at": datetime.now(timezone.utc)}
+    })
+
+
+def stock_decrement(quantity: int, held: int = 0) -> dict:
+    # updated_at moves with stock so incremental product exports pick up the change
+    update = {"$inc": {"stock": -quantity, "sales_count": quantity}, "$set": {"updated_at": datetime.now(timezone.utc)}}
+    if held:
+        update["$inc"]["reserved"] = -held
+    return update
+
+
+class _Shortfall(Exception):
+    """Raised inside a transaction when a conditional stock decrement did not match"""
+
+
+async def _short_lines(db, quantities: Dict[str, int], store_id: Optional[str], cart_id: Optional[str]) -> List[str]:
+    """Product ids that currently cannot cover their requested quantity"""
+    query = {"id": {"$in": list(quantities)}}
+    if store_id:
+        query.update(store_scope(store_id))
+    products = await db.products.find(
+        query, {"_id": 0, "id": 1, "stock": 1, "reserved": 1, "track_inventory": 1, "allow_backorder": 1}
+    ).to_list(len(quantities))
+    held = {}
+    if cart_id:
+        holds = await db.stock_reservations.find({"cart_id": cart_id}, {"_id": 0}).to_list(None)
+        held = {h["product_id"]: held_units(h) for h in holds}
+    available = {
+        p["id"] for p in products
+        if p.get("track_inventory") is False or p.get("allow_backorder")
+        or (p.get("stock") or 0) - (p.get("reserved") or 0) + held.get(p["id"], 0) >= quantities[p["id"]]
+    }
+    return [pid for pid in quantities if pid not in available]
+
+
+async def _missing_products(db, product_ids: List[str], store_id: Optional[str]) -> set:
+    """Product ids that no longer exist; like before the pipeline, their lines are skipped"""
+    query = {"id": {"$in": product_ids}}
+    if store_id:
+        query.update(store_scope(store_id))
+    found = await db.products.find(query, {"_id": 0, "id": 1}).to_list(len(product_ids))
+    return set(product_ids) - {p["id"] for p in found}
+
+
+def _out_of_stock(product_ids: List[str]) -> HTTPException:
+    return HTTPException(
+        status_code=409,
+        detail={"message": "Insufficient stock for one or more items", "product_ids": product_ids}
+    )
+
+
+async def _place_in_transaction(db, order, quantities, customer_op, store_id, cart_id):
+    async with await db.client.start_session() as session:
+        async with session.start_transaction():
+            held = await claim_holds(db, cart_id, list(quantities), session=session) if cart_id else {}
+            stock_ops = [
+                UpdateOne(
+                    stock_decrement_filter(pid, qty, store_id, held.get(pid, 0)),
+                    stock_decrement(qty, held.get(pid, 0))
+                ) for pid, qty in quantities.items()
+            ]
+            if stock_ops:
+                result = await db.products.bulk_write(stock_ops, ordered=False, session=session)
+                if result.matched_count < len(stock_ops):
+                    raise _Shortfall()  # Aborts the transaction
+            await db.orders.insert_one(order, session=session)
+            if customer_op:
+                await db.customers.update_one(*customer_op, upsert=True, session=session)
+            if cart_id:
+                await db.carts.delete_one({"id": cart_id}, session=session)
+
+
+async def _place_without_transaction(db, order, quantities, customer_op, store_id, cart_id):
+    pids = list(quantities)
+    held = await claim_holds(db, cart_id, pids) if cart_id else {}
+    # Conditional decrements run concurrently so each line's outcome is known exactly
+    results = await asyncio.gather(*[
+        db.products.update_one(
+            stock_decrement_filter(pid, quantities[pid], store_id, held.get(pid, 0)),
+            stock_decrement(quantities[pid], held.get(pid, 0))
+        ) for pid in pids
+    ])
+    failed = [pid for pid, r in zip(pids, results) if r.matched_count == 0]
+    if failed:
+        missing = await _missing_products(db, failed, store_id)
+        failed = [pid for pid in failed if pid not in missing]
+    if failed:
+        # Give back what this order already took before rejecting it; claimed holds are released
+        undo = []
+        for pid, r in zip(pids, results):
+            if r.matched_count:
+                undo.append(stock_restore(pid, quantities[pid]))
+            elif held.get(pid):
+                undo.append(UpdateOne({"id": pid}, {"$inc": {"reserved": -held[pid]}}))
+        if undo:
+            await db.products.bulk_write(undo, ordered=False)
+        raise _out_of_stock(failed)
+
+    try:
+        await db.orders.insert_one(order)
+    except PyMongoError:
+        # Without the order nothing accounts for the decremented stock
+        undo = [stock_restore(pid, quantities[pid]) for pid, r in zip(pids, results) if r.matched_count]
+        if undo:
+            await db.products.bulk_write(undo, ordered=False)
+        raise
+    writes = []
+    if customer_op:
+        writes.append(db.customers.update_one(*customer_op, upsert=True))
+    if cart_id:
+        writes.append(db.carts.delete_one({"id": cart_id}))
+    await asyncio.gather(*writes)
+
+
+async def place_order(
+    db,
+    order: Dict[str, Any],
+    lines: List[Tuple[str, int]],
+    customer: Optional[Dict[str, Any]] = None,
+    store_id: Optional[str] = None,
+    cart_id: Optional[str] = None
+) -> None:
+    """
+    Persist an order and its side effects.
+
+    `lines` are (product_id, quantity) pairs to take from stock, `customer` is the
+    document inserted if no customer with that email exists yet. Order lines get a
+    snapshot of their product's category, brand and cost. With `cart_id` the
+    cart is deleted and its stock holds are converted into the sale. Lines whose
+    product no longer exists are skipped. Raises a 409 HTTPException listing the
+    product ids that could not be fulfilled; in that case nothing is written.
+    """
+    quantities = merge_lines(lines)
+    await snapshot_line_attributes(db, order.get("items", []))
+    customer_op = customer_upsert(customer, order, store_id) if customer else None
+
+    if not await supports_transactions(db.client):
+        await _place_without_transaction(db, order, quantities, customer_op, store_id, cart_id)
+        await record_order_change(db, after=order)
+        return
+
+    for attempt in range(TRANSACTION_RETRIES):
+        try:
+            await _place_in_transaction(db, order, quantities, customer_op, store_id, cart_id)
+            await record_order_change(db, after=order)
+            return
+        except _Shortfall:
+            short = await _short_lines(db, quantities, store_id, cart_id)
+            missing = await _missing_products(db, short, store_id)
+            if len(missing) < len(short) or attempt == TRANSACTION_RETRIES - 1:
+                raise _out_of_stock([pid for pid in short if pid not in missing])
+            # Only deleted products were short: skip their lines and try again
+            quantities = {pid: qty for pid, qty in quantities.items() if pid not in missing}
+            order.pop("_id", None)
+        except PyMongoError as e:
+            if not e.has_error_label('TransientTransactionError') or attempt == TRANSACTION_RETRIES - 1:
+                raise
+            logger.info(f"Retrying order {order.get('order_number')} after transient transaction error")
+            order.pop("_id", None)
@@ -0,0 +1,166 @@
+"""
+Platform-wide KPI snapshot for the admin dashboards.
+
+A background job recomputes store counts, platform totals, the monthly revenue
+trend and the top stores every few minutes and stores them in one document;
+admin endpoints read that document instead of running a dozen counts and
+aggregations per page view.
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+import asyncio
+import logging
+import os
+
+from pymongo.errors import PyMongoError
+
+from core.analytics_engine import ORDER_TIME_EXPR
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_INTERVAL_MINUTES = int(os.environ.get('PLATFORM_SNAPSHOT_MINUTES', '5'))
+SNAPSHOT_ID = "platform_overview"
+# Bump when the snapshot layout changes so stored snapshots are recomputed
+SNAPSHOT_SCHEMA = 2
+TREND_MONTHS = 12
+TOP_STORES = 10
+
+# Monthly plan prices used for the MRR estimate (see PLANS in routes/platform.py)
+PLAN_PRICES = {"starter": 29, "professional": 79, "enterprise": 299}
+
+# created_at is stored as a date or an ISO string; parse both into a date
+ORDER_DATE_EXPR = {"$dateFromString": {
+    "dateString": ORDER_TIME_EXPR, "format": "%Y-%m-%dT%H:%M:%S", "onError": None, "onNull": None
+}}
+
+
+def _month_starts(now: datetime, count: int):
+    """First instant of each of the last `count` calendar months, oldest first"""
+    year, month = now.year, now.month
+    starts = []
+    for _ in range(count):
+        starts.append(datetime(year, month, 1, tzinfo=timezone.utc))
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    return starts[::-1]
+
+
+async def compute_snapshot(db) -> Dict[str, Any]:
+    now = datetime.now(timezone.utc)
+    months = _month_starts(now, TREND_MONTHS)
+
+    stores = (await db.platform_stores.aggregate([{"$facet": {
+        "by_status": [{"$group": {"_id": "$status", "count": {"$sum": 1}}}],
+        "by_plan": [{"$group": {"_id": "$plan_id", "count": {"$sum": 1}}}]
+    }}]).to_list(1))[0]
+    by_status = {s["_id"]: s["count"] for s in stores["by_status"] if s["_id"]}
+    by_plan = {p["_id"]: p["count"] for p in stores["by_plan"] if p["_id"]}
+
+    paid = (await db.orders.aggregate([
+        {"$match": {"payment_status": "paid"}},
+        {"$facet": {
+            "total": [{"$group": {"_id": None, "revenue": {"$sum": "$total"}}}],
+            "monthly": [
+                {"$match": {"$or": [
+                    {"created_at": {"$gte": months[0]}}, {"created_at": {"$gte": months[0].isoformat()}}
+                ]}},
+                {"$group": {
+                    "_id": {"$dateTrunc": {"date": ORDER_DATE_EXPR, "unit": "month"}},
+                    "revenue": {"$sum": "$total"}
+                }}
+            ],
+            "top_stores": [
+                {"$group": {"_id": "$store_id", "revenue": {"$sum": "$total"}, "orders": {"$sum": 1}}},
+                {"$sort": {"revenue": -1}},
+                {"$limit": TOP_STORES},
+                {"$lookup": {"from": "platform_stores", "localField": "_id", "foreignField": "id", "as": "store"}},
+                {"$unwind": "$store"},
+                {"$project": {
+                    "_id": 0, "store_id": "$_id", "revenue": 1, "orders": 1,
+                    "store_name": {"$ifNull": ["$store.store_name", "Unknown"]},
+                    "subdomain": {"$ifNull": ["$store.subdomain", ""]}
+                }}
+            ]
+        }}
+    ], allowDiskUse=True).to_list(1))[0]
+
+    # Legacy merchant websites (the /admin/stats dashboard)
+    websites = (await db.websites.aggregate([{"$group": {
+        "_id": None,
+        "total": {"$sum": 1},
+        "active": {"$sum": {"$cond": [{"$eq": ["$status", "active"]}, 1, 0]}},
+        "total_revenue": {"$sum": "$revenue"},
+        "total_orders": {"$sum": "$orders"},
+        "total_products": {"$sum": "$products"},
+        "total_customers": {"$sum": "$customers"}
+    }}]).to_list(1)) or [{}]
+
+    monthly = {}
+    for m in paid["monthly"]:
+        if m["_id"] is not None:
+            key = m["_id"].replace(tzinfo=timezone.utc) if m["_id"].tzinfo is None else m["_id"]
+            monthly[key.strftime("%Y-%m")] = m["revenue"]
+
+    return {
+        "_id": SNAPSHOT_ID,
+        "schema": SNAPSHOT_SCHEMA,
+        "computed_at": now,
+        "stores": {
+            "total": sum(s["count"] for s in stores["by_status"]),
+            "by_status": by_status,
+            "by_plan": by_plan
+        },
+        "metrics": {
+            "total_products": await db.products.estimated_document_count(),
+            "total_orders": await db.orders.estimated_document_count(),
+            "total_customers": await db.customers.estimated_document_count(),
+            "total_users": await db.platform_owners.estimated_document_count(),
+            "total_accounts": await db.users.estimated_document_count(),
+            "total_revenue": paid["total"][0]["revenue"] if paid["total"] else 0,
+            "mrr": sum(by_plan.get(plan, 0) * price for plan, price in PLAN_PRICES.items())
+        },
+        "websites": {
+            field: websites[0].get(field, 0)
+            for field in ("total", "active", "total_revenue", "total_orders", "total_products", "total_customers")
+        },
+        "monthly_revenue": [
+            {"month": start.strftime("%b"), "revenue": monthly.get(start.strftime("%Y-%m"), 0)}
+            for start in months
+        ],
+        "top_stores": [
+            {k: s[k] for k in ("store_id", "store_name", "subdomain", "revenue", "orders")}
+            for s in paid["top_stores"]
+        ]
+    }
+
+
+async def refresh_platform_snapshot(db) -> Dict[str, Any]:
+    snapshot = await compute_snapshot(db)
+    await db.platform_snapshots.replace_one({"_id": SNAPSHOT_ID}, snapshot, upsert=True)
+    return snapshot
+
+
+async def get_platform_snapshot(db, max_age_minutes: Optional[int] = None) -> Dict[str, Any]:
+    """Latest snapshot; computed on the spot if none exists yet or it is older than `max_age_minutes`"""
+    snapshot = await db.platform_snapshots.find_one({"_id": SNAPSHOT_ID})
+    if snapshot and snapshot.get("schema") != SNAPSHOT_SCHEMA:
+        snapshot = None
+    if snapshot and max_age_minutes is not None:
+        computed_at = snapshot["computed_at"]
+        if computed_at.tzinfo is None:
+            computed_at = computed_at.replace(tzinfo=timezone.utc)
+        if (datetime.now(timezone.utc) - computed_at).total_seconds() > max_age_minutes * 60:
+            snapshot = None
+    if snapshot is None:
+        snapshot = await refresh_platform_snapshot(db)
+    snapshot.pop("_id", None)
+    return snapshot
+
+
+async def run_platform_snapshots(db, interval_minutes: int = SNAPSHOT_INTERVAL_MINUTES):
+    """Background loop keeping the snapshot fresh"""
+    while True:
+        try:
+            await refresh_platform_snapshot(db)
+        except PyMongoError as e:
+            logger.error(f"Platform snapshot failed: {e}")
+        await asyncio.sleep(interval_minutes * 60)
@@ -0,0 +1,122 @@
+"""
+Bulk product CSV import.
+
+Mapped product rows are written a chunk at a time: the SKUs of the chunk that
+already exist are fetched with one `$in` query, every row becomes an upsert
+keyed on (store_id, sku), and the chunk goes out as a single unordered
+`bulk_write`. Writing the same chunk twice leaves the same products, so an
+interrupted import can safely re-run its last chunk.
+"""
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+from uuid import uuid4
+import logging
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from core.bulk_import import IMPORT_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Row errors kept with their data; further errors are only counted
+IMPORT_ERROR_DETAILS = 1000
+
+
+def product_key(sku: str, store_id: Optional[str] = None) -> dict:
+    return {"store_id": store_id, "sku": sku} if store_id else {"sku": sku}
+
+
+class ProductImporter:
+    """Upserts mapped products by SKU in chunks, counting creates, updates and row errors"""
+
+    def __init__(self, db, store_id: Optional[str] = None, update_existing: bool = False,
+                 transform: Optional[Callable[..., dict]] = None, batch_size: int = IMPORT_BATCH_SIZE):
+        self.collection = db.products
+        self.transform = transform  # CSV row → product, called with now=; raises ValueError for a bad row
+        self.store_id = store_id
+        self.update_existing = update_existing
+        self.batch_size = batch_size
+        self.now = datetime.now(timezone.utc).isoformat()
+        self.created = 0
+        self.updated = 0
+        self.batches = 0
+        self.error_count = 0
+        self.errors: List[dict] = []
+        self._chunk: List[Tuple[int, dict, dict]] = []
+
+    def error(self, row_num: int, error: str, data: dict):
+        self.error_count += 1
+        if len(self.errors) < IMPORT_ERROR_DETAILS:
+            self.errors.append({"row": row_num, "error": error, "data": data})
+
+    async def add(self, row_num: int, product: dict, data: dict):
+        """Queue a mapped product (`data` is its CSV row, kept for error reports)"""
+        self._chunk.append((row_num, product, data))
+        if len(self._chunk) >= self.batch_size:
+            await self.flush()
+
+    async def add_row(self, row_num: int, row: Dict[str, str]) -> bool:
+        """Transform and queue a CSV row; False if the row was rejected"""
+        try:
+            product = self.transform(row, now=self.now)
+        except Exception as e:
+            self.error(row_num, str(e), dict(row))
+            return False
+        await self.add(row_num, product, dict(row))
+        return True
+
+    async def _existing_skus(self, skus: List[str]) -> set:
+        query = {"sku": {"$in": skus}}
+        if self.store_id:
+            query["store_id"] = self.store_id
+        return {doc["sku"] async for doc in self.collection.find(query, {"_id": 0, "sku": 1})}
+
+    async def flush(self):
+        if not self._chunk:
+            return
+        chunk, self._chunk = self._chunk, []
+        existing = await self._existing_skus(list({product["sku"] for _, product, _ in chunk}))
+
+        ops, written = [], []
+        for row_num, product, data in chunk:
+            sku = product["sku"]
+            if not product.get("id"):
+                product.pop("id", None)  # Existing products keep their id; new ones get one below
+            if self.store_id:
+                product["store_id"] = self.store_id
+
+            if sku in existing:
+                if not self.update_existing:
+                    continue
+                update = {"$set": product}
+                # Only used if the product was deleted since the prefetch
+                on_insert = {k: v for k, v in (("id", str(uuid4())), ("created_at", self.now)) if k not in product}
+                if on_insert:
+                    update["$setOnInsert"] = on_insert
+                kind = "updated"
+            else:
+                update = {"$setOnInsert": {**product, "id": product.get("id") or str(uuid4()), "created_at": self.now}}
+                kind = "created"
+                existing.add(sku)  # A repeated SKU later in the chunk is an update
+            ops.append(UpdateOne(product_key(sku, self.store_id), update, upsert=True))
+            written.append((row_num, kind, data))
+
+        counts = {"created": sum(1 for _, kind, _ in written if kind == "created")}
+        counts["updated"] = len(written) - counts["created"]
+        if ops:
+            try:
+                await self.collection.bulk_write(ops, ordered=False)
+            except BulkWriteError as e:
+                for err in e.details.get("writeErrors", []):
+                    row_num, kind, data = written[err["index"]]
+                    counts[kind] -= 1
+                    self.error(row_num, err.get("errmsg", "Write failed"), data)
+        self.created += counts["created"]
+        self.updated += counts["updated"]
+        self.batches += 1
+        logger.info(f"Product import: {self.created} created, {self.updated} updated, {self.error_count} errors")
+
+
+async def ensure_product_import_indexes(db):
+    await db.products.create_index([("store_id", 1), ("sku", 1)])
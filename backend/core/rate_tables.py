@@ -0,0 +1,121 @@
+"""
+Compiled shipping rate tables.
+
+A service's `rates` array is compiled once into typed values grouped by zone
+code, with each zone's weight brackets split into segments searched with
+bisect. Looking up a rate returns the same rate as scanning the array in order
+(first active rate of the zone whose weight bracket and length limit fit).
+Active services and options are cached with the zone indexes (see
+core.shipping_cache), so a warm quote reads nothing from the database.
+"""
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+from core.shipping_cache import cached
+
+
+def safe_float(value, default=0.0):
+    """Safely convert value to float, returning default if None or invalid"""
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return default
+
+
+class CompiledRate:
+    """One rate row with its charges converted to numbers"""
+    __slots__ = ("rate", "min_weight", "max_weight", "max_length_mm", "per_parcel_rate", "per_kg_rate", "min_charge")
+
+    def __init__(self, rate: dict):
+        self.rate = rate
+        self.min_weight = safe_float(rate.get("min_weight"), 0)
+        self.max_weight = safe_float(rate.get("max_weight"), 999999)
+        self.max_length_mm = safe_float(rate.get("max_length_mm"))
+        self.per_parcel_rate = (
+            safe_float(rate.get("per_parcel_rate")) or safe_float(rate.get("first_parcel")) or safe_float(rate.get("base_rate"))
+        )
+        self.per_kg_rate = safe_float(rate.get("per_kg_rate"))
+        self.min_charge = safe_float(rate.get("min_charge"))
+
+
+class WeightBrackets:
+    """
+    Rates of one zone indexed by weight.
+
+    Bracket edges split the weight line into alternating slots: slot 2i+1 is
+    exactly edges[i] and slot 2i the open gap below it. Each slot lists the rates
+    covering it in their original order (brackets are inclusive at both ends).
+    """
+
+    def __init__(self, rates: List[CompiledRate]):
+        self.edges = sorted({r.min_weight for r in rates} | {r.max_weight for r in rates})
+        slots = [[] for _ in range(2 * len(self.edges) + 1)]
+        for rate in rates:
+            if rate.min_weight > rate.max_weight:
+                continue
+            first = 2 * bisect_left(self.edges, rate.min_weight) + 1
+            last = 2 * bisect_left(self.edges, rate.max_weight) + 1
+            for slot in range(first, last + 1):
+                slots[slot].append(rate)
+        self.slots = [tuple(rates) for rates in slots]
+
+    def candidates(self, weight: float) -> Tuple[CompiledRate, ...]:
+        i = bisect_left(self.edges, weight)
+        exact = i < len(self.edges) and self.edges[i] == weight
+        return self.slots[2 * i + 1 if exact else 2 * i]
+
+
+class ServiceRates:
+    """A shipping service with its settings converted and its rates compiled per zone code"""
+
+    def __init__(self, service: dict):
+        self.service = service
+        self.categories = set(service.get("categories", []))
+        self.max_length = service.get("max_length")
+        self.cubic_weight_modifier = service.get("cubic_weight_modifier", 250)
+        self.fuel_levy_percent = safe_float(service.get("fuel_levy_percent"))
+        self.fuel_levy_amount = safe_float(service.get("fuel_levy_amount"))
+        self.handling_fee = safe_float(service.get("handling_fee"))
+        self.min_charge = safe_float(service.get("min_charge"))
+        self.max_charge = safe_float(service.get("max_charge"))
+        self.tax_inclusive = bool(service.get("tax_inclusive"))
+        self.tax_rate = safe_float(service.get("tax_rate")) or 10.0  # Default 10% GST for Australia
+
+        by_zone: Dict[str, List[CompiledRate]] = {}
+        for rate in service.get("rates", []):
+            if rate.get("is_active", True):
+                by_zone.setdefault((rate.get("zone_code") or "").upper(), []).append(CompiledRate(rate))
+        self.zones = {code: WeightBrackets(rates) for code, rates in by_zone.items()}
+
+    def find_rate(self, zones: List[dict], weight: float, max_item_length_mm: float) -> Tuple[Optional[CompiledRate], Optional[dict]]:
+        """First rate (and its zone) fitting the weight and item length, trying zones in order"""
+        for zone in zones:
+            brackets = self.zones.get((zone.get("code") or "").upper())
+            if not brackets:
+                continue
+            for rate in brackets.candidates(weight):
+                if rate.max_length_mm > 0 and max_item_length_mm > rate.max_length_mm:
+                    continue
+                return rate, zone
+        return None, None
+
+
+async def active_services(db) -> List[ServiceRates]:
+    """Cached compiled active services, in sort order"""
+    async def build():
+        services = await db.shipping_services.find({"is_active": True}, {"_id": 0}).sort("sort_order", 1).to_list(None)
+        return [ServiceRates(service) for service in services]
+
+    return await cached(db, ("services",), build)
+
+
+async def active_options(db, country: str) -> List[dict]:
+    """Cached active shipping options of a country, in sort order"""
+    async def build():
+        return await db.shipping_options.find(
+            {"is_active": True, "countries": country}, {"_id": 0}
+        ).sort("sort_order", 1).to_list(None)
+
+    return await cached(db, ("options", country), build)
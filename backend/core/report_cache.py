@@ -0,0 +1,48 @@
+"""
+In-process cache for expensive reports.
+
+Reports are keyed by name, store and parameters and rebuilt at most once per
+refresh interval; concurrent requests for a stale report wait for a single
+rebuild instead of each running the aggregation.
+"""
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+import asyncio
+import os
+import time
+
+# Seconds a cached report is served before it is rebuilt
+REPORT_CACHE_SECONDS = int(os.environ.get('ANALYTICS_CACHE_SECONDS', '300'))
+
+_entries: Dict[Hashable, Tuple[float, Any]] = {}
+_locks: Dict[Hashable, asyncio.Lock] = {}
+
+
+async def cached_report(
+    key: Hashable,
+    build: Callable[[], Awaitable[Any]],
+    max_age: Optional[int] = None,
+    refresh: bool = False
+) -> Any:
+    """Return the cached value for `key`, awaiting `build()` if it is missing, stale or `refresh` is set"""
+    max_age = REPORT_CACHE_SECONDS if max_age is None else max_age
+    entry = _entries.get(key)
+    if entry and not refresh and time.monotonic() - entry[0] < max_age:
+        return entry[1]
+
+    requested_at = time.monotonic()
+    lock = _locks.setdefault(key, asyncio.Lock())
+    async with lock:
+        entry = _entries.get(key)
+        # Another request may have rebuilt it while this one waited for the lock
+        if entry and (entry[0] >= requested_at or (not refresh and time.monotonic() - entry[0] < max_age)):
+            return entry[1]
+        value = await build()
+        _entries[key] = (time.monotonic(), value)
+        return value
+
+
+def invalidate_reports(name: Optional[str] = None):
+    """Drop cached reports (all of them, or those whose key starts with `name`)"""
+    for key in list(_entries):
+        if name is None or (isinstance(key, tuple) and key and key[0] == name):
+            _entries.pop(key, None)
@@ -0,0 +1,283 @@
+"""
+Pre-aggregated sales rollups.
+
+Every order contributes to one fact row per (store, UTC day) in `sales_rollups`
+holding revenue, order count, units and refunds, broken down by hour, channel,
+product and category. Rows are maintained incrementally: placing an order adds
+its contribution, and any later change (status, refund, edit, delete) removes the
+old contribution and adds the new one with a single $inc upsert. Analytics reads
+a handful of rows per period instead of scanning orders.
+
+Orders that are cancelled or refunded do not count as sales, matching the
+reports that used to scan the orders collection. Refunds are booked against the
+day the order was placed.
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+import logging
+
+from pymongo import ASCENDING
+from pymongo.errors import PyMongoError
+
+from core.catalog import line_attributes
+from core.database import DEFAULT_STORE_ID, store_scope
+
+logger = logging.getLogger(__name__)
+
+EXCLUDED_STATUSES = ("cancelled", "refunded")
+BACKFILL_BATCH_SIZE = 1000
+
+ORDER_ROLLUP_PROJECTION = {
+    "_id": 0, "id": 1, "store_id": 1, "created_at": 1, "status": 1, "total": 1,
+    "items": 1, "channel": 1, "source": 1, "payment_status": 1, "refund_amount": 1
+}
+
+# Status of the most recent backfill, reported by the analytics API
+backfill_state: Dict[str, Any] = {"status": "idle"}
+
+
+def as_datetime(value) -> Optional[datetime]:
+    """Order timestamps are stored both as datetimes and ISO strings; normalize to aware UTC"""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+def _key(value) -> str:
+    """Make an id safe to use as an embedded field name"""
+    key = str(value).replace(".", "_")
+    return "_" + key[1:] if key.startswith("$") else key
+
+
+def order_channel(order: dict) -> str:
+    return order.get("channel") or ("pos" if order.get("source") == "pos" else "online")
+
+
+def refunded_amount(order: dict) -> float:
+    payment_status = order.get("payment_status")
+    if payment_status == "refunded":
+        return order.get("refund_amount") or order.get("total", 0)
+    if payment_status == "partial_refund":
+        return order.get("refund_amount") or 0
+    return 0
+
+
+def _rollup_id(store_id: str, day: str) -> str:
+    return f"{store_id}:{day}"
+
+
+def _contribution(order: dict, categories: Dict[str, dict], sign: int = 1):
+    """Return (row id, $inc, $set) for one order's share of its day's fact row, or None"""
+    created = as_datetime(order.get("created_at"))
+    if created is None:
+        return None
+    store_id = order.get("store_id") or DEFAULT_STORE_ID
+    day = created.strftime("%Y-%m-%d")
+    inc: Dict[str, float] = {}
+    names: Dict[str, Any] = {"store_id": store_id, "date": day}
+
+    def add(path, amount):
+        inc[path] = inc.get(path, 0) + sign * amount
+
+    refunds = refunded_amount(order)
+    if refunds:
+        add("refunds", refunds)
+
+    if order.get("status") not in EXCLUDED_STATUSES:
+        total = order.get("total", 0) or 0
+        items = order.get("items") or []
+        add("revenue", total)
+        add("orders", 1)
+        add("items", sum(item.get("quantity", 0) for item in items))
+        hour = created.strftime("%H")
+        add(f"hours.{hour}.revenue", total)
+        add(f"hours.{hour}.orders", 1)
+        names[f"hours.{hour}.hour"] = hour
+        channel = _key(order_channel(order))
+        add(f"channels.{channel}.revenue", total)
+        add(f"channels.{channel}.orders", 1)
+        names[f"channels.{channel}.channel"] = order_channel(order)
+
+        touched = set()
+        for item in items:
+            product_id = item.get("product_id")
+            quantity = item.get("quantity", 1)
+            line_revenue = item.get("price", 0) * quantity
+            pkey = _key(product_id)
+            add(f"products.{pkey}.revenue", line_revenue)
+            add(f"products.{pkey}.quantity", quantity)
+            add(f"products.{pkey}.orders", 1)
+            names[f"products.{pkey}.product_id"] = product_id
+            if item.get("product_name") or item.get("name"):
+                names[f"products.{pkey}.name"] = item.get("product_name") or item.get("name")
+            if item.get("sku"):
+                names[f"products.{pkey}.sku"] = item["sku"]
+
+            # Lines carry a category snapshot from order time; older orders fall back to the product
+            category = item if "category_id" in item else categories.get(product_id) or {}
+            category_id = category.get("category_id") or "uncategorized"
+            ckey = _key(category_id)
+            add(f"categories.{ckey}.revenue", line_revenue)
+            add(f"categories.{ckey}.quantity", quantity)
+            if ckey not in touched:
+                add(f"categories.{ckey}.orders", 1)
+                touched.add(ckey)
+            names[f"categories.{ckey}.category_id"] = category_id
+            names[f"categories.{ckey}.category"] = category.get("category_name") or "Uncategorized"
+
+    if not inc:
+        return None
+    return _rollup_id(store_id, day), inc, names
+
+
+async def _categories_for(db, orders: Iterable[dict]) -> Dict[str, dict]:
+    """Current category id/name per product id, for order lines without a category snapshot"""
+    product_ids = [
+        item.get("product_id") for order in orders for item in (order.get("items") or [])
+        if item.get("product_id") and "category_id" not in item
+    ]
+    if not product_ids:
+        return {}
+    return await line_attributes(db, product_ids)
+
+
+def _merge(target: Dict[str, float], inc: Dict[str, float]):
+    for path, amount in inc.items():
+        target[path] = target.get(path, 0) + amount
+
+
+async def record_order_change(db, before: Optional[dict] = None, after: Optional[dict] = None):
+    """
+    Move an order's contribution from `before` to `after`.
+
+    Pass only `after` for a new order and only `before` for a deleted one. Failures
+    are logged rather than raised; a backfill repairs any drift.
+    """
+    try:
+        categories = await _categories_for(db, [o for o in (before, after) if o])
+        updates: Dict[str, list] = {}
+        for order, sign in ((before, -1), (after, 1)):
+            part = _contribution(order, categories, sign) if order else None
+            if part:
+                row_id, inc, names = part
+                row = updates.setdefault(row_id, [{}, {}])
+                _merge(row[0], inc)
+                row[1].update(names)
+        for row_id, (inc, names) in updates.items():
+            inc = {path: amount for path, amount in inc.items() if amount}
+            if not inc:
+                continue
+            await db.sales_rollups.update_one(
+                {"_id": row_id},
+                {"$inc": inc, "$set": {**names, "updated_at": datetime.now(timezone.utc)}},
+                upsert=True
+            )
+    except PyMongoError as e:
+        logger.error(f"Sales rollup update failed for order {(after or before or {}).get('id')}: {e}")
+
+
+async def ensure_rollup_indexes(db):
+    await db.sales_rollups.create_index([("store_id", ASCENDING), ("date", ASCENDING)])
+    await db.sales_rollups.create_index([("date", ASCENDING)])
+
+
+async def rebuild_rollups(db, store_id: Optional[str] = None) -> int:
+    """
+    Recompute fact rows from the orders collection (all stores, or one store).
+
+    Orders are streamed in batches and accumulated in memory per (store, day), then
+    each row is replaced. Returns the number of orders processed.
+    """
+    query = store_scope(store_id) if store_id else {}
+    backfill_state.update({
+        "status": "running", "store_id": store_id, "processed": 0,
+        "started_at": datetime.now(timezone.utc).isoformat(), "finished_at": None, "error": None
+    })
+    rows: Dict[str, dict] = {}
+    processed = 0
+    try:
+        cursor = db.orders.find(query, ORDER_ROLLUP_PROJECTION).batch_size(BACKFILL_BATCH_SIZE)
+        batch: List[dict] = []
+        async for order in cursor:
+            batch.append(order)
+            if len(batch) >= BACKFILL_BATCH_SIZE:
+                await _accumulate(db, batch, rows)
+                processed += len(batch)
+                backfill_state["processed"] = processed
+                batch = []
+        if batch:
+            await _accumulate(db, batch, rows)
+            processed += len(batch)
+
+        stale = {"store_id": query["store_id"]} if store_id else {}
+        await db.sales_rollups.delete_many({**stale, "_id": {"$nin": list(rows)}})
+        for row_id, row in rows.items():
+            await db.sales_rollups.replace_one({"_id": row_id}, row, upsert=True)
+        backfill_state.update({"status": "completed", "processed": processed, "rows": len(rows)})
+        return processed
+    except PyMongoError as e:
+        backfill_state.update({"status": "failed", "error": str(e)})
+        raise
+    finally:
+        backfill_state["finished_at"] = datetime.now(timezone.utc).isoformat()
+
+
+async def _accumulate(db, orders: List[dict], rows: Dict[str, dict]):
+    categories = await _categories_for(db, orders)
+    for order in orders:
+        part = _contribution(order, categories)
+        if not part:
+            continue
+        row_id, inc, names = part
+        row = rows.setdefault(row_id, {"_id": row_id})
+        for path, amount in inc.items():
+            _set_path(row, path, lambda current: (current or 0) + amount)
+        for path, value in names.items():
+            _set_path(row, path, lambda current: value)
+        row["updated_at"] = datetime.now(timezone.utc)
+
+
+def _set_path(doc: dict, path: str, update):
+    *parents, leaf = path.split(".")
+    for part in parents:
+        doc = doc.setdefault(part, {})
+    doc[leaf] = update(doc.get(leaf))
+
+
+async def backfill_if_empty(db):
+    """Build rollups on first start after deployment, when orders exist but no rows do"""
+    try:
+        if await db.sales_rollups.estimated_document_count() == 0 and \
+                await db.orders.estimated_document_count() > 0:
+            processed = await rebuild_rollups(db)
+            logger.info(f"Built sales rollups from {processed} orders")
+    except PyMongoError as e:
+        logger.error(f"Sales rollup backfill failed: {e}")
+
+
+async def load_rollups(db, start_day: str, end_day: str, store_id: Optional[str] = None,
+                       projection: Optional[dict] = None) -> List[dict]:
+    """Fact rows with start_day <= date <= end_day (YYYY-MM-DD), across stores unless one is given"""
+    query = {"date": {"$gte": start_day, "$lte": end_day}}
+    if store_id:
+        query["store_id"] = store_id
+    return await db.sales_rollups.find(query, projection).to_list(None)
+
+
+def merge_breakdown(rows: Iterable[dict], field: str) -> List[dict]:
+    """Sum one embedded breakdown (channels, products, categories, hours) across rows"""
+    merged: Dict[str, dict] = {}
+    for row in rows:
+        for key, entry in (row.get(field) or {}).items():
+            target = merged.setdefault(key, {})
+            for name, value in entry.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    target[name] = target.get(name, 0) + value
+                else:
+                    target[name] = value
+    return list(merged.values())
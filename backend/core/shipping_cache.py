@@ -0,0 +1,118 @@
+"""
+In-process cache of compiled shipping data.
+
+Zone indexes, rate tables and finished quotes are derived from the shipping
+collections and reused across requests. Every write to zones, services or
+options calls `shipping_changed`, which drops this process's entries and bumps
+a shared version document; other worker processes notice the new version on
+their next check (at most SHIPPING_VERSION_CHECK_SECONDS later) and drop
+theirs too.
+"""
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+import os
+import threading
+import time
+
+from pymongo import ReturnDocument
+
+# How often a process looks for shipping changes made by other processes
+SHIPPING_VERSION_CHECK_SECONDS = float(os.environ.get('SHIPPING_VERSION_CHECK_SECONDS', '2'))
+# Quotes kept in memory per process (least recently used are evicted first)
+SHIPPING_QUOTE_CACHE_SIZE = int(os.environ.get('SHIPPING_QUOTE_CACHE_SIZE', '10000'))
+VERSION_ID = "shipping"
+
+
+class LRUCache:
+    """Bounded mapping that evicts the least recently used entry, counting hits and misses"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()  # Batch quotes are priced in a worker thread
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups * 100, 1) if lookups else 0
+        }
+
+
+_entries: Dict[Hashable, Any] = {}
+_state = {"version": None, "checked_at": 0.0, "generation": 0}
+quote_cache = LRUCache(SHIPPING_QUOTE_CACHE_SIZE)
+
+
+def _reset(version: int):
+    _entries.clear()
+    quote_cache.clear()
+    _state["version"] = version
+    _state["generation"] += 1
+
+
+async def shipping_version(db) -> int:
+    """Current shipping data version, re-read from the database at most every few seconds"""
+    now = time.monotonic()
+    if _state["version"] is None or now - _state["checked_at"] >= SHIPPING_VERSION_CHECK_SECONDS:
+        doc = await db.shipping_meta.find_one({"_id": VERSION_ID})
+        version = doc["version"] if doc else 0
+        if version != _state["version"]:
+            _reset(version)
+        _state["checked_at"] = now
+    return _state["version"]
+
+
+async def shipping_changed(db):
+    """Call after any write to shipping zones, services or options"""
+    doc = await db.shipping_meta.find_one_and_update(
+        {"_id": VERSION_ID},
+        {"$inc": {"version": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    _reset(doc["version"])
+    _state["checked_at"] = time.monotonic()
+
+
+async def cached(db, key: Hashable, build: Callable[[], Awaitable[Any]]) -> Any:
+    """Entry for `key`, built with `build()` on first use after a change"""
+    await shipping_version(db)
+    if key in _entries:
+        return _entries[key]
+    generation = _state["generation"]
+    value = await build()
+    if generation == _state["generation"]:
+        _entries[key] = value  # Not stored if the data changed while building
+    return value
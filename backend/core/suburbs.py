@@ -0,0 +1,119 @@
+"""
+In-memory postcode / suburb lookup.
+
+The imported `postcode_suburbs` table (plus the built-in fallback list) is
+loaded once into parallel arrays with a postcode hash for exact lookups and
+sorted postcode and suburb-word keys for prefix search, so address
+autocomplete never queries the database. The index is kept in the shipping
+cache and reloaded after a suburb import.
+
+The built-in list ships as a CSV file sorted by postcode and is only read
+when the first index is built, not when the application starts.
+"""
+from bisect import bisect_left
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import csv
+
+from core.shipping_cache import cached
+
+# Built-in postcode-suburb mapping for major Australian areas
+BUILTIN_SUBURBS_FILE = Path(__file__).parent.parent / "data" / "au_suburbs.csv"
+
+
+@lru_cache(maxsize=1)
+def builtin_suburbs() -> Dict[str, List[dict]]:
+    """Built-in suburbs by postcode, read on first use"""
+    suburbs: Dict[str, List[dict]] = {}
+    with open(BUILTIN_SUBURBS_FILE, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            suburbs.setdefault(row["postcode"], []).append({"suburb": row["suburb"], "state": row["state"]})
+    return suburbs
+
+
+class SuburbIndex:
+    """Suburbs by exact postcode, postcode prefix and suburb-name word prefix"""
+
+    def __init__(self, imported: List[dict], static: Dict[str, List[dict]]):
+        self.postcodes: List[str] = []
+        self.suburbs: List[str] = []
+        self.states: List[str] = []
+        self.countries: List[Optional[str]] = []
+        self._imported: Dict[str, List[int]] = {}
+        self._static: Dict[str, List[int]] = {}
+
+        seen = set()
+        for doc in imported:
+            # Imported names are often upper case; show them in title case
+            self._add(doc["postcode"], doc["suburb"].title(), doc.get("state", ""), doc.get("country"), self._imported, seen)
+        for postcode, entries in static.items():
+            for entry in entries:
+                self._add(postcode, entry["suburb"], entry["state"], None, self._static, seen)
+
+        self._postcode_keys: List[Tuple[str, int]] = sorted((pc, row) for row, pc in enumerate(self.postcodes))
+        words = []
+        for row, suburb in enumerate(self.suburbs):
+            parts = suburb.lower().split()
+            # "north plympton" is found by "north p..." and by "plym..."
+            words.extend((" ".join(parts[i:]), row) for i in range(len(parts)))
+        self._name_keys: List[Tuple[str, int]] = sorted(words)
+
+    def _add(self, postcode: str, suburb: str, state: str, country: Optional[str], by_postcode: dict, seen: set):
+        key = (postcode, suburb.lower())
+        if key in seen:
+            return
+        seen.add(key)
+        by_postcode.setdefault(postcode, []).append(len(self.postcodes))
+        self.postcodes.append(postcode)
+        self.suburbs.append(suburb)
+        self.states.append(state)
+        self.countries.append(country)
+
+    def __len__(self) -> int:
+        return len(self.postcodes)
+
+    def lookup(self, postcode: str) -> List[dict]:
+        """Suburbs of a postcode; imported data takes precedence over the built-in list"""
+        rows = self._imported.get(postcode) or self._static.get(postcode) or []
+        return [{"suburb": self.suburbs[row], "state": self.states[row]} for row in rows]
+
+    def _result(self, row: int) -> dict:
+        result = {"postcode": self.postcodes[row], "suburb": self.suburbs[row], "state": self.states[row]}
+        if self.countries[row]:
+            result["country"] = self.countries[row]
+        return result
+
+    @staticmethod
+    def _prefixed(keys: List[Tuple[str, int]], prefix: str):
+        for i in range(bisect_left(keys, (prefix,)), len(keys)):
+            key, row = keys[i]
+            if not key.startswith(prefix):
+                break
+            yield row
+
+    def search(self, q: str, limit: int = 50) -> List[dict]:
+        """Suburbs whose postcode starts with `q`, then suburbs with a name word starting with `q`"""
+        q = q.strip().lower()
+        results = []
+        seen = set()
+        for keys in (self._postcode_keys, self._name_keys):
+            for row in self._prefixed(keys, q):
+                if row in seen:
+                    continue
+                seen.add(row)
+                results.append(self._result(row))
+                if len(results) >= limit:
+                    return results
+        return results
+
+
+async def suburb_index(db) -> SuburbIndex:
+    """Cached index of the imported suburbs, falling back to the built-in list for postcodes not imported"""
+    async def build():
+        imported = await db.postcode_suburbs.find(
+            {}, {"_id": 0, "postcode": 1, "suburb": 1, "state": 1, "country": 1}
+        ).to_list(None)
+        return SuburbIndex(imported, builtin_suburbs())
+
+    return await cached(db, ("suburbs",), build)
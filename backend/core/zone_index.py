@@ -0,0 +1,97 @@
+"""
+Compiled postcode → shipping zone lookup.
+
+A zone's postcodes are exact codes ("2000"), numeric ranges ("2000-2050") or
+prefixes ("20" matches "2000", "2001", ...). ZoneIndex compiles them once into
+a prefix trie, sorted range boundaries searched with bisect and a hash of
+literal range strings, so matching a postcode no longer re-parses every zone's
+postcode list. Results are the same as checking each zone in turn: every zone
+with at least one matching postcode, in the order the zones were given.
+"""
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Tuple
+
+from core.shipping_cache import cached
+
+_ZONES = None  # Trie node key holding the zones whose prefix ends at that node
+
+
+def _parse_range(code: str) -> Optional[Tuple[int, int]]:
+    try:
+        start, end = code.split("-")
+        return int(start), int(end)
+    except ValueError:
+        return None
+
+
+class ZoneIndex:
+    """Postcode → zones lookup compiled from a list of zone documents"""
+
+    def __init__(self, zones: List[dict]):
+        self.zones = list(zones)
+        self._exact: Dict[str, set] = {}
+        self._trie: dict = {}
+        ranges = []
+        for position, zone in enumerate(self.zones):
+            for pc in zone.get("postcodes") or []:
+                code = str(pc)
+                if "-" in code:
+                    # Literal match first (e.g. a postcode containing a dash), then as a range
+                    if isinstance(pc, str):
+                        self._exact.setdefault(pc, set()).add(position)
+                    bounds = _parse_range(code)
+                    if bounds and bounds[0] <= bounds[1]:
+                        ranges.append((bounds[0], bounds[1], position))
+                else:
+                    # Exact codes are prefixes of themselves
+                    node = self._trie
+                    for char in code:
+                        node = node.setdefault(char, {})
+                    node.setdefault(_ZONES, set()).add(position)
+        self._bounds, self._segments = self._compile_ranges(ranges)
+
+    @staticmethod
+    def _compile_ranges(ranges: List[Tuple[int, int, int]]) -> Tuple[List[int], List[Tuple[int, ...]]]:
+        """Split the number line at every range edge; each segment lists the zones covering it"""
+        bounds = sorted({start for start, _, _ in ranges} | {end + 1 for _, end, _ in ranges})
+        covering = [set() for _ in bounds]
+        for start, end, position in ranges:
+            for i in range(bisect_left(bounds, start), bisect_left(bounds, end + 1)):
+                covering[i].add(position)
+        return bounds, [tuple(zones) for zones in covering]
+
+    def match(self, postcode: str) -> List[dict]:
+        """All zones matching `postcode`, in zone order"""
+        postcode = postcode.strip()
+        found = set(self._exact.get(postcode, ()))
+
+        node = self._trie
+        found.update(node.get(_ZONES, ()))
+        for char in postcode:
+            node = node.get(char)
+            if node is None:
+                break
+            found.update(node.get(_ZONES, ()))
+
+        if self._bounds:
+            try:
+                number = int(postcode)
+            except ValueError:
+                number = None
+            if number is not None:
+                i = bisect_right(self._bounds, number) - 1
+                if i >= 0:
+                    found.update(self._segments[i])
+
+        return [self.zones[position] for position in sorted(found)]
+
+
+async def zone_index(db, country: str, store_id: Optional[str] = None) -> ZoneIndex:
+    """Cached index of the active zones of a country (of one store, or of all stores)"""
+    async def build():
+        query = {"country": country, "is_active": True}
+        if store_id:
+            query["store_id"] = store_id
+        return ZoneIndex(await db.shipping_zones.find(query, {"_id": 0}).to_list(None))
+
+    return await cached(db, ("zones", store_id, country), build)
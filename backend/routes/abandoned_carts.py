@@ -6,16 +6,12 @@ from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timezone, timedelta
-from motor.motor_asyncio import AsyncIOMotorClient
-import os
 import uuid
 
-router = APIRouter(prefix="/api/abandoned-carts", tags=["Abandoned Carts"])
+from core.loaders import products_by_id
+from core.database import db
 
-# MongoDB connection
-mongo_url = os.environ.get('MONGO_URL')
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ.get('DB_NAME', 'maropost_clone')]
+router = APIRouter(prefix="/api/abandoned-carts", tags=["Abandoned Carts"])
 
 
 # ==================== MODELS ====================
@@ -143,8 +139,11 @@ async def get_abandoned_cart(cart_id: str):
         raise HTTPException(status_code=404, detail="Cart not found")
     
     # Enrich with product details
+    products = await products_by_id(db, [
+        item.get("product_id") for item in cart.get("items", [])
+    ], {"name": 1, "image": 1, "price": 1})
     for item in cart.get("items", []):
-        product = await db.products.find_one({"id": item.get("product_id")}, {"_id": 0, "name": 1, "image": 1, "price": 1})
+        product = products.get(item.get("product_id"))
         if product:
             item["product"] = product
     
@@ -257,8 +256,9 @@ async def recover_cart_by_token(token: str):
         raise HTTPException(status_code=404, detail="Cart not found or already recovered")
     
     # Enrich with product details
+    products = await products_by_id(db, [item.get("product_id") for item in cart.get("items", [])])
     for item in cart.get("items", []):
-        product = await db.products.find_one({"id": item.get("product_id")}, {"_id": 0})
+        product = products.get(item.get("product_id"))
         if product:
             item["product"] = product
     
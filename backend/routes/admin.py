@@ -7,19 +7,17 @@ from fastapi import APIRouter, HTTPException, Depends, Query, Header
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timezone, timedelta
-from motor.motor_asyncio import AsyncIOMotorClient
 from jose import jwt, JWTError
 from passlib.context import CryptContext
 import hashlib
 import os
 import uuid
 
-router = APIRouter(prefix="/admin", tags=["admin"])
+from core.order_events import update_order_fields
+from core.platform_snapshot import get_platform_snapshot, refresh_platform_snapshot
+from core.database import db
 
-# Database connection
-mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ.get('DB_NAME', 'test_database')]
+router = APIRouter(prefix="/admin", tags=["admin"])
 
 # JWT Settings
 SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'maropost-clone-super-secret-key-change-in-production')
@@ -163,99 +161,25 @@ async def admin_login(email: str, password: str):
 # ==================== PLATFORM ANALYTICS ====================
 
 @router.get("/analytics/overview")
-async def get_analytics_overview(admin: dict = Depends(get_current_admin)):
-    """Get comprehensive platform analytics"""
-    
-    # Store counts
-    total_stores = await db.platform_stores.count_documents({})
-    active_stores = await db.platform_stores.count_documents({"status": "active"})
-    trial_stores = await db.platform_stores.count_documents({"status": "trial"})
-    suspended_stores = await db.platform_stores.count_documents({"status": "suspended"})
-    
-    # Plan distribution
-    plans = {}
-    for plan in ["free", "starter", "professional", "enterprise"]:
-        plans[plan] = await db.platform_stores.count_documents({"plan_id": plan})
-    
-    # Total metrics
-    total_products = await db.products.count_documents({})
-    total_orders = await db.orders.count_documents({})
-    total_customers = await db.customers.count_documents({})
-    total_users = await db.platform_owners.count_documents({})
-    
-    # Revenue calculation
-    pipeline = [
-        {"$match": {"payment_status": "paid"}},
-        {"$group": {"_id": None, "total": {"$sum": "$total"}}}
-    ]
-    revenue_result = await db.orders.aggregate(pipeline).to_list(1)
-    total_revenue = revenue_result[0]["total"] if revenue_result else 0
-    
-    # Monthly revenue trend (last 12 months)
-    monthly_revenue = []
-    for i in range(11, -1, -1):
-        date = datetime.now(timezone.utc) - timedelta(days=30 * i)
-        start_of_month = date.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        if i > 0:
-            end_of_month = (start_of_month + timedelta(days=32)).replace(day=1) - timedelta(seconds=1)
-        else:
-            end_of_month = datetime.now(timezone.utc)
-        
-        pipeline = [
-            {"$match": {
-                "payment_status": "paid",
-                "created_at": {"$gte": start_of_month, "$lte": end_of_month}
-            }},
-            {"$group": {"_id": None, "total": {"$sum": "$total"}}}
-        ]
-        result = await db.orders.aggregate(pipeline).to_list(1)
-        monthly_revenue.append({
-            "month": start_of_month.strftime("%b"),
-            "revenue": result[0]["total"] if result else 0
-        })
-    
-    # MRR calculation
-    mrr = (plans.get("starter", 0) * 29) + (plans.get("professional", 0) * 79) + (plans.get("enterprise", 0) * 299)
-    
-    # Top performing stores
-    top_stores_pipeline = [
-        {"$match": {"payment_status": "paid"}},
-        {"$group": {"_id": "$store_id", "revenue": {"$sum": "$total"}, "orders": {"$sum": 1}}},
-        {"$sort": {"revenue": -1}},
-        {"$limit": 10}
-    ]
-    top_stores_raw = await db.orders.aggregate(top_stores_pipeline).to_list(10)
-    
-    top_stores = []
-    for store in top_stores_raw:
-        store_info = await db.platform_stores.find_one({"id": store["_id"]}, {"_id": 0, "store_name": 1, "subdomain": 1})
-        if store_info:
-            top_stores.append({
-                "store_id": store["_id"],
-                "store_name": store_info.get("store_name", "Unknown"),
-                "subdomain": store_info.get("subdomain", ""),
-                "revenue": store["revenue"],
-                "orders": store["orders"]
-            })
-    
+async def get_analytics_overview(
+    refresh: bool = Query(False, description="Recompute the snapshot instead of serving the latest one"),
+    admin: dict = Depends(get_current_admin)
+):
+    """Get comprehensive platform analytics (from the periodically refreshed platform snapshot)"""
+    snapshot = await (refresh_platform_snapshot(db) if refresh else get_platform_snapshot(db))
+    stores = snapshot["stores"]
     return {
         "stores": {
-            "total": total_stores,
-            "active": active_stores,
-            "trial": trial_stores,
-            "suspended": suspended_stores,
-            "by_plan": plans
-        },
-        "metrics": {
-            "total_products": total_products,
-            "total_orders": total_orders,
-            "total_customers": total_customers,
-            "total_users": total_users,
-            "total_revenue": total_revenue,
-            "mrr": mrr
+            "total": stores["total"],
+            "active": stores["by_status"].get("active", 0),
+            "trial": stores["by_status"].get("trial", 0),
+            "suspended": stores["by_status"].get("suspended", 0),
+            "by_plan": {plan: stores["by_plan"].get(plan, 0) for plan in ["free", "starter", "professional", "enterprise"]}
         },
-        "monthly_revenue": monthly_revenue,
-        "top_stores": top_stores
+        "metrics": snapshot["metrics"],
+        "monthly_revenue": snapshot["monthly_revenue"],
+        "top_stores": snapshot["top_stores"],
+        "computed_at": snapshot["computed_at"]
     }
 
 
@@ -573,12 +497,9 @@ async def update_store_order(store_id: str, order_id: str, order_data: dict, adm
     order_data["updated_at"] = datetime.now(timezone.utc)
     order_data["updated_by_admin"] = admin.get("email")
     
-    result = await db.orders.update_one(
-        {"id": order_id, "store_id": store_id},
-        {"$set": order_data}
-    )
+    order = await update_order_fields(db, {"id": order_id, "store_id": store_id}, order_data)
     
-    if result.matched_count == 0:
+    if order is None:
         raise HTTPException(status_code=404, detail="Order not found")
     
     return {"success": True, "message": "Order updated"}
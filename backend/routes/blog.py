@@ -6,17 +6,12 @@ from fastapi import APIRouter, HTTPException, Query, UploadFile, File
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timezone
-from motor.motor_asyncio import AsyncIOMotorClient
-import os
 import uuid
 import re
 
-router = APIRouter(prefix="/api/blog", tags=["Blog"])
+from core.database import db
 
-# MongoDB connection
-mongo_url = os.environ.get('MONGO_URL')
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ.get('DB_NAME', 'maropost_clone')]
+router = APIRouter(prefix="/api/blog", tags=["Blog"])
 
 
 # ==================== BLOG MODELS ====================
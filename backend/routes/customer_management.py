@@ -6,16 +6,12 @@ from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timezone, timedelta
-from motor.motor_asyncio import AsyncIOMotorClient
-import os
 import uuid
 
-router = APIRouter(prefix="/api/customer-management", tags=["Customer Management"])
+from core.loaders import find_by_ids, products_by_id
+from core.database import db
 
-# MongoDB connection
-mongo_url = os.environ.get('MONGO_URL')
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ.get('DB_NAME', 'maropost_clone')]
+router = APIRouter(prefix="/api/customer-management", tags=["Customer Management"])
 
 
 # ==================== CUSTOMER GROUP MODELS ====================
@@ -182,14 +178,17 @@ async def get_all_wishlists(
     
     wishlists = await db.wishlists.find(query, {"_id": 0}).skip(skip).limit(limit).to_list(limit)
     
-    # Enrich with customer and product details
+    # Enrich with customer and product details (one query each)
+    customers = await find_by_ids(db.customers, [
+        w["customer_id"] for w in wishlists
+    ], {"name": 1, "email": 1})
+    products = await products_by_id(db, [
+        item["product_id"] for w in wishlists for item in w.get("items", [])
+    ], {"name": 1, "price": 1, "image": 1, "stock": 1})
     for wishlist in wishlists:
-        customer = await db.customers.find_one({"id": wishlist["customer_id"]}, {"_id": 0, "name": 1, "email": 1})
-        wishlist["customer"] = customer
-        
+        wishlist["customer"] = customers.get(wishlist["customer_id"])
         for item in wishlist.get("items", []):
-            product = await db.products.find_one({"id": item["product_id"]}, {"_id": 0, "name": 1, "price": 1, "image": 1, "stock": 1})
-            item["product"] = product
+            item["product"] = products.get(item["product_id"])
     
     total = await db.wishlists.count_documents(query)
     return {"wishlists": wishlists, "total": total}
@@ -205,9 +204,9 @@ async def get_wishlist(wishlist_id: str):
         raise HTTPException(status_code=404, detail="Wishlist not found")
     
     # Enrich with product details
+    products = await products_by_id(db, [item["product_id"] for item in wishlist.get("items", [])])
     for item in wishlist.get("items", []):
-        product = await db.products.find_one({"id": item["product_id"]}, {"_id": 0})
-        item["product"] = product
+        item["product"] = products.get(item["product_id"])
     
     return wishlist
 
@@ -216,10 +215,12 @@ async def get_customer_wishlists(customer_id: str):
     """Get all wishlists for a customer"""
     wishlists = await db.wishlists.find({"customer_id": customer_id}, {"_id": 0}).to_list(100)
     
+    products = await products_by_id(db, [
+        item["product_id"] for w in wishlists for item in w.get("items", [])
+    ], {"name": 1, "price": 1, "image": 1, "stock": 1})
     for wishlist in wishlists:
         for item in wishlist.get("items", []):
-            product = await db.products.find_one({"id": item["product_id"]}, {"_id": 0, "name": 1, "price": 1, "image": 1, "stock": 1})
-            item["product"] = product
+            item["product"] = products.get(item["product_id"])
     
     return {"wishlists": wishlists}
 
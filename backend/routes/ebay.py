@@ -14,6 +14,8 @@ import base64
 import asyncio
 import logging
 
+from core.loaders import products_by_id
+
 router = APIRouter(prefix="/ebay", tags=["ebay"])
 
 logger = logging.getLogger(__name__)
@@ -772,6 +774,9 @@ async def sync_inventory(background_tasks: BackgroundTasks):
     
     client = EbayClient(config, sandbox=config.get("sandbox_mode", True))
     
+    # Current stock for every listed product in one query
+    products = await products_by_id(db, [listing["product_id"] for listing in listings], {"stock": 1})
+    
     sync_results = {
         "total": len(listings),
         "synced": 0,
@@ -782,7 +787,7 @@ async def sync_inventory(background_tasks: BackgroundTasks):
     for listing in listings:
         try:
             # Get current product stock
-            product = await db.products.find_one({"id": listing["product_id"]}, {"_id": 0})
+            product = products.get(listing["product_id"])
             if not product:
                 continue
             
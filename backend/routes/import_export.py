@@ -3,19 +3,27 @@ Import/Export Module for Categories and Products
 Comprehensive CSV import/export with field mapping, validation, and progress tracking
 """
 
-from fastapi import APIRouter, UploadFile, File, HTTPException, Query, BackgroundTasks
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query, BackgroundTasks, Header
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
 from datetime import datetime, timezone
 from uuid import uuid4
+from functools import partial
 import csv
 import io
 import json
 
+from core.database import export_db
+from core.exports import EXPORT_MEDIA_TYPES, export_cell, stream_export
+from core.bulk_import import csv_rows
+from core.export_jobs import cancel_export_job, create_export_job, download_export
+from core.import_jobs import cancel_import_job, create_import_job, register_import_handler
+from core.product_import import ProductImporter
+
 router = APIRouter(prefix="/api/import-export", tags=["Import/Export"])
 
-# Database reference (will be set from server.py)
+# Database reference (will be set from server.py); exports read through the export pool
 db = None
 
 def set_db(database):
@@ -51,6 +59,14 @@ class ImportResult(BaseModel):
 class ExportConfig(BaseModel):
     fields: List[str]
     filters: Optional[Dict[str, Any]] = None
+    format: str = "csv"  # csv, ndjson
+
+
+class ExportJobRequest(BaseModel):
+    report: str  # products, orders, customers, sales, inventory
+    format: str = "csv"  # csv, ndjson
+    params: Optional[Dict[str, Any]] = None  # e.g. {"period": "90d"} for sales
+    store_id: Optional[str] = None
 
 
 # ==================== CATEGORY FIELDS ====================
@@ -352,7 +368,7 @@ async def import_categories(
 
 @router.post("/categories/export")
 async def export_categories(config: ExportConfig):
-    """Export categories to CSV"""
+    """Export categories to CSV or NDJSON (streamed)"""
     if db is None:
         raise HTTPException(status_code=500, detail="Database not initialized")
     
@@ -364,38 +380,22 @@ async def export_categories(config: ExportConfig):
         if config.filters.get('parent_id'):
             query['parent_id'] = config.filters['parent_id']
     
-    # Get categories
-    categories = await db.categories.find(query, {"_id": 0}).to_list(10000)
+    if config.format not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unsupported export format: {config.format}")
     
     # Get field labels for header
     field_labels = {f['field']: f['label'] for f in CATEGORY_FIELDS}
     
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Write header
-    headers = [field_labels.get(f, f) for f in config.fields]
-    writer.writerow(headers)
-    
-    # Write data
-    for cat in categories:
-        row = []
-        for field in config.fields:
-            value = cat.get(field, '')
-            if isinstance(value, list):
-                value = ', '.join(str(v) for v in value)
-            elif isinstance(value, dict):
-                value = json.dumps(value)
-            row.append(value if value is not None else '')
-        writer.writerow(row)
+    def values(cat):
+        return [export_cell(cat.get(field)) for field in config.fields]
     
-    output.seek(0)
+    cursor = export_db.categories.find(query, {"_id": 0, **{f: 1 for f in config.fields}})
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    
-    return StreamingResponse(
-        iter([output.getvalue()]),
-        media_type="text/csv",
-        headers={"Content-Disposition": f"attachment; filename=categories_export_{timestamp}.csv"}
+    return stream_export(
+        cursor, f"categories_export_{timestamp}", config.format,
+        header=[field_labels.get(f, f) for f in config.fields],
+        row=values,
+        document=lambda cat: dict(zip(config.fields, values(cat)))
     )
 
 
@@ -496,14 +496,61 @@ async def preview_product_import(file: UploadFile = File(...)):
         raise HTTPException(status_code=400, detail=f"Error parsing CSV: {str(e)}")
 
 
+def product_from_row(row: Dict[str, str], field_map: Dict[str, str], field_types: Dict[str, str],
+                     category_name_map: Dict[str, str], now: str) -> Dict[str, Any]:
+    """Map and validate one product CSV row; raises ValueError for an invalid row"""
+    product_data = {}
+    images = []
+    
+    for csv_col, db_field in field_map.items():
+        if csv_col in row and db_field:
+            field_type = field_types.get(db_field, 'string')
+            value = parse_csv_value(row[csv_col], field_type)
+            
+            # Handle image fields specially
+            if db_field.startswith('image_') and value:
+                img_num = int(db_field.split('_')[1]) - 1
+                while len(images) <= img_num:
+                    images.append(None)
+                images[img_num] = value
+            else:
+                product_data[db_field] = value
+    
+    # Handle images array
+    product_data['images'] = [img for img in images if img]
+    
+    # Handle category by name
+    if product_data.get('category_name') and not product_data.get('category_id'):
+        cat_name = product_data['category_name'].lower()
+        if cat_name in category_name_map:
+            product_data['category_id'] = category_name_map[cat_name]
+        del product_data['category_name']
+    
+    # Validate required fields
+    if not product_data.get('sku'):
+        raise ValueError("SKU is required")
+    if not product_data.get('name'):
+        raise ValueError("Product name is required")
+    if product_data.get('price') is None:
+        raise ValueError("Price is required")
+    
+    # Set defaults (new products are given an ID when written)
+    product_data.setdefault('stock', 0)
+    product_data.setdefault('status', 'active')
+    product_data.setdefault('visibility', 'visible')
+    product_data['updated_at'] = now
+    return product_data
+
+
 @router.post("/products/import")
 async def import_products(
     file: UploadFile = File(...),
     mappings: str = Query(..., description="JSON string of field mappings"),
     update_existing: bool = Query(False),
-    skip_errors: bool = Query(True)
+    skip_errors: bool = Query(True),
+    store_id: Optional[str] = Query(None, description="Store the products belong to; SKUs are matched within it")
 ):
-    """Import products from CSV file"""
+    """Import products from CSV file, streamed and written in bulk batches"""
     if db is None:
         raise HTTPException(status_code=500, detail="Database not initialized")
     
@@ -515,102 +562,59 @@ async def import_products(
     field_map = {m['csv_column']: m['db_field'] for m in mapping_list if m.get('db_field')}
     field_types = {f['field']: f['type'] for f in PRODUCT_FIELDS}
     
-    contents = await file.read()
-    decoded = contents.decode('utf-8-sig')
-    reader = csv.DictReader(io.StringIO(decoded))
-    
     # Get categories for name lookup
     categories = await db.categories.find({}, {"_id": 0, "id": 1, "name": 1}).to_list(1000)
     category_name_map = {c['name'].lower(): c['id'] for c in categories}
     
-    created = 0
-    updated = 0
-    errors = []
-    now = datetime.now(timezone.utc).isoformat()
+    importer = ProductImporter(
+        db, store_id=store_id, update_existing=update_existing,
+        transform=partial(product_from_row, field_map=field_map, field_types=field_types, category_name_map=category_name_map)
+    )
     
-    for row_num, row in enumerate(reader, start=2):
-        try:
-            product_data = {}
-            images = []
-            
-            for csv_col, db_field in field_map.items():
-                if csv_col in row and db_field:
-                    field_type = field_types.get(db_field, 'string')
-                    value = parse_csv_value(row[csv_col], field_type)
-                    
-                    # Handle image fields specially
-                    if db_field.startswith('image_') and value:
-                        img_num = int(db_field.split('_')[1]) - 1
-                        while len(images) <= img_num:
-                            images.append(None)
-                        images[img_num] = value
-                    else:
-                        product_data[db_field] = value
-            
-            # Handle images array
-            product_data['images'] = [img for img in images if img]
-            
-            # Handle category by name
-            if product_data.get('category_name') and not product_data.get('category_id'):
-                cat_name = product_data['category_name'].lower()
-                if cat_name in category_name_map:
-                    product_data['category_id'] = category_name_map[cat_name]
-                del product_data['category_name']
-            
-            # Validate required fields
-            if not product_data.get('sku'):
-                raise ValueError("SKU is required")
-            if not product_data.get('name'):
-                raise ValueError("Product name is required")
-            if product_data.get('price') is None:
-                raise ValueError("Price is required")
-            
-            # Generate ID if not provided
-            if not product_data.get('id'):
-                product_data['id'] = str(uuid4())
-            
-            # Set defaults
-            product_data.setdefault('stock', 0)
-            product_data.setdefault('status', 'active')
-            product_data.setdefault('visibility', 'visible')
-            product_data['updated_at'] = now
-            
-            # Check if exists by SKU
-            existing = await db.products.find_one({"sku": product_data['sku']}, {"_id": 0})
-            
-            if existing and update_existing:
-                await db.products.update_one(
-                    {"sku": product_data['sku']},
-                    {"$set": product_data}
-                )
-                updated += 1
-            elif not existing:
-                product_data['created_at'] = now
-                await db.products.insert_one(product_data)
-                created += 1
-            
-        except Exception as e:
-            errors.append({
-                "row": row_num,
-                "error": str(e),
-                "data": dict(row)
-            })
-            if not skip_errors:
-                raise HTTPException(status_code=400, detail=f"Error at row {row_num}: {str(e)}")
+    row_num = 1
+    async with csv_rows(file) as rows:
+        async for row in rows:
+            row_num += 1
+            if not await importer.add_row(row_num, row) and not skip_errors:
+                await importer.flush()  # Rows before the bad one are imported, as before
+                break
+        await importer.flush()
+    
+    if importer.error_count and not skip_errors:
+        first = importer.errors[0]
+        raise HTTPException(status_code=400, detail=f"Error at row {first['row']}: {first['error']}")
     
     return {
         "success": True,
-        "total_processed": created + updated + len(errors),
-        "created": created,
-        "updated": updated,
-        "errors": len(errors),
-        "error_details": errors[:50]
+        "total_processed": importer.created + importer.updated + importer.error_count,
+        "created": importer.created,
+        "updated": importer.updated,
+        "errors": importer.error_count,
+        "error_details": importer.errors[:50],
+        "batches": importer.batches
     }
 
 
+async def product_job_importer(database, job: dict) -> ProductImporter:
+    """Importer for a queued products import (see core.import_jobs)"""
+    options = job["options"]
+    categories = await database.categories.find({}, {"_id": 0, "id": 1, "name": 1}).to_list(1000)
+    return ProductImporter(
+        database, store_id=job.get("store_id"), update_existing=options.get("update_existing", False),
+        transform=partial(
+            product_from_row,
+            field_map=options.get("field_map", {}),
+            field_types={f['field']: f['type'] for f in PRODUCT_FIELDS},
+            category_name_map={c['name'].lower(): c['id'] for c in categories}
+        )
+    )
+
+register_import_handler("products", product_job_importer)
+
+
 @router.post("/products/export")
 async def export_products(config: ExportConfig):
-    """Export products to CSV"""
+    """Export products to CSV or NDJSON (streamed)"""
     if db is None:
         raise HTTPException(status_code=500, detail="Database not initialized")
     
@@ -631,63 +635,174 @@ async def export_products(config: ExportConfig):
         elif config.filters.get('stock_status') == 'out_of_stock':
             query['stock'] = {"$lte": 0}
     
-    # Get products
-    products = await db.products.find(query, {"_id": 0}).to_list(50000)
+    if config.format not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unsupported export format: {config.format}")
     
     # Get categories for name lookup
-    categories = await db.categories.find({}, {"_id": 0, "id": 1, "name": 1}).to_list(1000)
+    categories = await export_db.categories.find({}, {"_id": 0, "id": 1, "name": 1}).to_list(1000)
     category_id_map = {c['id']: c['name'] for c in categories}
     
     field_labels = {f['field']: f['label'] for f in PRODUCT_FIELDS}
     
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Write header
-    headers = [field_labels.get(f, f) for f in config.fields]
-    writer.writerow(headers)
-    
-    # Write data
-    for prod in products:
+    def values(prod):
         row = []
         for field in config.fields:
             if field == 'category_name':
                 # Get category name from ID
-                cat_id = prod.get('category_id', '')
-                value = category_id_map.get(cat_id, '')
+                value = category_id_map.get(prod.get('category_id', ''), '')
             elif field.startswith('image_'):
                 # Get specific image from images array
                 img_idx = int(field.split('_')[1]) - 1
                 images = prod.get('images', [])
                 value = images[img_idx] if img_idx < len(images) else ''
             else:
-                value = prod.get(field, '')
-            
-            if isinstance(value, list):
-                value = ', '.join(str(v) for v in value)
-            elif isinstance(value, dict):
-                value = json.dumps(value)
-            
-            row.append(value if value is not None else '')
-        writer.writerow(row)
+                value = prod.get(field)
+            row.append(export_cell(value))
+        return row
+    
+    # Only fetch the fields being exported
+    projection = {"_id": 0}
+    for field in config.fields:
+        if field == 'category_name':
+            projection['category_id'] = 1
+        elif field.startswith('image_'):
+            projection['images'] = 1
+        else:
+            projection[field] = 1
     
-    output.seek(0)
+    cursor = export_db.products.find(query, projection)
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    
-    return StreamingResponse(
-        iter([output.getvalue()]),
-        media_type="text/csv",
-        headers={"Content-Disposition": f"attachment; filename=products_export_{timestamp}.csv"}
+    return stream_export(
+        cursor, f"products_export_{timestamp}", config.format,
+        header=[field_labels.get(f, f) for f in config.fields],
+        row=values,
+        document=lambda prod: dict(zip(config.fields, values(prod)))
     )
 
 
-# ==================== IMPORT JOBS (For Progress Tracking) ====================
+# ==================== IMPORT JOBS (Large Imports in the Background) ====================
+
+@router.post("/imports")
+async def start_import_job(
+    file: UploadFile = File(...),
+    kind: str = Query("products", description="What the CSV contains"),
+    mappings: str = Query(..., description="JSON string of field mappings"),
+    update_existing: bool = Query(False),
+    skip_errors: bool = Query(True),
+    store_id: Optional[str] = Query(None)
+):
+    """Queue a background import of a CSV file; poll the job for progress and row errors"""
+    if db is None:
+        raise HTTPException(status_code=500, detail="Database not initialized")
+    try:
+        mapping_list = json.loads(mappings)
+    except:
+        raise HTTPException(status_code=400, detail="Invalid mappings JSON")
+    options = {
+        "field_map": {m['csv_column']: m['db_field'] for m in mapping_list if m.get('db_field')},
+        "update_existing": update_existing,
+        "skip_errors": skip_errors
+    }
+    return await create_import_job(db, kind, file, options, store_id)
+
+
+@router.get("/imports")
+async def list_import_jobs(status: Optional[str] = None, limit: int = Query(50, le=200)):
+    """Most recent import jobs"""
+    if db is None:
+        raise HTTPException(status_code=500, detail="Database not initialized")
+    query = {"status": status} if status else {}
+    jobs = await db.import_jobs.find(query, {"_id": 0, "error_details": 0}).sort("created_at", -1).to_list(limit)
+    return {"jobs": jobs}
+
+
+@router.get("/imports/{job_id}")
+async def get_import_job(job_id: str):
+    """Status, progress and row errors of an import job"""
+    if db is None:
+        raise HTTPException(status_code=500, detail="Database not initialized")
+    job = await db.import_jobs.find_one({"id": job_id}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job
+
+
+@router.delete("/imports/{job_id}")
+async def delete_import_job(job_id: str):
+    """Cancel a queued or running import, or delete a finished one"""
+    if db is None:
+        raise HTTPException(status_code=500, detail="Database not initialized")
+    job = await cancel_import_job(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job
 
-import_jobs = {}
 
 @router.get("/jobs/{job_id}")
 async def get_import_job_status(job_id: str):
-    """Get status of an import job"""
-    if job_id not in import_jobs:
-        raise HTTPException(status_code=404, detail="Job not found")
-    return import_jobs[job_id]
+    """Get status of an import or export job"""
+    if db is not None:
+        job = await db.import_jobs.find_one({"id": job_id}, {"_id": 0})
+        if job:
+            return job
+        job = await db.export_jobs.find_one({"id": job_id}, {"_id": 0})
+        if job:
+            return job
+    raise HTTPException(status_code=404, detail="Job not found")
+
+
+# ==================== EXPORT JOBS (Large Exports in the Background) ====================
+
+@router.post("/exports")
+async def start_export_job(request: ExportJobRequest):
+    """Queue a background export; poll the job for progress, then download the gzip file"""
+    if db is None:
+        raise HTTPException(status_code=500, detail="Database not initialized")
+    return await create_export_job(db, export_db, request.report, request.format, request.params, request.store_id)
+
+
+@router.get("/exports")
+async def list_export_jobs(status: Optional[str] = None, limit: int = Query(50, le=200)):
+    """Most recent export jobs"""
+    if db is None:
+        raise HTTPException(status_code=500, detail="Database not initialized")
+    query = {"status": status} if status else {}
+    jobs = await db.export_jobs.find(query, {"_id": 0}).sort("created_at", -1).to_list(limit)
+    return {"jobs": jobs}
+
+
+@router.get("/exports/{job_id}")
+async def get_export_job(job_id: str):
+    """Status and progress of an export job"""
+    if db is None:
+        raise HTTPException(status_code=500, detail="Database not initialized")
+    job = await db.export_jobs.find_one({"id": job_id}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    return job
+
+
+@router.get("/exports/{job_id}/download")
+async def download_export_job(
+    job_id: str,
+    range: Optional[str] = Header(None),
+    if_range: Optional[str] = Header(None)
+):
+    """Download a finished export; supports Range requests to resume interrupted downloads"""
+    if db is None:
+        raise HTTPException(status_code=500, detail="Database not initialized")
+    job = await db.export_jobs.find_one({"id": job_id}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    return download_export(job, range, if_range)
+
+
+@router.delete("/exports/{job_id}")
+async def delete_export_job(job_id: str):
+    """Cancel a queued or running export, or delete a finished one and its file"""
+    if db is None:
+        raise HTTPException(status_code=500, detail="Database not initialized")
+    job = await cancel_export_job(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    return job
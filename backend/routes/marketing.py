@@ -7,18 +7,14 @@ from fastapi import APIRouter, HTTPException, Query, BackgroundTasks
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timezone, timedelta
-from motor.motor_asyncio import AsyncIOMotorClient
-import os
 import uuid
 import random
 import string
 
-router = APIRouter(prefix="/api/marketing", tags=["Marketing"])
+from core.loaders import products_by_id
+from core.database import db
 
-# MongoDB connection
-mongo_url = os.environ.get('MONGO_URL')
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ.get('DB_NAME', 'maropost_clone')]
+router = APIRouter(prefix="/api/marketing", tags=["Marketing"])
 
 
 # ==================== COUPON/DISCOUNT MODELS ====================
@@ -800,9 +796,12 @@ async def get_bundles(is_active: Optional[bool] = None):
     bundles = await db.product_bundles.find(query, {"_id": 0}).to_list(100)
     
     # Enrich with product details
+    products = await products_by_id(db, [
+        item["product_id"] for b in bundles for item in b.get("items", [])
+    ], {"name": 1, "price": 1, "image": 1})
     for bundle in bundles:
         for item in bundle.get("items", []):
-            product = await db.products.find_one({"id": item["product_id"]}, {"_id": 0, "name": 1, "price": 1, "image": 1})
+            product = products.get(item["product_id"])
             if product:
                 item["product_name"] = product.get("name")
                 item["product_price"] = product.get("price")
@@ -819,8 +818,9 @@ async def get_bundle(bundle_id: str):
     
     # Enrich with product details
     original_price = 0
+    products = await products_by_id(db, [item["product_id"] for item in bundle.get("items", [])])
     for item in bundle.get("items", []):
-        product = await db.products.find_one({"id": item["product_id"]}, {"_id": 0})
+        product = products.get(item["product_id"])
         if product:
             item["product"] = product
             original_price += product.get("price", 0) * item.get("quantity", 1)
@@ -835,8 +835,9 @@ async def create_bundle(bundle: BundleCreate):
     """Create a new product bundle"""
     # Calculate original price
     original_price = 0
+    products = await products_by_id(db, [item.product_id for item in bundle.items], {"price": 1})
     for item in bundle.items:
-        product = await db.products.find_one({"id": item.product_id}, {"_id": 0, "price": 1})
+        product = products.get(item.product_id)
         if product:
             original_price += product.get("price", 0) * item.quantity
     
@@ -6,17 +6,13 @@ from fastapi import APIRouter, HTTPException, Query, BackgroundTasks
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timezone, timedelta
-from motor.motor_asyncio import AsyncIOMotorClient
-import os
 import uuid
 
-router = APIRouter(prefix="/api/operations", tags=["Operations"])
-
-# MongoDB connection
-mongo_url = os.environ.get('MONGO_URL')
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ.get('DB_NAME', 'maropost_clone')]
+from core.counters import next_sequence
+from core.loaders import products_by_id
+from core.database import db, DEFAULT_STORE_ID
 
+router = APIRouter(prefix="/api/operations", tags=["Operations"])
 
 # ==================== SUPPLIER MODELS ====================
 
@@ -290,8 +286,9 @@ async def create_purchase_order(po_data: POCreate):
     # Process items
     items = []
     subtotal = 0
+    products = await products_by_id(db, [item_data["product_id"] for item_data in po_data.items])
     for item_data in po_data.items:
-        product = await db.products.find_one({"id": item_data["product_id"]}, {"_id": 0})
+        product = products.get(item_data["product_id"])
         if product:
             item = POItem(
                 product_id=item_data["product_id"],
@@ -305,7 +302,9 @@ async def create_purchase_order(po_data: POCreate):
             subtotal += item.total
     
     # Create PO
+    sequence = await next_sequence(db, DEFAULT_STORE_ID, "purchase_orders")
     po = PurchaseOrder(
+        po_number=f"PO-{datetime.now().strftime('%Y%m%d')}-{sequence:04d}",
         supplier_id=po_data.supplier_id,
         supplier_name=supplier.get("name", ""),
         warehouse_id=po_data.warehouse_id,
@@ -368,7 +367,7 @@ async def receive_purchase_order(po_id: str, items_received: List[Dict[str, Any]
                 # Update product stock
                 await db.products.update_one(
                     {"id": item["product_id"]},
-                    {"$inc": {"stock": received.get("quantity", 0)}}
+                    {"$inc": {"stock": received.get("quantity", 0)}, "$set": {"updated_at": datetime.now(timezone.utc)}}
                 )
         
         if item.get("received_quantity", 0) < item.get("quantity", 0):
@@ -477,8 +476,9 @@ async def get_warehouse_stock(warehouse_id: str, search: Optional[str] = None):
     stock = await db.warehouse_stock.find(query, {"_id": 0}).to_list(10000)
     
     # Enrich with product details
+    products = await products_by_id(db, [item["product_id"] for item in stock], {"name": 1, "sku": 1, "image": 1})
     for item in stock:
-        product = await db.products.find_one({"id": item["product_id"]}, {"_id": 0, "name": 1, "sku": 1, "image": 1})
+        product = products.get(item["product_id"])
         if product:
             item["product_name"] = product.get("name")
             item["sku"] = product.get("sku")
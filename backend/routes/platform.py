@@ -12,6 +12,8 @@ from uuid import uuid4
 import secrets
 import hashlib
 
+from core.platform_snapshot import get_platform_snapshot
+
 router = APIRouter(prefix="/api/platform", tags=["Platform"])
 
 # Database reference (will be set from server.py)
@@ -651,22 +653,15 @@ async def admin_platform_stats():
     if db is None:
         raise HTTPException(status_code=500, detail="Database not initialized")
     
-    total_stores = await db.platform_stores.count_documents({})
-    active_stores = await db.platform_stores.count_documents({"status": "active"})
-    trial_stores = await db.platform_stores.count_documents({"status": "trial"})
-    
-    # Count by plan
-    plan_counts = {}
-    for plan_id in PLANS.keys():
-        plan_counts[plan_id] = await db.platform_stores.count_documents({"plan_id": plan_id})
-    
+    snapshot = await get_platform_snapshot(db)
+    stores = snapshot["stores"]
     return {
         "stores": {
-            "total": total_stores,
-            "active": active_stores,
-            "trial": trial_stores
+            "total": stores["total"],
+            "active": stores["by_status"].get("active", 0),
+            "trial": stores["by_status"].get("trial", 0)
         },
-        "plans": plan_counts
+        "plans": {plan_id: stores["by_plan"].get(plan_id, 0) for plan_id in PLANS.keys()}
     }
 
 
@@ -5,13 +5,15 @@ from fastapi.responses import StreamingResponse, HTMLResponse, Response
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from starlette.requests import Request
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne, ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 import uuid
+import asyncio
 from datetime import datetime, timezone, timedelta
 import aiofiles
 import re
@@ -28,6 +30,38 @@ import stripe
 # PDF Generation - imported from utils module
 from utils.pdf import PDFGenerator
 
+# Atomic per-store number sequences
+from core.counters import next_sequence
+
+# Order placement pipeline (bulk stock decrements, customer upsert, transactions)
+from core.orders import place_order
+from core.catalog import snapshot_line_attributes
+
+# Request-scoped batch loading (one $in query instead of a find_one per item)
+from core.loaders import products_by_id
+
+# Time-limited stock holds for carts
+from core.inventory import (
+    hold_stock,
+    unhold_stock,
+    release_holds,
+    extend_holds,
+    available_stock,
+    ensure_inventory_indexes,
+    run_reservation_sweeper
+)
+
+# Incrementally maintained daily sales fact rows and customer lifetime stats
+from core.rollups import ensure_rollup_indexes, backfill_if_empty
+from core.order_events import order_changed, update_order_fields
+from core.customer_stats import ensure_customer_stats_indexes
+
+# One-off data migrations, run once per database at startup
+from core.migrations import run_migrations
+
+# Periodically refreshed platform KPIs for the admin dashboards
+from core.platform_snapshot import get_platform_snapshot, run_platform_snapshots
+
 # Email Service
 from email_service import (
     send_welcome_email,
@@ -86,10 +120,15 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 hours
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# MongoDB connection (named pools per workload, see core/database.py)
+from core.database import db, export_db, close_clients, DEFAULT_STORE_ID
+
+# Streaming CSV/NDJSON exports
+from core.exports import EXPORT_MEDIA_TYPES, stream_documents
+from core.export_reports import stream_report
+from core.export_jobs import ensure_export_job_indexes, resume_export_jobs, run_export_job_sweeper
+from core.import_jobs import ensure_import_job_indexes, resume_import_jobs, run_import_job_sweeper
+from core.product_import import ensure_product_import_indexes
 
 # Create the main app
 app = FastAPI()
@@ -263,6 +302,11 @@ class OrderItemBase(BaseModel):
     price: float
     quantity: int
     image: Optional[str] = None
+    # Snapshot of the product at order time (filled in when the order is placed)
+    category_id: Optional[str] = None
+    category_name: Optional[str] = None
+    brand: Optional[str] = None
+    cost: Optional[float] = None
 
 class OrderBase(BaseModel):
     customer_name: str
@@ -740,9 +784,6 @@ async def get_admin_user(current_user: dict = Depends(get_current_user)) -> dict
 
 # ==================== MULTI-TENANT STORE CONTEXT ====================
 
-# Default store ID for backward compatibility (Tools In A Box)
-DEFAULT_STORE_ID = "675b5810-f110-42f0-9cac-00cf353f04a5"
-
 async def resolve_store_from_request(request: Request) -> str:
     """
     Resolve store_id from multiple sources in priority order:
@@ -2192,18 +2233,29 @@ async def delete_product(product_id: str, request: Request, current_user: dict =
 
 # ==================== ORDER ENDPOINTS ====================
 
-async def generate_order_number():
+def legacy_sequence_seed(collection, store_id: str):
+    """
+    Seed for per-store counters: numbers issued before counters existed came from a
+    platform-wide count_documents, so stores with history continue after that count.
+    """
+    async def seed() -> int:
+        if store_id == DEFAULT_STORE_ID or await collection.find_one({"store_id": store_id}, {"_id": 1}):
+            return await collection.count_documents({})
+        return 0
+    return seed
+
+async def generate_order_number(store_id: str = DEFAULT_STORE_ID):
     """Generate a sequential order number based on store settings"""
     # Get store settings
     settings = await db.store_settings.find_one({"id": "store_settings"})
     prefix = settings.get("order_prefix", "ORD") if settings else "ORD"
     start_number = settings.get("order_number_start", 1001) if settings else 1001
     
-    # Get current order count to generate sequential number
-    order_count = await db.orders.count_documents({})
+    # Atomically allocate the next number in this store's order sequence
+    sequence = await next_sequence(db, store_id, "orders", seed=legacy_sequence_seed(db.orders, store_id))
     
     # Generate the order number
-    order_number = start_number + order_count
+    order_number = start_number + sequence - 1
     
     return f"{prefix}-{order_number}"
 
@@ -2213,41 +2265,25 @@ async def create_order(order: OrderCreate, request: Request, current_user: dict
     new_order = Order(**order.dict())
     
     # Generate custom order number
-    new_order.order_number = await generate_order_number()
+    new_order.order_number = await generate_order_number(store_id)
     
     new_order.payment_status = "paid"  # For demo purposes
     order_dict = new_order.dict()
     order_dict["store_id"] = store_id
-    await db.orders.insert_one(order_dict)
     
-    # Update product sales count
-    for item in order.items:
-        await db.products.update_one(
-            {"id": item.product_id, "store_id": store_id},
-            {"$inc": {"sales_count": item.quantity, "stock": -item.quantity}}
-        )
-    
-    # Update or create customer
-    customer = await db.customers.find_one({"email": order.customer_email, "store_id": store_id})
-    if customer:
-        await db.customers.update_one(
-            {"email": order.customer_email, "store_id": store_id},
-            {
-                "$inc": {"total_orders": 1, "total_spent": order.total},
-                "$set": {"updated_at": datetime.now(timezone.utc)}
-            }
-        )
-    else:
-        new_customer = Customer(
-            name=order.customer_name,
-            email=order.customer_email,
-            phone=order.customer_phone,
-            total_orders=1,
-            total_spent=order.total
-        )
-        cust_dict = new_customer.dict()
-        cust_dict["store_id"] = store_id
-        await db.customers.insert_one(cust_dict)
+    # Write stock, order and customer together (rejects oversold lines with 409)
+    new_customer = Customer(
+        name=order.customer_name,
+        email=order.customer_email,
+        phone=order.customer_phone
+    )
+    await place_order(
+        db,
+        order_dict,
+        [(item.product_id, item.quantity) for item in order.items],
+        customer=new_customer.dict(),
+        store_id=store_id
+    )
     
     return new_order
 
@@ -2336,11 +2372,11 @@ async def update_order_status(order_id: str, status: str, request: Request, noti
     if status not in valid_statuses:
         raise HTTPException(status_code=400, detail=f"Invalid status. Must be one of: {valid_statuses}")
     
-    result = await db.orders.update_one(
-        {"id": order_id, "store_id": store_id},
-        {"$set": {"status": status, "updated_at": datetime.now(timezone.utc)}}
+    order = await update_order_fields(
+        db, {"id": order_id, "store_id": store_id},
+        {"status": status, "updated_at": datetime.now(timezone.utc)}
     )
-    if result.matched_count == 0:
+    if order is None:
         raise HTTPException(status_code=404, detail="Order not found")
     
     # TODO: If notify=True, send email to customer
@@ -2421,16 +2457,13 @@ async def process_order_refund(order_id: str, amount: float, reason: str):
     
     # Update order status
     new_payment_status = "refunded" if amount >= order.get("total", 0) else "partial_refund"
-    await db.orders.update_one(
-        {"id": order_id},
-        {"$set": {
-            "payment_status": new_payment_status,
-            "refund_amount": amount,
-            "refund_reason": reason,
-            "refunded_at": datetime.now(timezone.utc),
-            "updated_at": datetime.now(timezone.utc)
-        }}
-    )
+    await update_order_fields(db, {"id": order_id}, {
+        "payment_status": new_payment_status,
+        "refund_amount": amount,
+        "refund_reason": reason,
+        "refunded_at": datetime.now(timezone.utc),
+        "updated_at": datetime.now(timezone.utc)
+    })
     
     return {"message": f"Refund of ${amount:.2f} processed", "new_status": new_payment_status}
 
@@ -2453,7 +2486,7 @@ async def update_order(order_id: str, updates: dict):
     update_data = {k: v for k, v in updates.items() if k in allowed_fields}
     update_data["updated_at"] = datetime.now(timezone.utc)
     
-    await db.orders.update_one({"id": order_id}, {"$set": update_data})
+    await update_order_fields(db, {"id": order_id}, update_data)
     return {"message": "Order updated successfully"}
 
 @api_router.delete("/orders/{order_id}")
@@ -2472,6 +2505,7 @@ async def delete_order(order_id: str):
     
     # Delete the order
     await db.orders.delete_one({"id": order_id})
+    await order_changed(db, before=order)
     
     return {"message": "Order deleted successfully"}
 
@@ -2706,31 +2740,9 @@ async def get_packing_slip(order_id: str, format: str = "pdf"):
 
 @api_router.get("/orders/export")
 async def export_orders(format: str = "csv"):
-    """Export orders to CSV/Excel/PDF"""
-    orders = await db.orders.find({}, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    
-    if format == "csv":
-        # Generate CSV
-        import csv
-        import io
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow(["Order Number", "Customer", "Email", "Total", "Status", "Payment Status", "Date"])
-        for order in orders:
-            writer.writerow([
-                order.get("order_number", ""),
-                order.get("customer_name", ""),
-                order.get("customer_email", ""),
-                order.get("total", 0),
-                order.get("status", ""),
-                order.get("payment_status", ""),
-                order.get("created_at", "")
-            ])
-        return Response(
-            content=output.getvalue(),
-            media_type="text/csv",
-            headers={"Content-Disposition": "attachment; filename=orders.csv"}
-        )
+    """Export orders to CSV/NDJSON (streamed)"""
+    if format in EXPORT_MEDIA_TYPES:
+        return stream_report(export_db, "orders", "orders", format)
     
     return {"message": f"Export format {format} not yet implemented"}
 
@@ -2818,7 +2830,11 @@ async def create_return(return_data: Dict[str, Any]):
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     
+    # Online and POS returns share one RET- sequence
+    store_id = order.get("store_id") or DEFAULT_STORE_ID
+    sequence = await next_sequence(db, store_id, "returns", seed=legacy_sequence_seed(db.pos_returns, store_id))
     new_return = ReturnRequest(
+        return_number=f"RET-{datetime.now(timezone.utc).strftime('%Y%m%d')}-{sequence:04d}",
         order_id=return_data.get("order_id"),
         order_number=order.get("order_number", ""),
         customer_id=order.get("customer_id"),
@@ -2925,9 +2941,9 @@ async def process_return_refund(return_id: str, refund_data: Dict[str, Any] = {}
     await db.returns.update_one({"id": return_id}, {"$set": update})
     
     # Update original order
-    await db.orders.update_one(
-        {"id": ret.get("order_id")},
-        {"$set": {"payment_status": "refunded", "updated_at": datetime.now(timezone.utc).isoformat()}}
+    await update_order_fields(
+        db, {"id": ret.get("order_id")},
+        {"payment_status": "refunded", "updated_at": datetime.now(timezone.utc).isoformat()}
     )
     
     return await db.returns.find_one({"id": return_id}, {"_id": 0})
@@ -2962,7 +2978,7 @@ async def create_payment_intent(amount: float, currency: str = "aud"):
         raise HTTPException(status_code=400, detail=str(e))
 
 @api_router.post("/checkout/process")
-async def process_checkout(checkout: CheckoutRequest):
+async def process_checkout(checkout: CheckoutRequest, request: Request):
     """Process checkout - creates order and handles payment"""
     # Get cart
     cart = await db.carts.find_one({"id": checkout.cart_id})
@@ -3012,39 +3028,25 @@ async def process_checkout(checkout: CheckoutRequest):
     )
     
     # Generate custom order number
-    new_order.order_number = await generate_order_number()
-    
-    await db.orders.insert_one(new_order.dict())
-    
-    # Deduct stock for each item
-    for item in cart["items"]:
-        await db.products.update_one(
-            {"id": item["product_id"]},
-            {"$inc": {"stock": -item["quantity"], "sales_count": item["quantity"]}}
-        )
-    
-    # Update or create customer
-    customer = await db.customers.find_one({"email": checkout.customer_email})
-    if customer:
-        await db.customers.update_one(
-            {"email": checkout.customer_email},
-            {
-                "$inc": {"total_orders": 1, "total_spent": total},
-                "$set": {"updated_at": datetime.now(timezone.utc)}
-            }
-        )
-    else:
-        new_customer = Customer(
-            name=checkout.customer_name,
-            email=checkout.customer_email,
-            phone=checkout.customer_phone,
-            total_orders=1,
-            total_spent=total
-        )
-        await db.customers.insert_one(new_customer.dict())
+    store_id = await resolve_store_from_request(request)
+    new_order.order_number = await generate_order_number(store_id)
+    order_dict = new_order.dict()
+    order_dict["store_id"] = store_id
     
-    # Clear cart
-    await db.carts.delete_one({"id": checkout.cart_id})
+    # Deduct stock, insert order, upsert customer and clear cart in one pass
+    new_customer = Customer(
+        name=checkout.customer_name,
+        email=checkout.customer_email,
+        phone=checkout.customer_phone
+    )
+    await place_order(
+        db,
+        order_dict,
+        [(item["product_id"], item["quantity"]) for item in cart["items"]],
+        customer=new_customer.dict(),
+        store_id=store_id,
+        cart_id=checkout.cart_id
+    )
     
     return {
         "success": True,
@@ -3062,17 +3064,12 @@ async def confirm_payment(order_id: str, payment_intent_id: str):
         raise HTTPException(status_code=404, detail="Order not found")
     
     # Update order with payment info
-    await db.orders.update_one(
-        {"id": order_id},
-        {
-            "$set": {
-                "payment_status": "paid",
-                "payment_intent_id": payment_intent_id,
-                "status": "processing",
-                "updated_at": datetime.now(timezone.utc)
-            }
-        }
-    )
+    await update_order_fields(db, {"id": order_id}, {
+        "payment_status": "paid",
+        "payment_intent_id": payment_intent_id,
+        "status": "processing",
+        "updated_at": datetime.now(timezone.utc)
+    })
     
     return {"success": True, "message": "Payment confirmed"}
 
@@ -3082,6 +3079,8 @@ async def confirm_payment(order_id: str, payment_intent_id: str):
 async def create_quote(quote: QuoteCreate):
     """Create a new quote request - does NOT deduct stock"""
     new_quote = Quote(**quote.dict())
+    sequence = await next_sequence(db, DEFAULT_STORE_ID, "quotes")
+    new_quote.quote_number = f"QTE-{datetime.now(timezone.utc).strftime('%Y%m%d')}-{sequence:04d}"
     new_quote.valid_until = datetime.now(timezone.utc) + timedelta(days=30)  # 30 day validity
     await db.quotes.insert_one(new_quote.dict())
     return new_quote
@@ -3245,16 +3244,24 @@ async def convert_quote_to_order(quote_id: str):
     )
     
     # Generate custom order number
-    new_order.order_number = await generate_order_number()
-    
-    await db.orders.insert_one(new_order.dict())
+    store_id = quote.get("store_id") or DEFAULT_STORE_ID
+    new_order.order_number = await generate_order_number(store_id)
+    order_dict = new_order.dict()
+    order_dict["store_id"] = store_id
     
-    # Deduct stock NOW (not when quote was created)
-    for item in quote["items"]:
-        await db.products.update_one(
-            {"id": item["product_id"]},
-            {"$inc": {"stock": -item["quantity"], "sales_count": item["quantity"]}}
-        )
+    # Deduct stock NOW (not when quote was created), insert order and update customer stats
+    new_customer = Customer(
+        name=quote["customer_name"],
+        email=quote["customer_email"],
+        phone=quote.get("customer_phone")
+    )
+    await place_order(
+        db,
+        order_dict,
+        [(item["product_id"], item["quantity"]) for item in quote["items"]],
+        customer=new_customer.dict(),
+        store_id=store_id
+    )
     
     # Update quote status
     await db.quotes.update_one(
@@ -3268,26 +3275,6 @@ async def convert_quote_to_order(quote_id: str):
         }
     )
     
-    # Update customer stats
-    customer = await db.customers.find_one({"email": quote["customer_email"]})
-    if customer:
-        await db.customers.update_one(
-            {"email": quote["customer_email"]},
-            {
-                "$inc": {"total_orders": 1, "total_spent": quote["total"]},
-                "$set": {"updated_at": datetime.now(timezone.utc)}
-            }
-        )
-    else:
-        new_customer = Customer(
-            name=quote["customer_name"],
-            email=quote["customer_email"],
-            phone=quote.get("customer_phone"),
-            total_orders=1,
-            total_spent=quote["total"]
-        )
-        await db.customers.insert_one(new_customer.dict())
-    
     return {
         "success": True,
         "order_id": new_order.id,
@@ -3749,12 +3736,15 @@ async def get_all_reviews(
     reviews = await db.reviews.find(query, {"_id": 0}).sort("created_at", -1).to_list(limit)
     
     # Enrich with product info if missing
-    for review in reviews:
-        if not review.get("product_name") and review.get("product_id"):
-            product = await db.products.find_one({"id": review["product_id"], "store_id": store_id}, {"_id": 0, "name": 1, "sku": 1})
-            if product:
-                review["product_name"] = product.get("name")
-                review["product_sku"] = product.get("sku")
+    missing = [r for r in reviews if not r.get("product_name") and r.get("product_id")]
+    products = await products_by_id(db, [
+        r["product_id"] for r in missing
+    ], {"name": 1, "sku": 1}, store_id=store_id)
+    for review in missing:
+        product = products.get(review["product_id"])
+        if product:
+            review["product_name"] = product.get("name")
+            review["product_sku"] = product.get("sku")
     
     return reviews
 
@@ -4270,7 +4260,7 @@ async def calculate_tax(
 
 @api_router.get("/export/{resource_type}")
 async def export_data(resource_type: str, format: str = "csv"):
-    """Export data to CSV or JSON"""
+    """Export data to CSV, NDJSON (both streamed) or JSON"""
     collection_map = {
         "products": "products",
         "customers": "customers",
@@ -4282,37 +4272,17 @@ async def export_data(resource_type: str, format: str = "csv"):
     if resource_type not in collection_map:
         raise HTTPException(status_code=400, detail="Invalid resource type")
     
-    collection = db[collection_map[resource_type]]
-    data = await collection.find({}, {"_id": 0}).to_list(10000)
+    collection = export_db[collection_map[resource_type]]
     
     if format == "json":
+        data = await collection.find({}, {"_id": 0}).to_list(10000)
         return {"data": data, "count": len(data)}
     
-    # CSV format
-    if not data:
-        return Response(content="No data", media_type="text/csv")
-    
-    import io
-    import csv
-    
-    output = io.StringIO()
-    writer = csv.DictWriter(output, fieldnames=data[0].keys())
-    writer.writeheader()
-    for row in data:
-        # Flatten nested objects for CSV
-        flat_row = {}
-        for key, value in row.items():
-            if isinstance(value, (dict, list)):
-                flat_row[key] = str(value)
-            else:
-                flat_row[key] = value
-        writer.writerow(flat_row)
+    if format not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unsupported export format: {format}")
     
-    return Response(
-        content=output.getvalue(),
-        media_type="text/csv",
-        headers={"Content-Disposition": f"attachment; filename={resource_type}_export.csv"}
-    )
+    # CSV columns are the fields of the first document; nested values are flattened
+    return stream_documents(collection.find({}, {"_id": 0}), f"{resource_type}_export", format)
 
 @api_router.post("/import/{resource_type}")
 async def import_data(resource_type: str, data: List[Dict[str, Any]]):
@@ -6679,6 +6649,7 @@ async def render_partial_product_detail(product_id: str):
 class CartItem(BaseModel):
     product_id: str
     quantity: int = 1
+    version: Optional[int] = None  # Optimistic concurrency: reject if the cart has moved on
 
 class CartResponse(BaseModel):
     id: str
@@ -6686,85 +6657,158 @@ class CartResponse(BaseModel):
     subtotal: float
     total: float
     item_count: int
+    version: int = 0
     created_at: Optional[str] = None
     updated_at: Optional[str] = None
 
+CART_PRODUCT_PROJECTION = {
+    "_id": 0, "store_id": 1, "name": 1, "sku": 1, "price": 1, "compare_price": 1, "images": 1,
+    "weight": 1, "shipping_length": 1, "shipping_width": 1, "shipping_height": 1
+}
+
+# Cart writes are single-document update pipelines: the changed line is edited with
+# $map/$filter/$concatArrays and totals are recomputed by the server, so concurrent
+# add-to-cart clicks never overwrite each other and the write size does not grow
+# with the cart. Every write bumps `version`; callers may pass the version they last
+# saw to update/remove and get a 409 if someone else changed the cart in between.
+
+def _cart_totals_stages() -> list:
+    """Pipeline stages that recompute cart totals and bump the version"""
+    return [
+        {"$set": {
+            "subtotal": {"$sum": "$items.line_total"},
+            "item_count": {"$sum": "$items.quantity"},
+            "version": {"$add": [{"$ifNull": ["$version", 0]}, 1]},
+            "updated_at": datetime.now(timezone.utc).isoformat()
+        }},
+        {"$set": {"total": "$subtotal"}}  # Add tax/shipping later if needed
+    ]
+
+def _cart_line_set_quantity(product_id: str, quantity) -> list:
+    """Pipeline setting one line's quantity (a number or an expression over $$line) and its line_total"""
+    return [{"$set": {"items": {"$map": {
+        "input": "$items",
+        "as": "line",
+        "in": {"$cond": [
+            {"$eq": ["$$line.product_id", {"$literal": product_id}]},
+            {"$mergeObjects": ["$$line", {
+                "quantity": quantity,
+                "line_total": {"$multiply": [quantity, "$$line.price"]}
+            }]},
+            "$$line"
+        ]}
+    }}}}] + _cart_totals_stages()
+
+def _cart_line_remove(product_id: str) -> list:
+    return [{"$set": {"items": {"$filter": {
+        "input": {"$ifNull": ["$items", []]},
+        "as": "line",
+        "cond": {"$ne": ["$$line.product_id", {"$literal": product_id}]}
+    }}}}] + _cart_totals_stages()
+
+def _cart_filter(cart_id: str, version: Optional[int] = None, **extra) -> dict:
+    query = {"id": cart_id, **extra}
+    if version is not None:
+        query["version"] = version
+    return query
+
+async def _cart_write_failed(cart_id: str, version: Optional[int], product_id: Optional[str] = None):
+    """Explain why a guarded cart write matched nothing"""
+    cart = await db.carts.find_one({"id": cart_id}, {"_id": 0, "version": 1, "items.product_id": 1})
+    if not cart:
+        raise HTTPException(status_code=404, detail="Cart not found")
+    if version is not None and cart.get("version", 0) != version:
+        raise HTTPException(
+            status_code=409,
+            detail={"message": "Cart was modified, reload and retry", "version": cart.get("version", 0)}
+        )
+    if product_id and not any(i.get("product_id") == product_id for i in cart.get("items", [])):
+        raise HTTPException(status_code=404, detail="Item not in cart")
+
 @api_router.get("/cart/{cart_id}")
 async def get_cart(cart_id: str):
     """Get cart by ID"""
-    cart = await db.carts.find_one({"id": cart_id}, {"_id": 0})
-    if not cart:
-        # Create new cart if not exists
-        cart = {
-            "id": cart_id,
+    # Create new cart if not exists
+    now = datetime.now(timezone.utc).isoformat()
+    cart = await db.carts.find_one_and_update(
+        {"id": cart_id},
+        {"$setOnInsert": {
             "items": [],
             "subtotal": 0,
             "total": 0,
             "item_count": 0,
-            "created_at": datetime.now(timezone.utc).isoformat(),
-            "updated_at": datetime.now(timezone.utc).isoformat()
-        }
-        await db.carts.insert_one(cart.copy())  # Insert a copy to avoid _id pollution
+            "version": 0,
+            "created_at": now,
+            "updated_at": now
+        }},
+        projection={"_id": 0},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
     return cart
 
 @api_router.post("/cart/{cart_id}/add")
 async def add_to_cart(cart_id: str, item: CartItem):
     """Add item to cart"""
-    # Get or create cart
-    cart = await db.carts.find_one({"id": cart_id}, {"_id": 0})
-    if not cart:
-        cart = {
-            "id": cart_id,
-            "items": [],
-            "subtotal": 0,
-            "total": 0,
-            "item_count": 0,
-            "created_at": datetime.now(timezone.utc).isoformat()
-        }
+    if item.quantity <= 0:
+        raise HTTPException(status_code=400, detail="Quantity must be at least 1")
     
-    # Get product details
-    product = await db.products.find_one({"id": item.product_id}, {"_id": 0})
+    # Get product details (only the fields a cart line snapshots)
+    product = await db.products.find_one({"id": item.product_id}, CART_PRODUCT_PROJECTION)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    # Check if item already in cart
-    existing_item = None
-    for cart_item in cart["items"]:
-        if cart_item["product_id"] == item.product_id:
-            existing_item = cart_item
-            break
-    
-    if existing_item:
-        existing_item["quantity"] += item.quantity
-        existing_item["line_total"] = existing_item["quantity"] * existing_item["price"]
-    else:
-        cart["items"].append({
-            "product_id": item.product_id,
-            "name": product.get("name", ""),
-            "sku": product.get("sku", ""),
-            "price": product.get("price", 0),
-            "compare_price": product.get("compare_price"),
-            "image": product.get("images", [""])[0] if product.get("images") else "",
-            "quantity": item.quantity,
-            "line_total": item.quantity * product.get("price", 0),
-            "weight": product.get("weight", 0.5),
-            "shipping_length": product.get("shipping_length", 0),
-            "shipping_width": product.get("shipping_width", 0),
-            "shipping_height": product.get("shipping_height", 0)
-        })
+    # Hold the stock for this cart (409 if other carts already hold it)
+    await hold_stock(db, cart_id, item.product_id, item.quantity, store_id=product.get("store_id"))
+    
+    new_line = {
+        "product_id": item.product_id,
+        "name": product.get("name", ""),
+        "sku": product.get("sku", ""),
+        "price": product.get("price", 0),
+        "compare_price": product.get("compare_price"),
+        "image": product.get("images", [""])[0] if product.get("images") else "",
+        "quantity": item.quantity,
+        "line_total": item.quantity * product.get("price", 0),
+        "weight": product.get("weight", 0.5),
+        "shipping_length": product.get("shipping_length", 0),
+        "shipping_width": product.get("shipping_width", 0),
+        "shipping_height": product.get("shipping_height", 0)
+    }
     
-    # Recalculate totals
-    cart["subtotal"] = sum(i["line_total"] for i in cart["items"])
-    cart["total"] = cart["subtotal"]  # Add tax/shipping later if needed
-    cart["item_count"] = sum(i["quantity"] for i in cart["items"])
-    cart["updated_at"] = datetime.now(timezone.utc).isoformat()
+    cart = None
+    for _ in range(2):
+        # Item already in cart: bump its quantity in place
+        cart = await db.carts.find_one_and_update(
+            _cart_filter(cart_id, item.version, **{"items.product_id": item.product_id}),
+            _cart_line_set_quantity(item.product_id, {"$add": ["$$line.quantity", item.quantity]}),
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+        if cart:
+            break
+        # Otherwise append the line, creating the cart if needed
+        try:
+            cart = await db.carts.find_one_and_update(
+                _cart_filter(cart_id, item.version, **{"items.product_id": {"$ne": item.product_id}}),
+                [{"$set": {
+                    "items": {"$concatArrays": [{"$ifNull": ["$items", []]}, [{"$literal": new_line}]]},
+                    "created_at": {"$ifNull": ["$created_at", datetime.now(timezone.utc).isoformat()]}
+                }}] + _cart_totals_stages(),
+                projection={"_id": 0},
+                upsert=item.version is None,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            continue  # The same product was added concurrently - retry as an increment
+        break
     
-    # Save cart
-    await db.carts.update_one(
-        {"id": cart_id},
-        {"$set": cart},
-        upsert=True
-    )
+    if not cart:
+        # Version conflict - give back the stock held above
+        await unhold_stock(db, cart_id, item.product_id, item.quantity)
+        await _cart_write_failed(cart_id, item.version)
+        # Lost the race on both attempts without a version to report
+        raise HTTPException(status_code=409, detail={"message": "Cart was modified, reload and retry"})
     
     return {
         "success": True,
@@ -6782,71 +6826,77 @@ async def add_to_cart(cart_id: str, item: CartItem):
 @api_router.put("/cart/{cart_id}/update")
 async def update_cart_item(cart_id: str, item: CartItem):
     """Update item quantity in cart"""
-    cart = await db.carts.find_one({"id": cart_id}, {"_id": 0})
+    if item.quantity <= 0:
+        cart = await db.carts.find_one_and_update(
+            _cart_filter(cart_id, item.version, **{"items.product_id": item.product_id}),
+            _cart_line_remove(item.product_id),
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+        if not cart:
+            await _cart_write_failed(cart_id, item.version, item.product_id)
+        await release_holds(db, cart_id, [item.product_id])
+        return {"success": True, "cart": cart}
+    
+    # Hold the new quantity first (409 if other carts already hold the stock)
+    await hold_stock(db, cart_id, item.product_id, item.quantity, absolute=True)
+    
+    cart = await db.carts.find_one_and_update(
+        _cart_filter(cart_id, item.version, **{"items.product_id": item.product_id}),
+        _cart_line_set_quantity(item.product_id, item.quantity),
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
     if not cart:
-        raise HTTPException(status_code=404, detail="Cart not found")
-    
-    # Find and update item
-    item_found = False
-    for cart_item in cart["items"]:
-        if cart_item["product_id"] == item.product_id:
-            if item.quantity <= 0:
-                cart["items"].remove(cart_item)
-            else:
-                cart_item["quantity"] = item.quantity
-                cart_item["line_total"] = item.quantity * cart_item["price"]
-            item_found = True
-            break
-    
-    if not item_found:
-        raise HTTPException(status_code=404, detail="Item not in cart")
-    
-    # Recalculate totals
-    cart["subtotal"] = sum(i["line_total"] for i in cart["items"])
-    cart["total"] = cart["subtotal"]
-    cart["item_count"] = sum(i["quantity"] for i in cart["items"])
-    cart["updated_at"] = datetime.now(timezone.utc).isoformat()
-    
-    await db.carts.update_one({"id": cart_id}, {"$set": cart})
+        # Cart changed or line missing - bring the hold back in line with the cart
+        current = await db.carts.find_one({"id": cart_id}, {"_id": 0, "items": 1}) or {}
+        line = next((i for i in current.get("items", []) if i.get("product_id") == item.product_id), None)
+        if line:
+            await hold_stock(db, cart_id, item.product_id, line["quantity"], absolute=True)
+        else:
+            await release_holds(db, cart_id, [item.product_id])
+        await _cart_write_failed(cart_id, item.version, item.product_id)
     
     return {"success": True, "cart": cart}
 
 @api_router.delete("/cart/{cart_id}/remove/{product_id}")
-async def remove_from_cart(cart_id: str, product_id: str):
+async def remove_from_cart(cart_id: str, product_id: str, version: Optional[int] = None):
     """Remove item from cart"""
-    cart = await db.carts.find_one({"id": cart_id}, {"_id": 0})
+    cart = await db.carts.find_one_and_update(
+        _cart_filter(cart_id, version),
+        _cart_line_remove(product_id),
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
     if not cart:
-        raise HTTPException(status_code=404, detail="Cart not found")
-    
-    # Remove item
-    cart["items"] = [i for i in cart["items"] if i["product_id"] != product_id]
-    
-    # Recalculate totals
-    cart["subtotal"] = sum(i["line_total"] for i in cart["items"])
-    cart["total"] = cart["subtotal"]
-    cart["item_count"] = sum(i["quantity"] for i in cart["items"])
-    cart["updated_at"] = datetime.now(timezone.utc).isoformat()
-    
-    await db.carts.update_one({"id": cart_id}, {"$set": cart})
+        await _cart_write_failed(cart_id, version)
+    await release_holds(db, cart_id, [product_id])
     
     return {"success": True, "cart": cart}
 
 @api_router.delete("/cart/{cart_id}/clear")
 async def clear_cart(cart_id: str):
     """Clear all items from cart"""
-    cart = {
-        "id": cart_id,
-        "items": [],
-        "subtotal": 0,
-        "total": 0,
-        "item_count": 0,
-        "updated_at": datetime.now(timezone.utc).isoformat()
-    }
-    
-    await db.carts.update_one({"id": cart_id}, {"$set": cart}, upsert=True)
+    cart = await db.carts.find_one_and_update(
+        {"id": cart_id},
+        [{"$set": {"items": []}}] + _cart_totals_stages(),
+        projection={"_id": 0},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    await release_holds(db, cart_id)
     
     return {"success": True, "cart": cart}
 
+@api_router.post("/cart/{cart_id}/checkout-start")
+async def start_cart_checkout(cart_id: str):
+    """Extend the cart's stock holds for the duration of checkout"""
+    cart = await db.carts.find_one({"id": cart_id}, {"_id": 0, "items": 1})
+    if not cart:
+        raise HTTPException(status_code=404, detail="Cart not found")
+    extended = await extend_holds(db, cart_id)
+    return {"success": True, "holds_extended": extended}
+
 
 # ==================== MAROPOST TEMPLATE ENGINE V2 ====================
 
@@ -7132,6 +7182,23 @@ async def update_inventory(product_id: str, stock: int):
         raise HTTPException(status_code=404, detail="Product not found")
     return {"message": "Inventory updated successfully"}
 
+@api_router.get("/inventory/{product_id}/available")
+async def get_available_stock(product_id: str):
+    """Stock that can still be added to a cart (stock minus active holds)"""
+    product = await db.products.find_one(
+        {"id": product_id},
+        {"_id": 0, "stock": 1, "reserved": 1, "track_inventory": 1, "allow_backorder": 1}
+    )
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return {
+        "product_id": product_id,
+        "stock": product.get("stock", 0),
+        "reserved": product.get("reserved", 0),
+        "available": max(0, available_stock(product)),
+        "unlimited": product.get("track_inventory") is False or bool(product.get("allow_backorder"))
+    }
+
 # ==================== POS SYSTEM ====================
 
 # POS Models
@@ -7248,8 +7315,10 @@ async def get_pos_products(search: Optional[str] = None, barcode: Optional[str]
 async def create_pos_transaction(transaction: POSTransactionCreate):
     """Create a new POS transaction (sale)"""
     # Generate transaction number
-    count = await db.pos_transactions.count_documents({})
-    transaction_number = f"POS-{datetime.now(timezone.utc).strftime('%Y%m%d')}-{count + 1:04d}"
+    sequence = await next_sequence(
+        db, DEFAULT_STORE_ID, "pos_transactions", seed=legacy_sequence_seed(db.pos_transactions, DEFAULT_STORE_ID)
+    )
+    transaction_number = f"POS-{datetime.now(timezone.utc).strftime('%Y%m%d')}-{sequence:04d}"
     
     # Create transaction record
     trans_data = {
@@ -7319,14 +7388,19 @@ async def create_pos_transaction(transaction: POSTransactionCreate):
         "updated_at": datetime.now(timezone.utc).isoformat()
     }
     
+    await snapshot_line_attributes(db, order_items)
     await db.orders.insert_one(order_data)
+    await order_changed(db, after=order_data)
     
-    # Update inventory - reduce stock for each item sold
-    for item in transaction.items:
-        await db.products.update_one(
-            {"id": item.product_id},
-            {"$inc": {"stock": -item.quantity, "sales_count": item.quantity}}
-        )
+    # Update inventory - reduce stock for each item sold (goods already handed over, so unconditional)
+    if transaction.items:
+        await db.products.bulk_write([
+            UpdateOne({"id": item.product_id}, {
+                "$inc": {"stock": -item.quantity, "sales_count": item.quantity},
+                "$set": {"updated_at": datetime.now(timezone.utc)}
+            })
+            for item in transaction.items
+        ], ordered=False)
     
     # If there's a shift open for this register, update expected cash
     if transaction.register_id:
@@ -7337,18 +7411,6 @@ async def create_pos_transaction(transaction: POSTransactionCreate):
                 {"$inc": {"expected_cash": cash_amount}}
             )
     
-    # Update or create customer record
-    if transaction.customer_email and transaction.customer_email != "pos@store.local":
-        customer = await db.customers.find_one({"email": transaction.customer_email})
-        if customer:
-            await db.customers.update_one(
-                {"email": transaction.customer_email},
-                {
-                    "$inc": {"total_orders": 1, "total_spent": transaction.total},
-                    "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}
-                }
-            )
-    
     return {
         "id": trans_data["id"],
         "transaction_number": transaction_number,
@@ -7438,10 +7500,7 @@ async def update_pos_transaction_status(transaction_id: str, status: str, notes:
         if notes:
             order_update["notes"] = (transaction.get("notes", "") + f"\n{notes}").strip()
         
-        await db.orders.update_one(
-            {"id": transaction["order_id"]},
-            {"$set": order_update}
-        )
+        await update_order_fields(db, {"id": transaction["order_id"]}, order_update)
     else:
         # Find order by POS transaction ID
         order = await db.orders.find_one({"pos_transaction_id": transaction_id})
@@ -7454,10 +7513,7 @@ async def update_pos_transaction_status(transaction_id: str, status: str, notes:
                 existing_notes = order.get("notes", "")
                 order_update["notes"] = (existing_notes + f"\n{notes}").strip() if existing_notes else notes
             
-            await db.orders.update_one(
-                {"pos_transaction_id": transaction_id},
-                {"$set": order_update}
-            )
+            await update_order_fields(db, {"pos_transaction_id": transaction_id}, order_update)
     
     return {"message": "Status updated successfully", "status": status}
 
@@ -7880,8 +7936,10 @@ async def create_pos_return(return_data: POSReturnCreate):
         raise HTTPException(status_code=404, detail="Original transaction not found")
     
     # Generate return number
-    count = await db.pos_returns.count_documents({})
-    return_number = f"RET-{datetime.now(timezone.utc).strftime('%Y%m%d')}-{count + 1:04d}"
+    sequence = await next_sequence(
+        db, DEFAULT_STORE_ID, "returns", seed=legacy_sequence_seed(db.pos_returns, DEFAULT_STORE_ID)
+    )
+    return_number = f"RET-{datetime.now(timezone.utc).strftime('%Y%m%d')}-{sequence:04d}"
     
     # Create return record
     ret_data = {
@@ -7908,7 +7966,7 @@ async def create_pos_return(return_data: POSReturnCreate):
     for item in return_data.items:
         await db.products.update_one(
             {"id": item.product_id},
-            {"$inc": {"stock": item.quantity}}
+            {"$inc": {"stock": item.quantity}, "$set": {"updated_at": datetime.now(timezone.utc)}}
         )
     
     # Update shift expected cash if cash refund
@@ -8244,31 +8302,10 @@ async def seed_database():
 
 @api_router.get("/admin/stats")
 async def get_admin_platform_stats(admin: dict = Depends(get_admin_user)):
-    """Get platform-wide statistics for admin dashboard"""
-    
-    # Total websites/merchants
-    total_websites = await db.websites.count_documents({})
-    active_websites = await db.websites.count_documents({"status": "active"})
-    
-    # Aggregate revenue and orders from all websites
-    pipeline = [
-        {"$group": {
-            "_id": None,
-            "total_revenue": {"$sum": "$revenue"},
-            "total_orders": {"$sum": "$orders"},
-            "total_products": {"$sum": "$products"},
-            "total_customers": {"$sum": "$customers"}
-        }}
-    ]
-    website_stats = await db.websites.aggregate(pipeline).to_list(1)
-    
-    total_revenue = website_stats[0]["total_revenue"] if website_stats else 0
-    total_orders = website_stats[0]["total_orders"] if website_stats else 0
-    total_products = website_stats[0]["total_products"] if website_stats else 0
-    total_customers = website_stats[0]["total_customers"] if website_stats else 0
-    
-    # Total users
-    total_users = await db.users.count_documents({})
+    """Get platform-wide statistics for admin dashboard (from the periodically refreshed platform snapshot)"""
+    snapshot = await get_platform_snapshot(db)
+    websites = snapshot["websites"]
+    total_revenue = websites["total_revenue"]
     
     # Monthly revenue data (simulated based on websites)
     monthly_revenue = []
@@ -8285,13 +8322,13 @@ async def get_admin_platform_stats(admin: dict = Depends(get_admin_user)):
         })
     
     return {
-        "total_merchants": total_websites,
-        "active_merchants": active_websites,
+        "total_merchants": websites["total"],
+        "active_merchants": websites["active"],
         "total_revenue": round(total_revenue, 2),
-        "total_orders": total_orders,
-        "total_products": total_products,
-        "total_customers": total_customers,
-        "total_users": total_users,
+        "total_orders": websites["total_orders"],
+        "total_products": websites["total_products"],
+        "total_customers": websites["total_customers"],
+        "total_users": snapshot["metrics"]["total_accounts"],
         "monthly_revenue": monthly_revenue
     }
 
@@ -8423,48 +8460,20 @@ async def get_admin_platform_stores(
 
 @api_router.get("/admin/platform-stats")
 async def get_admin_platform_stats(admin: dict = Depends(get_admin_user)):
-    """Get platform-wide statistics"""
-    total_stores = await db.platform_stores.count_documents({})
-    active_stores = await db.platform_stores.count_documents({"status": "active"})
-    trial_stores = await db.platform_stores.count_documents({"status": "trial"})
-    
-    # Count by plan
-    free_stores = await db.platform_stores.count_documents({"plan_id": "free"})
-    starter_stores = await db.platform_stores.count_documents({"plan_id": "starter"})
-    professional_stores = await db.platform_stores.count_documents({"plan_id": "professional"})
-    enterprise_stores = await db.platform_stores.count_documents({"plan_id": "enterprise"})
-    
-    # Total products, orders across all stores
-    total_products = await db.products.count_documents({})
-    total_orders = await db.orders.count_documents({})
-    total_customers = await db.customers.count_documents({})
-    
-    # Calculate total revenue
-    pipeline = [
-        {"$match": {"payment_status": "paid"}},
-        {"$group": {"_id": None, "total": {"$sum": "$total"}}}
-    ]
-    revenue_result = await db.orders.aggregate(pipeline).to_list(1)
-    total_revenue = revenue_result[0]["total"] if revenue_result else 0
-    
-    # Monthly recurring revenue estimate
-    mrr = (starter_stores * 29) + (professional_stores * 79) + (enterprise_stores * 299)
-    
+    """Get platform-wide statistics (from the periodically refreshed platform snapshot)"""
+    snapshot = await get_platform_snapshot(db)
+    stores = snapshot["stores"]
+    metrics = snapshot["metrics"]
     return {
-        "total_stores": total_stores,
-        "active_stores": active_stores,
-        "trial_stores": trial_stores,
-        "stores_by_plan": {
-            "free": free_stores,
-            "starter": starter_stores,
-            "professional": professional_stores,
-            "enterprise": enterprise_stores
-        },
-        "total_products": total_products,
-        "total_orders": total_orders,
-        "total_customers": total_customers,
-        "total_revenue": total_revenue,
-        "mrr": mrr
+        "total_stores": stores["total"],
+        "active_stores": stores["by_status"].get("active", 0),
+        "trial_stores": stores["by_status"].get("trial", 0),
+        "stores_by_plan": {plan: stores["by_plan"].get(plan, 0) for plan in ["free", "starter", "professional", "enterprise"]},
+        "total_products": metrics["total_products"],
+        "total_orders": metrics["total_orders"],
+        "total_customers": metrics["total_customers"],
+        "total_revenue": metrics["total_revenue"],
+        "mrr": metrics["mrr"]
     }
 
 @api_router.get("/admin/websites/{website_id}", response_model=Website)
@@ -9001,9 +9010,35 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def start_background_jobs():
+    try:
+        await db.carts.create_index("id", unique=True)
+    except OperationFailure as e:
+        # Legacy duplicate cart ids; carts still work, but concurrent first adds may create duplicates
+        logger.warning(f"Unique index on carts.id not created: {e}")
+    await ensure_inventory_indexes(db)
+    await ensure_rollup_indexes(db)
+    await ensure_customer_stats_indexes(db)
+    await ensure_export_job_indexes(db)
+    await ensure_product_import_indexes(db)
+    await ensure_import_job_indexes(db)
+    app.state.reservation_sweeper = asyncio.create_task(run_reservation_sweeper(db))
+    app.state.startup_jobs = asyncio.create_task(run_startup_jobs())
+    app.state.platform_snapshots = asyncio.create_task(run_platform_snapshots(db))
+    await resume_export_jobs(db, export_db)
+    app.state.export_job_sweeper = asyncio.create_task(run_export_job_sweeper(db, export_db))
+    await resume_import_jobs(db)
+    app.state.import_job_sweeper = asyncio.create_task(run_import_job_sweeper(db))
+
+async def run_startup_jobs():
+    """Data migrations first, so a rollup backfill sees migrated orders"""
+    await run_migrations(db)
+    await backfill_if_empty(db)
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
+    close_clients()
 
 # Serve static files for backup download
 import os
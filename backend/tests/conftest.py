@@ -0,0 +1,18 @@
+"""
+Shared fixtures for backend unit tests.
+
+Tests run against an in-memory MongoDB (mongomock-motor), so no server is needed.
+"""
+import os
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+# core.database reads these at import time; the client it creates is never used here
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "test_database")
+
+
+@pytest.fixture
+def db():
+    return AsyncMongoMockClient()["test_database"]
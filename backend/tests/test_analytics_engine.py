@@ -0,0 +1,199 @@
+"""
+Columnar analytics must give the same answers as the per-customer and per-product
+loops they replaced
+"""
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+import pytest
+
+from core.analytics_engine import cohort_retention, customer_segments, inventory_turnover
+
+NOW = datetime(2026, 6, 15, 12, 0, tzinfo=timezone.utc)
+
+
+def ago(days, hours=0):
+    return (NOW - timedelta(days=days, hours=hours)).isoformat().replace("+00:00", "Z")
+
+
+CUSTOMERS = [
+    {"id": "vip-orders", "created_at": "2025-01-03T08:00:00Z"},
+    {"id": "vip-spend", "created_at": "2025-01-20T08:00:00Z"},
+    {"id": "loyal", "created_at": "2025-02-01T00:00:00Z"},
+    {"id": "regular", "created_at": "2025-02-28T23:30:00Z"},
+    {"id": "new", "created_at": "2026-06-01T10:00:00Z"},
+    {"id": "at-risk", "created_at": "2025-11-10T10:00:00Z"},
+    {"id": "edge-90", "created_at": "2025-12-31T10:00:00Z"},
+    {"id": "edge-180", "created_at": "2025-12-01T10:00:00+00:00"},
+    {"id": "cancelled-only", "created_at": "2026-03-02T10:00:00Z"},
+    {"id": "never-ordered", "created_at": "2026-03-09T10:00:00Z"},
+]
+
+ORDERS = (
+    [{"customer_id": "vip-orders", "total": 20, "created_at": ago(30 * i + 2)} for i in range(10)]
+    + [{"customer_id": "vip-spend", "total": 1200.55, "created_at": ago(400)}]
+    + [{"customer_id": "loyal", "total": 110.1, "created_at": ago(20 * i)} for i in range(5)]
+    + [{"customer_id": "regular", "total": 45.5, "created_at": ago(100)},
+       {"customer_id": "regular", "total": 30, "created_at": ago(3)}]
+    + [{"customer_id": "new", "total": 15, "created_at": ago(1)}]
+    + [{"customer_id": "at-risk", "total": 60, "created_at": ago(120)}]
+    + [{"customer_id": "edge-90", "total": 10, "created_at": ago(90)},
+       {"customer_id": "edge-180", "total": 10, "created_at": ago(179, 23)}]
+    + [{"customer_id": "cancelled-only", "total": 99, "created_at": ago(5), "status": "cancelled"},
+       {"customer_id": "regular", "total": 500, "created_at": ago(4), "status": "refunded"}]
+)
+
+
+def sales(orders):
+    return [o for o in orders if o.get("status") not in ("cancelled", "refunded")]
+
+
+def old_segments(customers, orders, now):
+    """The per-customer loop of the original /customers/segments endpoint"""
+    segments = {
+        "vip": {"name": "VIP", "count": 0, "revenue": 0, "criteria": "10+ orders or $1000+ spent"},
+        "loyal": {"name": "Loyal", "count": 0, "revenue": 0, "criteria": "5-9 orders or $500-999 spent"},
+        "regular": {"name": "Regular", "count": 0, "revenue": 0, "criteria": "2-4 orders"},
+        "new": {"name": "New", "count": 0, "revenue": 0, "criteria": "1 order"},
+        "at_risk": {"name": "At Risk", "count": 0, "revenue": 0, "criteria": "No orders in 90+ days"},
+        "inactive": {"name": "Inactive", "count": 0, "revenue": 0, "criteria": "No orders in 180+ days"}
+    }
+    for customer in customers:
+        mine = [o for o in sales(orders) if o["customer_id"] == customer["id"]]
+        total_spent = sum(o.get("total", 0) for o in mine)
+        order_count = len(mine)
+        days_since_order = 999
+        if mine:
+            last_order = max(mine, key=lambda o: o["created_at"])["created_at"]
+            days_since_order = (now - datetime.fromisoformat(last_order.replace("Z", "+00:00"))).days
+        if order_count >= 10 or total_spent >= 1000:
+            segment = "vip"
+        elif order_count >= 5 or total_spent >= 500:
+            segment = "loyal"
+        elif order_count >= 2:
+            segment = "regular"
+        else:
+            segment = "inactive" if days_since_order >= 180 else "at_risk" if days_since_order >= 90 else "new"
+        segments[segment]["count"] += 1
+        segments[segment]["revenue"] += total_spent
+    for segment in segments.values():
+        segment["revenue"] = round(segment["revenue"], 2)
+    return list(segments.values())
+
+
+def customer_stats(customers, orders):
+    """The lifetime stats kept on each customer by core.customer_stats"""
+    rows = []
+    for customer in customers:
+        mine = [o for o in sales(orders) if o["customer_id"] == customer["id"]]
+        rows.append({
+            "id": customer["id"],
+            "total_orders": len(mine) or None,
+            "total_spent": sum(o["total"] for o in mine) if mine else None,
+            "last_order_at": max(o["created_at"] for o in mine) if mine else None,
+        })
+    return pd.DataFrame(rows, columns=["id", "total_orders", "total_spent", "last_order_at"])
+
+
+def old_cohorts(customers, orders, period):
+    """The per-customer loop of the original /customers/cohorts endpoint"""
+    cohorts = {}
+    for customer in customers:
+        created = datetime.fromisoformat(customer["created_at"].replace("Z", "+00:00"))
+        key = created.strftime("%Y-%m") if period == "monthly" else created.strftime("%Y-W%W")
+        data = cohorts.setdefault(key, {"customers": 0, "retained": {}, "revenue": {}})
+        data["customers"] += 1
+        for order in (o for o in sales(orders) if o["customer_id"] == customer["id"]):
+            order_date = datetime.fromisoformat(order["created_at"].replace("Z", "+00:00"))
+            months_diff = (order_date.year - created.year) * 12 + (order_date.month - created.month)
+            data["retained"].setdefault(months_diff, set()).add(customer["id"])
+            data["revenue"][months_diff] = data["revenue"].get(months_diff, 0) + order.get("total", 0)
+    result = []
+    for key, data in sorted(cohorts.items(), reverse=True)[:12]:
+        result.append({"cohort": key, "total_customers": data["customers"], "retention": {
+            f"month_{month}": {
+                "customers": len(ids),
+                "rate": round(len(ids) / data["customers"] * 100, 1),
+                "revenue": round(data["revenue"][month], 2)
+            } for month, ids in data["retained"].items()
+        }})
+    return result
+
+
+def customer_months(orders):
+    """customer_months_frame computed in pandas (mongomock cannot run its $substrCP)"""
+    frame = pd.DataFrame(sales(orders))
+    frame["month"] = frame["created_at"].str[:7]
+    return frame.groupby(["customer_id", "month"], as_index=False)["total"].sum().rename(columns={"total": "revenue"})
+
+
+class TestCustomerSegments:
+    def test_matches_per_customer_loop(self):
+        expected = old_segments(CUSTOMERS, ORDERS, NOW)
+        assert customer_segments(customer_stats(CUSTOMERS, ORDERS), NOW) == expected
+        assert [s["count"] for s in expected] == [2, 1, 1, 1, 3, 2]
+
+    def test_recency_boundaries(self):
+        segments = {s["name"]: s for s in customer_segments(customer_stats(CUSTOMERS, ORDERS), NOW)}
+        assert segments["At Risk"]["revenue"] == 80, "at-risk, edge-90 (exactly 90 days) and edge-180 (179 days 23 hours)"
+        assert segments["Inactive"]["count"] == 2, "cancelled-only and never-ordered have no sales"
+
+    def test_no_customers(self):
+        empty = pd.DataFrame(columns=["id", "total_orders", "total_spent", "last_order_at"])
+        assert customer_segments(empty, NOW) == old_segments([], [], NOW)
+
+
+class TestCohortRetention:
+    @pytest.mark.parametrize("period", ["monthly", "weekly"])
+    def test_matches_per_customer_loop(self, period):
+        customers = pd.DataFrame(CUSTOMERS)
+        assert cohort_retention(customers, customer_months(ORDERS), period) == old_cohorts(CUSTOMERS, ORDERS, period)
+
+    def test_keeps_latest_twelve_cohorts(self):
+        customers = [{"id": f"c{m}", "created_at": f"2025-{m:02d}-15T00:00:00Z"} for m in range(1, 13)]
+        customers += [{"id": "c13", "created_at": "2026-01-15T00:00:00Z"}]
+        orders = [{"customer_id": c["id"], "total": 1.005, "created_at": c["created_at"]} for c in customers]
+        result = cohort_retention(pd.DataFrame(customers), customer_months(orders))
+        assert result == old_cohorts(customers, orders, "monthly")
+        assert [c["cohort"] for c in result][-1] == "2025-02"
+
+
+def old_turnover(products, units_sold, days):
+    """The per-product loop of the original /inventory/turnover endpoint"""
+    result = []
+    for product in products:
+        sold = units_sold.get(product["id"], 0)
+        stock = product.get("stock", 0)
+        avg_stock = (stock + sold) / 2 if (stock + sold) > 0 else 1
+        days_of_stock = stock / (sold / days) if sold > 0 else 999
+        result.append({
+            "product_id": product["id"], "units_sold": sold, "turnover_rate": round(sold / avg_stock, 2),
+            "days_of_stock": round(min(days_of_stock, 999), 0),
+            "status": "healthy" if 30 <= days_of_stock <= 90 else "low" if days_of_stock < 30 else "excess"
+        })
+    result.sort(key=lambda x: x["units_sold"], reverse=True)
+    return result
+
+
+class TestInventoryTurnover:
+    PRODUCTS = [
+        {"id": "just-low", "name": "A", "sku": "A", "stock": 296},     # 29.6 days: rounds to 30 but is low
+        {"id": "just-excess", "name": "B", "sku": "B", "stock": 904},  # 90.4 days: rounds to 90 but is excess
+        {"id": "healthy", "name": "C", "sku": "C", "stock": 500},
+        {"id": "unsold", "name": "D", "sku": "D", "stock": 3},
+        {"id": "slow", "name": "E", "sku": "E", "stock": 5000},        # 1500 days, shown as 999
+        {"id": "empty", "name": "F", "sku": "F", "stock": 0},
+    ]
+    SOLD = {"just-low": 300, "just-excess": 300, "healthy": 150, "slow": 1, "empty": 4}
+
+    def test_matches_per_product_loop(self):
+        result = inventory_turnover(pd.DataFrame(self.PRODUCTS), pd.Series(self.SOLD, dtype="float64"), 30)
+        actual = result[["product_id", "units_sold", "turnover_rate", "days_of_stock", "status"]].to_dict("records")
+        assert actual == old_turnover(self.PRODUCTS, self.SOLD, 30)
+
+    def test_status_uses_unrounded_days_of_stock(self):
+        result = inventory_turnover(pd.DataFrame(self.PRODUCTS), pd.Series(self.SOLD, dtype="float64"), 30)
+        rows = result.set_index("product_id")
+        assert (rows.loc["just-low", "days_of_stock"], rows.loc["just-low", "status"]) == (30, "low")
+        assert (rows.loc["just-excess", "days_of_stock"], rows.loc["just-excess", "status"]) == (90, "excess")
+        assert (rows.loc["slow", "days_of_stock"], rows.loc["slow", "status"]) == (999, "excess")
@@ -0,0 +1,62 @@
+"""
+Streaming CSV uploads: rows parsed off the event loop, in batches
+"""
+from tempfile import SpooledTemporaryFile
+import asyncio
+import csv
+import threading
+
+import pytest
+from fastapi import UploadFile
+
+from core.bulk_import import csv_rows
+
+CSV = "\ufeffpostcode,suburb\r\n2000,Sydney\r\n2010,\"Surry Hills, East\"\r\n5000,Adelaide\r\n".encode("utf-8")
+
+
+def upload(data: bytes) -> UploadFile:
+    spooled = SpooledTemporaryFile(max_size=16)  # Rolls over to disk like a large upload
+    spooled.write(data)
+    return UploadFile(spooled, filename="suburbs.csv")
+
+
+async def read_all(file, **kwargs):
+    async with csv_rows(file, **kwargs) as rows:
+        return [row async for row in rows]
+
+
+class TestCsvRows:
+    @pytest.mark.parametrize("batch_rows", [1, 2, 1000])
+    def test_rows_in_order_whatever_the_batch_size(self, batch_rows):
+        rows = asyncio.run(read_all(upload(CSV), batch_rows=batch_rows))
+        assert rows == [
+            {"postcode": "2000", "suburb": "Sydney"},
+            {"postcode": "2010", "suburb": "Surry Hills, East"},
+            {"postcode": "5000", "suburb": "Adelaide"},
+        ]
+
+    def test_parsing_runs_in_a_worker_thread(self, monkeypatch):
+        threads = []
+        reader_next = csv.DictReader.__next__
+
+        def recording_next(self):
+            threads.append(threading.get_ident())
+            return reader_next(self)
+        monkeypatch.setattr(csv.DictReader, "__next__", recording_next)
+
+        async def run():
+            rows = await read_all(upload(CSV), batch_rows=2)
+            return rows, threading.get_ident()
+        rows, loop_thread = asyncio.run(run())
+        assert len(rows) == 3
+        assert threads and loop_thread not in threads
+
+    def test_upload_stays_open_and_can_be_read_again(self):
+        file = upload(CSV)
+        assert len(asyncio.run(read_all(file))) == 3
+        assert not file.file.closed
+        assert len(asyncio.run(read_all(file))) == 3
+
+    def test_invalid_utf8_raises(self):
+        with pytest.raises(UnicodeDecodeError):
+            asyncio.run(read_all(upload(b"postcode,suburb\n2000,Caf\xe9\n")))
@@ -0,0 +1,127 @@
+"""
+Cart endpoints: version-guarded writes and the stock holds that follow them
+
+mongomock returns no document from find_one_and_update when the update changes a
+field of the filter (every cart write bumps `version`), so successful writes are
+checked by running their pipelines through an aggregation instead.
+"""
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+
+
+@pytest.fixture
+def client(db, monkeypatch):
+    monkeypatch.setattr(server, "db", db)
+    monkeypatch.setattr(server.app.router, "on_startup", [])
+    return TestClient(server.app)
+
+
+def line(product_id, quantity, price=5.0):
+    return {"product_id": product_id, "name": product_id, "price": price, "quantity": quantity, "line_total": quantity * price}
+
+
+def seed(db, version=3, stock=10):
+    """A cart at `version` holding 2 × p1 and 1 × p2, with matching holds"""
+    asyncio.run(db.products.insert_many([
+        {"id": "p1", "name": "Mug", "price": 5.0, "stock": stock, "reserved": 2},
+        {"id": "p2", "name": "Bowl", "price": 5.0, "stock": stock, "reserved": 1},
+    ]))
+    asyncio.run(db.carts.insert_one({
+        "id": "c1", "items": [line("p1", 2), line("p2", 1)], "subtotal": 15.0, "item_count": 3, "total": 15.0, "version": version
+    }))
+    asyncio.run(db.stock_reservations.insert_many([
+        {"cart_id": "c1", "product_id": "p1", "quantity": 2, "reserved": 2},
+        {"cart_id": "c1", "product_id": "p2", "quantity": 1, "reserved": 1},
+    ]))
+
+
+def reserved(db, product_id="p1"):
+    return asyncio.run(db.products.find_one({"id": product_id}))["reserved"]
+
+
+def held(db, product_id="p1"):
+    hold = asyncio.run(db.stock_reservations.find_one({"cart_id": "c1", "product_id": product_id}))
+    return hold["quantity"] if hold else 0
+
+
+class TestAddToCart:
+    def test_stale_version_is_rejected_and_gives_the_hold_back(self, db, client):
+        seed(db)
+        response = client.post("/api/cart/c1/add", json={"product_id": "p1", "quantity": 3, "version": 1})
+        assert response.status_code == 409
+        assert response.json()["detail"]["version"] == 3
+        assert reserved(db) == 2
+        assert held(db) == 2
+
+    def test_new_product_with_stale_version_leaves_no_hold(self, db, client):
+        seed(db)
+        asyncio.run(db.products.insert_one({"id": "p3", "name": "Jug", "price": 9.0, "stock": 4}))
+        response = client.post("/api/cart/c1/add", json={"product_id": "p3", "quantity": 1, "version": 2})
+        assert response.status_code == 409
+        assert reserved(db, "p3") == 0
+        assert held(db, "p3") == 0
+
+    def test_missing_cart_with_version_is_404_and_gives_the_hold_back(self, db, client):
+        seed(db)
+        response = client.post("/api/cart/other/add", json={"product_id": "p1", "quantity": 1, "version": 1})
+        assert response.status_code == 404
+        assert reserved(db) == 2
+
+    @pytest.mark.parametrize("quantity", [0, -5])
+    def test_non_positive_quantity_is_rejected(self, db, client, quantity):
+        seed(db)
+        response = client.post("/api/cart/c1/add", json={"product_id": "p1", "quantity": quantity})
+        assert response.status_code == 400
+        assert reserved(db) == 2
+        assert held(db) == 2
+
+    def test_out_of_stock_is_409_without_touching_the_cart(self, db, client):
+        seed(db, stock=3)
+        response = client.post("/api/cart/c1/add", json={"product_id": "p1", "quantity": 2})
+        assert response.status_code == 409
+        assert response.json()["detail"]["available"] == 1
+        assert asyncio.run(db.carts.find_one({"id": "c1"}))["version"] == 3
+
+
+class TestUpdateCartItem:
+    def test_stale_version_puts_the_hold_back_to_the_cart_line(self, db, client):
+        seed(db)
+        response = client.put("/api/cart/c1/update", json={"product_id": "p1", "quantity": 5, "version": 2})
+        assert response.status_code == 409
+        assert held(db) == 2
+        assert reserved(db) == 2
+
+
+class TestRemoveFromCart:
+    def test_stale_version_keeps_line_and_hold(self, db, client):
+        seed(db)
+        response = client.delete("/api/cart/c1/remove/p1", params={"version": 1})
+        assert response.status_code == 409
+        assert len(asyncio.run(db.carts.find_one({"id": "c1"}))["items"]) == 2
+        assert held(db) == 2
+        assert reserved(db) == 2
+
+
+class TestCartPipelines:
+    def run(self, db, pipeline):
+        return asyncio.run(db.carts.aggregate([{"$match": {"id": "c1"}}, {"$project": {"_id": 0}}] + pipeline).to_list(None))[0]
+
+    def test_remove_line_recomputes_totals_and_bumps_version(self, db):
+        seed(db)
+        cart = self.run(db, server._cart_line_remove("p1"))
+        assert [i["product_id"] for i in cart["items"]] == ["p2"]
+        assert (cart["subtotal"], cart["item_count"], cart["total"], cart["version"]) == (5.0, 1, 5.0, 4)
+
+    def test_removing_a_missing_line_keeps_items(self, db):
+        seed(db)
+        cart = self.run(db, server._cart_line_remove("p9"))
+        assert (cart["subtotal"], cart["item_count"], cart["version"]) == (15.0, 3, 4)
+
+    def test_totals_start_version_at_one(self, db):
+        asyncio.run(db.carts.insert_one({"id": "c1", "items": [line("p1", 3, price=2.5)]}))
+        cart = self.run(db, server._cart_totals_stages())
+        assert (cart["subtotal"], cart["item_count"], cart["total"], cart["version"]) == (7.5, 3, 7.5, 1)
@@ -0,0 +1,57 @@
+"""
+Per-store sequence counters (order, POS, quote, return and PO numbers)
+"""
+import asyncio
+
+from core import counters
+from core.counters import next_sequence
+
+
+class TestNextSequence:
+    """Numbers are allocated atomically per (store, sequence)"""
+
+    def test_numbers_are_sequential(self, db):
+        async def run():
+            return [await next_sequence(db, "store-a", "orders") for _ in range(5)]
+        assert asyncio.run(run()) == [1, 2, 3, 4, 5]
+
+    def test_stores_and_sequences_are_independent(self, db):
+        async def run():
+            return [
+                await next_sequence(db, "store-a", "orders"),
+                await next_sequence(db, "store-b", "orders"),
+                await next_sequence(db, "store-a", "quotes"),
+                await next_sequence(db, "store-a", "orders"),
+            ]
+        assert asyncio.run(run()) == [1, 1, 1, 2]
+
+    def test_seed_continues_after_legacy_numbers(self, db):
+        calls = []
+
+        async def seed():
+            calls.append(1)
+            return 1200
+
+        async def run():
+            return [await next_sequence(db, "store-a", "orders", seed=seed) for _ in range(3)]
+        assert asyncio.run(run()) == [1201, 1202, 1203]
+        assert len(calls) == 1, "The seed is only read when the counter is created"
+
+    def test_concurrent_allocations_are_unique(self, db):
+        async def run():
+            await next_sequence(db, "store-a", "orders")
+            return await asyncio.gather(*[next_sequence(db, "store-a", "orders") for _ in range(50)])
+        numbers = asyncio.run(run())
+        assert sorted(numbers) == list(range(2, 52))
+
+    def test_block_reservation_hands_out_numbers_locally(self, db):
+        counters._blocks.clear()
+        counters._locks.clear()
+
+        async def run():
+            numbers = [await next_sequence(db, "store-a", "pos", block_size=10) for _ in range(12)]
+            doc = await db.counters.find_one({"_id": "store-a:pos"})
+            return numbers, doc["value"]
+        numbers, reserved = asyncio.run(run())
+        assert numbers == list(range(1, 13))
+        assert reserved == 20, "Two blocks of ten were reserved"
@@ -0,0 +1,92 @@
+"""
+Customer lifetime stats on order changes: which customer an order counts for
+"""
+import asyncio
+from types import SimpleNamespace
+
+from core.customer_stats import record_customer_change
+from core.database import DEFAULT_STORE_ID
+
+
+class RecordingCustomers:
+    """The customers collection, recording stats updates instead of running them (mongomock has no $round)"""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.updates = []
+
+    def find(self, *args, **kwargs):
+        return self.collection.find(*args, **kwargs)
+
+    async def update_one(self, query, pipeline):
+        stats = next(stage["$set"] for stage in pipeline if "total_orders" in stage["$set"])
+        self.updates.append((
+            query,
+            tuple(stats[field]["$add"][1] for field in ("total_orders", "total_spent", "refunded_amount")),
+            "last_order_at" in stats
+        ))
+
+
+def change(db, customers, before=None, after=None):
+    if customers:
+        asyncio.run(db.customers.insert_many(customers))
+    recorder = RecordingCustomers(db.customers)
+    asyncio.run(record_customer_change(SimpleNamespace(customers=recorder), before, after))
+    return recorder.updates
+
+
+def order(email="jo@example.com", store_id="s1", **fields):
+    return {"id": "o1", "customer_email": email, "store_id": store_id, "status": "paid", "total": 40,
+            "created_at": "2026-05-01T10:00:00Z", **fields}
+
+
+class TestRecordCustomerChange:
+    def test_new_order_counts_for_its_store(self, db):
+        updates = change(db, [{"email": "jo@example.com", "store_id": "s1"}], after=order())
+        assert updates == [({"email": "jo@example.com", "store_id": "s1"}, (1, 40, 0), True)]
+
+    def test_status_change_applies_the_difference(self, db):
+        updates = change(db, [], before=order(), after=order(status="cancelled"))
+        assert updates == [({"email": "jo@example.com", "store_id": "s1"}, (-1, -40, 0), False)]
+
+    def test_unchanged_stats_write_nothing(self, db):
+        assert change(db, [], before=order(), after=order(notes="gift")) == []
+
+    def test_guest_orders_are_ignored(self, db):
+        assert change(db, [], after=order(email="pos@store.local")) == []
+
+    def test_storeless_order_goes_to_the_only_matching_customer(self, db):
+        updates = change(db, [{"email": "jo@example.com", "store_id": "s2"}], after=order(store_id=None))
+        assert updates == [({"email": "jo@example.com", "store_id": "s2"}, (1, 40, 0), True)]
+
+    def test_storeless_order_for_a_pre_store_customer_uses_the_default_store(self, db):
+        updates = change(db, [{"email": "jo@example.com"}], after=order(store_id=None))
+        assert updates == [({"email": "jo@example.com"}, (1, 40, 0), True)]
+
+    def test_storeless_order_with_customers_in_several_stores_is_skipped(self, db):
+        customers = [{"email": "jo@example.com", "store_id": "s1"}, {"email": "jo@example.com", "store_id": "s2"}]
+        assert change(db, customers, after=order(store_id=None)) == []
+        assert change(db, [], before=order(store_id=None), after=order(store_id=None, status="refunded")) == []
+
+    def test_email_change_moves_the_stats(self, db):
+        updates = change(db, [], before=order(payment_status="partial_refund", refund_amount=5),
+                         after=order(email="sam@example.com", payment_status="partial_refund", refund_amount=5))
+        assert updates == [
+            ({"email": "jo@example.com", "store_id": "s1"}, (-1, -40, -5), False),
+            ({"email": "sam@example.com", "store_id": "s1"}, (1, 40, 5), True),
+        ]
+
+    def test_store_change_moves_the_stats(self, db):
+        updates = change(db, [], before=order(), after=order(store_id=DEFAULT_STORE_ID))
+        assert updates == [
+            ({"email": "jo@example.com", "store_id": "s1"}, (-1, -40, 0), False),
+            ({"email": "jo@example.com", "store_id": {"$in": [DEFAULT_STORE_ID, None]}}, (1, 40, 0), True),
+        ]
+
+    def test_moving_a_cancelled_order_only_touches_the_new_customer_dates(self, db):
+        updates = change(db, [], before=order(status="cancelled"), after=order(email="sam@example.com", status="cancelled"))
+        assert updates == [({"email": "sam@example.com", "store_id": "s1"}, (0, 0, 0), True)]
+
+    def test_deleted_order_is_removed(self, db):
+        updates = change(db, [], before=order())
+        assert updates == [({"email": "jo@example.com", "store_id": "s1"}, (-1, -40, 0), False)]
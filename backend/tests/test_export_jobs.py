@@ -0,0 +1,106 @@
+"""
+Background export jobs: claims, failure handling and the periodic sweep
+"""
+from datetime import datetime, timezone, timedelta
+import asyncio
+import gzip
+
+from core import export_jobs
+from core.export_jobs import resume_export_jobs, run_export_job
+
+
+def job(job_id, status, **fields):
+    now = datetime.now(timezone.utc)
+    return {"id": job_id, "report": "orders", "format": "csv", "params": {}, "store_id": None,
+            "status": status, "processed": 0, "progress": 0, "created_at": now, "updated_at": now, **fields}
+
+
+class TestRunExportJob:
+    def test_unexpected_error_fails_the_job_and_removes_the_file(self, db, tmp_path, monkeypatch):
+        monkeypatch.setattr(export_jobs, "EXPORTS_DIR", tmp_path)
+
+        async def broken_chunks(report, docs, format):
+            yield b"id,total\n"
+            raise KeyError("total")
+        monkeypatch.setattr(export_jobs, "report_chunks", broken_chunks)
+        asyncio.run(db.orders.insert_one({"id": "o1"}))
+        asyncio.run(db.export_jobs.insert_one(job("j1", "queued")))
+
+        asyncio.run(run_export_job(db, db, "j1"))
+
+        saved = asyncio.run(db.export_jobs.find_one({"id": "j1"}))
+        assert saved["status"] == "failed"
+        assert "total" in saved["error"]
+        assert list(tmp_path.iterdir()) == []
+
+
+    def test_worker_that_lost_its_claim_leaves_the_new_attempt_alone(self, db, tmp_path, monkeypatch):
+        monkeypatch.setattr(export_jobs, "EXPORTS_DIR", tmp_path)
+
+        async def chunks(report, docs, format):
+            yield b"id\n"
+            # Requeued as stalled and claimed by another worker, which is writing its own file
+            await db.export_jobs.update_one({"id": "j1"}, {"$set": {"status": "running", "attempt": "other"}})
+            (tmp_path / "j1.csv.gz.other.part").write_bytes(b"theirs")
+            yield b"o1\n"
+        monkeypatch.setattr(export_jobs, "report_chunks", chunks)
+        asyncio.run(db.orders.insert_one({"id": "o1"}))
+        asyncio.run(db.export_jobs.insert_one(job("j1", "queued")))
+
+        asyncio.run(run_export_job(db, db, "j1"))
+
+        saved = asyncio.run(db.export_jobs.find_one({"id": "j1"}))
+        assert (saved["status"], saved["attempt"]) == ("running", "other")
+        assert [p.name for p in tmp_path.iterdir()] == ["j1.csv.gz.other.part"]
+
+    def test_completed_job_has_its_file(self, db, tmp_path, monkeypatch):
+        monkeypatch.setattr(export_jobs, "EXPORTS_DIR", tmp_path)
+
+        async def chunks(report, docs, format):
+            async for doc in docs:
+                yield f"{doc['id']}\n".encode()
+        monkeypatch.setattr(export_jobs, "report_chunks", chunks)
+        asyncio.run(db.orders.insert_many([{"id": "o1"}, {"id": "o2"}]))
+        asyncio.run(db.export_jobs.insert_one(job("j1", "queued")))
+
+        asyncio.run(run_export_job(db, db, "j1"))
+
+        saved = asyncio.run(db.export_jobs.find_one({"id": "j1"}))
+        path = tmp_path / "j1.csv.gz"
+        assert (saved["status"], saved["processed"], saved["size"]) == ("completed", 2, path.stat().st_size)
+        assert gzip.decompress(path.read_bytes()) == b"o1\no2\n"
+        assert [p.name for p in tmp_path.iterdir()] == ["j1.csv.gz"]
+
+
+class TestResumeExportJobs:
+    def test_expired_files_are_removed(self, db, tmp_path, monkeypatch):
+        monkeypatch.setattr(export_jobs, "EXPORTS_DIR", tmp_path)
+        past = datetime.now(timezone.utc) - timedelta(hours=1)
+        asyncio.run(db.export_jobs.insert_many([
+            job("old", "completed", expires_at=past),
+            job("new", "completed", expires_at=past + timedelta(days=1)),
+        ]))
+        for job_id in ("old", "new"):
+            export_jobs.export_path({"id": job_id, "format": "csv"}).write_bytes(b"x")
+
+        asyncio.run(resume_export_jobs(db, db))
+
+        assert asyncio.run(db.export_jobs.find_one({"id": "old"}))["status"] == "expired"
+        assert asyncio.run(db.export_jobs.find_one({"id": "new"}))["status"] == "completed"
+        assert [p.name for p in tmp_path.iterdir()] == ["new.csv.gz"]
+
+    def test_jobs_running_in_this_process_are_not_requeued(self, db, monkeypatch):
+        stalled = datetime.now(timezone.utc) - timedelta(minutes=export_jobs.EXPORT_STALL_MINUTES + 1)
+        asyncio.run(db.export_jobs.insert_many([
+            job("mine", "running", updated_at=stalled),
+            job("dead", "running", updated_at=stalled),
+        ]))
+        started = []
+        monkeypatch.setattr(export_jobs, "_active_ids", {"mine"})
+        monkeypatch.setattr(export_jobs, "_start", lambda db, source_db, job_id: started.append(job_id))
+
+        asyncio.run(resume_export_jobs(db, db))
+
+        assert asyncio.run(db.export_jobs.find_one({"id": "mine"}))["status"] == "running"
+        assert asyncio.run(db.export_jobs.find_one({"id": "dead"}))["status"] == "queued"
+        assert started == ["dead"]
@@ -0,0 +1,197 @@
+"""
+Background import jobs: byte-offset checkpoints, claims, resuming, failure handling and the periodic sweep
+"""
+from datetime import datetime, timezone, timedelta
+from types import SimpleNamespace
+import asyncio
+import csv
+import io
+
+import pytest
+
+from core import import_jobs
+from core.import_jobs import _Lines, _stage_upload, resume_import_jobs, run_import_job
+
+CSV = (
+    "\ufeffsku,name,description\r\n"
+    "A1,Mug,plain\r\n"
+    'B2,Bowl,"two\r\nlines, and a comma"\r\n'
+    'C3,"Cup ""large""",café\r\n'
+    'D4,Plate,"three\nshort\nlines"\r\n'
+    "E5,Jug,last\r\n"
+).encode("utf-8")
+
+
+def record_offsets(data: bytes):
+    """(record, offset after it) for every record of the file"""
+    lines = _Lines(io.BytesIO(data))
+    return [(record, lines.offset) for record in csv.reader(lines)]
+
+
+class FakeImporter:
+    """Collects rows, writing a batch every `batch_size` rows"""
+
+    def __init__(self, batch_size=2, fail_on=None, on_row=None):
+        self.batch_size = batch_size
+        self.fail_on = fail_on
+        self.on_row = on_row
+        self.rows, self._chunk = [], []
+        self.created = self.updated = self.error_count = self.batches = 0
+        self.errors = []
+
+    async def add_row(self, row_num, row):
+        if row["sku"] == self.fail_on:
+            raise RuntimeError(f"importer broke on {row['sku']}")
+        if self.on_row:
+            await self.on_row(row_num, row)
+        self._chunk.append((row_num, row["sku"]))
+        if len(self._chunk) >= self.batch_size:
+            await self.flush()
+        return True
+
+    async def flush(self):
+        if self._chunk:
+            self.rows.extend(self._chunk)
+            self.created += len(self._chunk)
+            self._chunk = []
+            self.batches += 1
+
+
+@pytest.fixture
+def imports(tmp_path, monkeypatch):
+    """Staged files go to a temporary directory; jobs of kind "fake" use the importer set on it"""
+    monkeypatch.setattr(import_jobs, "IMPORTS_DIR", tmp_path)
+    handler = SimpleNamespace(dir=tmp_path, importer=None)
+
+    async def factory(database, job):
+        return handler.importer
+    monkeypatch.setitem(import_jobs.IMPORT_HANDLERS, "fake", factory)
+    return handler
+
+
+def queue_job(db, imports, importer, checkpoint=None):
+    imports.importer = importer
+    path = imports.dir / "j1.csv"
+    path.write_bytes(CSV)
+    staged = _stage_upload(SimpleNamespace(file=io.BytesIO(CSV)), imports.dir / "staged.csv")
+    now = datetime.now(timezone.utc)
+    asyncio.run(db.import_jobs.insert_one({
+        "id": "j1", "kind": "fake", "options": {}, "columns": staged["columns"], "size": staged["size"],
+        "status": "queued", "processed": 0, "created": 0, "updated": 0, "errors": 0, "error_details": [],
+        "checkpoint": checkpoint or {"offset": staged["offset"], "row": 1},
+        "created_at": now, "updated_at": now, "started_at": None
+    }))
+    return path
+
+
+def saved(db, job_id="j1"):
+    return asyncio.run(db.import_jobs.find_one({"id": job_id}))
+
+
+class TestLines:
+    def test_offsets_end_each_record_across_multi_line_fields(self):
+        offsets = record_offsets(CSV)
+        assert [record[0] for record, _ in offsets] == ["sku", "A1", "B2", "C3", "D4", "E5"]
+        assert offsets[0][0] == ["sku", "name", "description"], "The BOM is not part of the first column"
+        assert offsets[2][0][2] == "two\r\nlines, and a comma"
+        for record, offset in offsets[:-1]:
+            assert CSV[offset - 2:offset] == b"\r\n"
+        assert offsets[-1][1] == len(CSV)
+
+    def test_reading_from_any_offset_continues_with_the_next_record(self):
+        offsets = record_offsets(CSV)
+        for i, (_, offset) in enumerate(offsets):
+            f = io.BytesIO(CSV)
+            f.seek(offset)
+            assert list(csv.reader(_Lines(f))) == [record for record, _ in offsets[i + 1:]]
+
+    def test_stage_upload_returns_header_and_data_offset(self, tmp_path):
+        staged = _stage_upload(SimpleNamespace(file=io.BytesIO(CSV)), tmp_path / "upload.csv")
+        assert staged == {"size": len(CSV), "columns": ["sku", "name", "description"], "offset": CSV.index(b"A1")}
+
+
+class TestRunImportJob:
+    def test_imports_every_row_with_its_row_number(self, db, imports):
+        importer = FakeImporter()
+        path = queue_job(db, imports, importer)
+        asyncio.run(run_import_job(db, "j1"))
+        assert importer.rows == [(2, "A1"), (3, "B2"), (4, "C3"), (5, "D4"), (6, "E5")]
+        job = saved(db)
+        assert job["status"] == "completed"
+        assert job["checkpoint"] == {"offset": len(CSV), "row": 6}
+        assert not path.exists()
+
+    def test_resumes_after_the_checkpoint(self, db, imports):
+        after_b2 = record_offsets(CSV)[2][1]
+        importer = FakeImporter()
+        queue_job(db, imports, importer, checkpoint={"offset": after_b2, "row": 3})
+        asyncio.run(run_import_job(db, "j1"))
+        assert importer.rows == [(4, "C3"), (5, "D4"), (6, "E5")]
+
+    def test_unexpected_error_fails_the_job_and_removes_the_file(self, db, imports):
+        path = queue_job(db, imports, FakeImporter(fail_on="C3"))
+        asyncio.run(run_import_job(db, "j1"))
+        job = saved(db)
+        assert job["status"] == "failed"
+        assert "importer broke on C3" in job["error"]
+        assert job["checkpoint"]["row"] == 3, "Rows written before the failure stay checkpointed"
+        assert not path.exists()
+
+    def test_requeued_job_keeps_its_file(self, db, imports):
+        async def requeue(row_num, row):
+            if row["sku"] == "B2":  # Another process decided this job had stalled
+                await db.import_jobs.update_one({"id": "j1"}, {"$set": {"status": "queued"}})
+        path = queue_job(db, imports, FakeImporter(on_row=requeue))
+        asyncio.run(run_import_job(db, "j1"))
+        assert saved(db)["status"] == "queued"
+        assert path.exists()
+
+    def test_worker_that_lost_its_claim_stops_without_touching_the_new_attempt(self, db, imports):
+        async def reclaim(row_num, row):
+            if row["sku"] == "B2":  # Requeued as stalled and claimed by another worker
+                await db.import_jobs.update_one({"id": "j1"}, {"$set": {"status": "running", "attempt": "other"}})
+        importer = FakeImporter(on_row=reclaim)
+        path = queue_job(db, imports, importer)
+        asyncio.run(run_import_job(db, "j1"))
+        job = saved(db)
+        assert importer.rows == [(2, "A1"), (3, "B2")]
+        assert (job["status"], job["attempt"]) == ("running", "other")
+        assert job["checkpoint"] == {"offset": record_offsets(CSV)[0][1], "row": 1}, "Checkpoints are the new worker's"
+        assert path.exists()
+
+    def test_worker_that_lost_its_claim_does_not_fail_the_job(self, db, imports):
+        async def reclaim_and_break(row_num, row):
+            if row["sku"] == "B2":
+                await db.import_jobs.update_one({"id": "j1"}, {"$set": {"status": "running", "attempt": "other"}})
+                raise RuntimeError("connection reset")
+        path = queue_job(db, imports, FakeImporter(on_row=reclaim_and_break))
+        asyncio.run(run_import_job(db, "j1"))
+        assert saved(db)["status"] == "running"
+        assert path.exists()
+
+    def test_cancelled_job_removes_its_file(self, db, imports):
+        async def cancel(row_num, row):
+            if row["sku"] == "B2":
+                await db.import_jobs.update_one({"id": "j1"}, {"$set": {"status": "cancelled"}})
+        path = queue_job(db, imports, FakeImporter(on_row=cancel))
+        asyncio.run(run_import_job(db, "j1"))
+        assert saved(db)["status"] == "cancelled"
+        assert not path.exists()
+
+
+class TestResumeImportJobs:
+    def test_jobs_running_in_this_process_are_not_requeued(self, db, monkeypatch):
+        stalled = datetime.now(timezone.utc) - timedelta(minutes=import_jobs.IMPORT_STALL_MINUTES + 1)
+        asyncio.run(db.import_jobs.insert_many([
+            {"id": "mine", "status": "running", "updated_at": stalled},
+            {"id": "dead", "status": "running", "updated_at": stalled},
+        ]))
+        started = []
+        monkeypatch.setattr(import_jobs, "_active_ids", {"mine"})
+        monkeypatch.setattr(import_jobs, "_start", lambda db, job_id: started.append(job_id))
+
+        asyncio.run(resume_import_jobs(db))
+
+        assert saved(db, "mine")["status"] == "running"
+        assert saved(db, "dead")["status"] == "queued"
+        assert started == ["dead"]
@@ -0,0 +1,144 @@
+"""
+Stock reservation ledger: holds, their undo paths and the product `reserved` counter
+"""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from datetime import datetime, timezone, timedelta
+
+from core import inventory
+from core.inventory import claim_holds, hold_stock, release_expired_holds, release_holds, unhold_stock
+
+
+def product(db, product_id="p1"):
+    return asyncio.run(db.products.find_one({"id": product_id}))
+
+
+def hold(db, cart_id="c1", product_id="p1"):
+    return asyncio.run(db.stock_reservations.find_one({"cart_id": cart_id, "product_id": product_id}))
+
+
+class TestHoldStock:
+    """Holds only succeed while free stock covers them"""
+
+    def test_add_holds_accumulate(self, db):
+        asyncio.run(db.products.insert_one({"id": "p1", "stock": 5}))
+        assert asyncio.run(hold_stock(db, "c1", "p1", 2)) == 2
+        assert asyncio.run(hold_stock(db, "c1", "p1", 1)) == 3
+        assert product(db)["reserved"] == 3
+        assert hold(db)["quantity"] == 3
+
+    def test_failed_add_leaves_no_hold(self, db):
+        asyncio.run(db.products.insert_one({"id": "p1", "stock": 2, "reserved": 1}))
+        with pytest.raises(HTTPException) as exc:
+            asyncio.run(hold_stock(db, "c1", "p1", 2))
+        assert exc.value.status_code == 409
+        assert exc.value.detail["available"] == 1
+        assert product(db)["reserved"] == 1
+        assert hold(db) is None
+
+    def test_failed_add_keeps_earlier_hold(self, db):
+        asyncio.run(db.products.insert_one({"id": "p1", "stock": 3}))
+        asyncio.run(hold_stock(db, "c1", "p1", 2))
+        with pytest.raises(HTTPException):
+            asyncio.run(hold_stock(db, "c1", "p1", 2))
+        assert hold(db)["quantity"] == 2
+        assert product(db)["reserved"] == 2
+
+    def test_hold_is_scoped_to_the_store(self, db):
+        asyncio.run(db.products.insert_one({"id": "p1", "stock": 5, "store_id": "s1"}))
+        with pytest.raises(HTTPException):
+            asyncio.run(hold_stock(db, "c1", "p1", 1, store_id="s2"))
+        assert asyncio.run(hold_stock(db, "c1", "p1", 1, store_id="s1")) == 1
+
+    def test_absolute_hold_sets_quantity(self, db):
+        asyncio.run(db.products.insert_one({"id": "p1", "stock": 5}))
+        asyncio.run(hold_stock(db, "c1", "p1", 4, absolute=True))
+        asyncio.run(hold_stock(db, "c1", "p1", 1, absolute=True))
+        assert hold(db)["quantity"] == 1
+        assert product(db)["reserved"] == 1
+
+    @pytest.mark.parametrize("quantity", [0, -2])
+    def test_non_positive_add_is_rejected(self, db, quantity):
+        asyncio.run(db.products.insert_one({"id": "p1", "stock": 5, "reserved": 3}))
+        with pytest.raises(HTTPException) as exc:
+            asyncio.run(hold_stock(db, "c1", "p1", quantity))
+        assert exc.value.status_code == 400
+        assert product(db)["reserved"] == 3, "Other carts' holds are untouched"
+        assert hold(db) is None
+
+    def test_absolute_hold_cannot_be_negative(self, db):
+        asyncio.run(db.products.insert_one({"id": "p1", "stock": 5}))
+        with pytest.raises(HTTPException):
+            asyncio.run(hold_stock(db, "c1", "p1", -1, absolute=True))
+
+    def test_release_gives_units_back(self, db):
+        asyncio.run(db.products.insert_one({"id": "p1", "stock": 5}))
+        asyncio.run(hold_stock(db, "c1", "p1", 3))
+        assert asyncio.run(release_holds(db, "c1")) == 3
+        assert product(db)["reserved"] == 0
+        assert hold(db) is None
+
+
+class TestUnholdStock:
+    """Giving back units held for a cart write that did not happen"""
+
+    def test_unhold_works_when_oversold(self, db):
+        asyncio.run(db.products.insert_one({"id": "p1", "stock": 5}))
+        asyncio.run(hold_stock(db, "c1", "p1", 3))
+        # Stock sold elsewhere below what is held
+        asyncio.run(db.products.update_one({"id": "p1"}, {"$set": {"stock": 1}}))
+        assert asyncio.run(unhold_stock(db, "c1", "p1", 3)) == 3
+        assert product(db)["reserved"] == 0
+        assert hold(db) is None, "No empty hold is left behind"
+
+    def test_unhold_part_of_a_hold(self, db):
+        asyncio.run(db.products.insert_one({"id": "p1", "stock": 5}))
+        asyncio.run(hold_stock(db, "c1", "p1", 3))
+        assert asyncio.run(unhold_stock(db, "c1", "p1", 1)) == 1
+        assert hold(db)["quantity"] == 2
+        assert product(db)["reserved"] == 2
+
+    def test_unhold_after_release_is_a_no_op(self, db):
+        asyncio.run(db.products.insert_one({"id": "p1", "stock": 5}))
+        asyncio.run(hold_stock(db, "c1", "p1", 2))
+        asyncio.run(release_holds(db, "c1"))
+        assert asyncio.run(unhold_stock(db, "c1", "p1", 2)) == 0
+        assert product(db)["reserved"] == 0
+
+
+class TestCrashBetweenWrites:
+    """A hold whose counter update never happened gives nothing back"""
+
+    def crash_before_reserving(self, db, monkeypatch):
+        async def crash(*args, **kwargs):
+            raise ConnectionError("process died")
+        monkeypatch.setattr(inventory, "_reserve", crash)
+        with pytest.raises(ConnectionError):
+            asyncio.run(hold_stock(db, "c1", "p1", 2))
+        monkeypatch.undo()
+
+    def test_sweeper_does_not_release_unreserved_units(self, db, monkeypatch):
+        asyncio.run(db.products.insert_one({"id": "p1", "stock": 5, "reserved": 3}))
+        self.crash_before_reserving(db, monkeypatch)
+        assert hold(db)["quantity"] == 2 and hold(db)["reserved"] == 0
+        past = datetime.now(timezone.utc) - timedelta(minutes=1)
+        asyncio.run(db.stock_reservations.update_many({}, {"$set": {"expires_at": past}}))
+        assert asyncio.run(release_expired_holds(db)) == 1
+        assert product(db)["reserved"] == 3, "Other carts' holds stay reserved"
+
+    def test_later_add_only_counts_what_it_reserved(self, db, monkeypatch):
+        asyncio.run(db.products.insert_one({"id": "p1", "stock": 5}))
+        self.crash_before_reserving(db, monkeypatch)
+        asyncio.run(hold_stock(db, "c1", "p1", 1))
+        assert hold(db)["quantity"] == 3
+        assert product(db)["reserved"] == 1
+        assert asyncio.run(claim_holds(db, "c1", ["p1"])) == {"p1": 1}
+
+    def test_holds_from_before_the_field_count_in_full(self, db):
+        asyncio.run(db.products.insert_one({"id": "p1", "stock": 5, "reserved": 2}))
+        asyncio.run(db.stock_reservations.insert_one({"cart_id": "c1", "product_id": "p1", "quantity": 2}))
+        assert asyncio.run(release_holds(db, "c1")) == 2
+        assert product(db)["reserved"] == 0
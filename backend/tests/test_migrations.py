@@ -0,0 +1,90 @@
+"""
+One-off data migrations: the run-once marker and the backfills
+"""
+import asyncio
+
+from core import migrations
+from core.migrations import run_migrations
+
+
+class TestRunMigrations:
+    """Each migration runs once; a failed one is retried on the next run"""
+
+    def test_applied_migration_is_skipped(self, db, monkeypatch):
+        calls = []
+
+        async def migrate(database):
+            calls.append(1)
+            return 3
+        monkeypatch.setattr(migrations, "MIGRATIONS", [("m1", migrate)])
+        asyncio.run(run_migrations(db))
+        asyncio.run(run_migrations(db))
+        assert len(calls) == 1
+        marker = asyncio.run(db.migrations.find_one({"_id": "m1"}))
+        assert marker["status"] == "applied"
+        assert marker["count"] == 3
+
+    def test_any_failure_releases_the_marker(self, db, monkeypatch):
+        attempts = []
+
+        async def migrate(database):
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise KeyError("category_id")
+            return 0
+        monkeypatch.setattr(migrations, "MIGRATIONS", [("m1", migrate)])
+        asyncio.run(run_migrations(db))
+        marker = asyncio.run(db.migrations.find_one({"_id": "m1"}))
+        assert marker["status"] == "failed"
+        assert "category_id" in marker["error"]
+
+        asyncio.run(run_migrations(db))
+        assert len(attempts) == 2, "A failed migration is retried straight away"
+        assert asyncio.run(db.migrations.find_one({"_id": "m1"}))["status"] == "applied"
+
+
+class TestBackfillCustomerStats:
+    """Lifetime stats are recomputed per (store, email)"""
+
+    def seed(self, db, customers, orders):
+        asyncio.run(db.customers.insert_many(customers))
+        asyncio.run(db.orders.insert_many(orders))
+
+    def stats(self, db, store_id, email):
+        return asyncio.run(db.customers.find_one({"store_id": store_id, "email": email}, {"_id": 0}))
+
+    def test_same_email_in_two_stores_is_kept_apart(self, db):
+        self.seed(db, [
+            {"email": "jo@example.com", "store_id": "s1"},
+            {"email": "jo@example.com", "store_id": "s2"},
+        ], [
+            {"customer_email": "jo@example.com", "store_id": "s1", "total": 10, "status": "completed"},
+            {"customer_email": "jo@example.com", "store_id": "s1", "total": 30, "status": "completed"},
+            {"customer_email": "jo@example.com", "store_id": "s2", "total": 5, "status": "cancelled"},
+        ])
+        asyncio.run(migrations.backfill_customer_stats(db))
+        s1 = self.stats(db, "s1", "jo@example.com")
+        assert (s1["total_orders"], s1["total_spent"], s1["average_order_value"]) == (2, 40, 20)
+        s2 = self.stats(db, "s2", "jo@example.com")
+        assert (s2["total_orders"], s2["total_spent"]) == (0, 0)
+
+    def test_storeless_orders_go_to_the_only_matching_customer(self, db):
+        self.seed(db, [{"email": "jo@example.com", "store_id": "s1"}], [
+            {"customer_email": "jo@example.com", "store_id": "s1", "total": 10, "status": "completed"},
+            {"customer_email": "jo@example.com", "total": 15, "status": "completed"},
+        ])
+        asyncio.run(migrations.backfill_customer_stats(db))
+        s1 = self.stats(db, "s1", "jo@example.com")
+        assert (s1["total_orders"], s1["total_spent"]) == (2, 25)
+
+    def test_ambiguous_storeless_orders_are_skipped(self, db):
+        self.seed(db, [
+            {"email": "jo@example.com", "store_id": "s1"},
+            {"email": "jo@example.com", "store_id": "s2"},
+        ], [
+            {"customer_email": "jo@example.com", "store_id": "s1", "total": 10, "status": "completed"},
+            {"customer_email": "jo@example.com", "total": 99, "status": "completed"},
+        ])
+        asyncio.run(migrations.backfill_customer_stats(db))
+        assert self.stats(db, "s1", "jo@example.com")["total_spent"] == 10
+        assert "total_spent" not in self.stats(db, "s2", "jo@example.com")
@@ -0,0 +1,108 @@
+"""
+Order placement pipeline: conditional stock decrements and their compensation
+"""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from pymongo.errors import DuplicateKeyError
+
+from core import orders
+from core.customer_stats import customer_upsert
+from core.database import DEFAULT_STORE_ID
+from core.orders import place_order
+
+
+@pytest.fixture(autouse=True)
+def without_transactions(monkeypatch):
+    # mongomock is a standalone server: exercise the compensating path
+    monkeypatch.setattr(orders, "ORDER_TRANSACTIONS", "off")
+
+
+def seed_products(db, *products):
+    asyncio.run(db.products.insert_many([dict(p) for p in products]))
+
+
+def stock(db, product_id):
+    return asyncio.run(db.products.find_one({"id": product_id}))["stock"]
+
+
+def new_order(order_id="order-1", items=()):
+    return {"id": order_id, "order_number": "ORD-1001", "customer_email": "jo@example.com", "total": 10, "items": list(items)}
+
+
+class TestPlaceOrder:
+    """Stock is only taken when every line can be covered"""
+
+    def test_order_within_stock_decrements(self, db):
+        seed_products(db, {"id": "p1", "stock": 5}, {"id": "p2", "stock": 3})
+        asyncio.run(place_order(db, new_order(), [("p1", 2), ("p2", 3)]))
+        assert stock(db, "p1") == 3
+        assert stock(db, "p2") == 0
+        assert asyncio.run(db.orders.count_documents({"id": "order-1"})) == 1
+
+    def test_oversold_order_is_rejected(self, db):
+        seed_products(db, {"id": "p1", "stock": 5}, {"id": "p2", "stock": 1})
+        with pytest.raises(HTTPException) as exc:
+            asyncio.run(place_order(db, new_order(), [("p1", 2), ("p2", 2)]))
+        assert exc.value.status_code == 409
+        assert exc.value.detail["product_ids"] == ["p2"]
+        # The line that fitted was given back and no order was written
+        assert stock(db, "p1") == 5
+        assert stock(db, "p2") == 1
+        assert asyncio.run(db.orders.count_documents({})) == 0
+
+    def test_lines_for_the_same_product_are_combined(self, db):
+        seed_products(db, {"id": "p1", "stock": 3})
+        with pytest.raises(HTTPException):
+            asyncio.run(place_order(db, new_order(), [("p1", 2), ("p1", 2)]))
+        assert stock(db, "p1") == 3
+
+    def test_reserved_stock_is_not_available(self, db):
+        seed_products(db, {"id": "p1", "stock": 3, "reserved": 2})
+        with pytest.raises(HTTPException):
+            asyncio.run(place_order(db, new_order(), [("p1", 2)]))
+        assert stock(db, "p1") == 3
+
+    def test_untracked_and_backorder_products_can_oversell(self, db):
+        seed_products(db, {"id": "p1", "stock": 0, "track_inventory": False}, {"id": "p2", "stock": 0, "allow_backorder": True})
+        asyncio.run(place_order(db, new_order(), [("p1", 2), ("p2", 1)]))
+        assert stock(db, "p1") == -2
+        assert stock(db, "p2") == -1
+
+    def test_deleted_product_lines_are_skipped(self, db):
+        seed_products(db, {"id": "p1", "stock": 5})
+        asyncio.run(place_order(db, new_order(), [("p1", 1), ("gone", 1)]))
+        assert stock(db, "p1") == 4
+        assert asyncio.run(db.orders.count_documents({})) == 1
+
+    def test_failed_order_insert_restores_stock(self, db):
+        seed_products(db, {"id": "p1", "stock": 5})
+        asyncio.run(db.orders.insert_one({"_id": "taken"}))
+        order = {**new_order(), "_id": "taken"}
+        with pytest.raises(DuplicateKeyError):
+            asyncio.run(place_order(db, order, [("p1", 2)]))
+        assert stock(db, "p1") == 5
+
+
+
+class TestStoreScope:
+    """Orders placed for a store only touch that store's products and customers"""
+
+    def test_default_store_includes_products_without_store(self, db):
+        seed_products(db, {"id": "p1", "stock": 5}, {"id": "p2", "stock": 5, "store_id": DEFAULT_STORE_ID})
+        asyncio.run(place_order(db, {**new_order(), "store_id": DEFAULT_STORE_ID}, [("p1", 1), ("p2", 1)],
+                                store_id=DEFAULT_STORE_ID))
+        assert stock(db, "p1") == 4
+        assert stock(db, "p2") == 4
+
+    def test_other_store_products_are_not_touched(self, db):
+        seed_products(db, {"id": "p1", "stock": 5, "store_id": "other"}, {"id": "p2", "stock": 5, "store_id": "s1"})
+        asyncio.run(place_order(db, {**new_order(), "store_id": "s1"}, [("p1", 1), ("p2", 1)], store_id="s1"))
+        assert stock(db, "p1") == 5
+        assert stock(db, "p2") == 4
+
+    def test_customer_upsert_matches_legacy_default_store_customers(self):
+        query, pipeline = customer_upsert({"id": "c1", "email": "jo@example.com"}, new_order(), DEFAULT_STORE_ID)
+        assert query == {"email": "jo@example.com", "store_id": {"$in": [DEFAULT_STORE_ID, None]}}
+        assert pipeline[0]["$set"]["store_id"]["$cond"][2] == {"$literal": DEFAULT_STORE_ID}
@@ -0,0 +1,35 @@
+"""
+Platform KPI snapshot behind the admin dashboards
+"""
+import asyncio
+
+from core import platform_snapshot
+from core.platform_snapshot import get_platform_snapshot
+
+
+class TestPlatformSnapshot:
+    """The snapshot carries everything the admin stats endpoints return"""
+
+    def test_legacy_website_totals(self, db):
+        asyncio.run(db.websites.insert_many([
+            {"status": "active", "revenue": 10.5, "orders": 2, "products": 3, "customers": 4},
+            {"status": "suspended", "revenue": 5, "orders": 1, "products": 1, "customers": 1},
+        ]))
+        asyncio.run(db.users.insert_one({"id": "u1"}))
+        snapshot = asyncio.run(get_platform_snapshot(db))
+        assert snapshot["websites"] == {
+            "total": 2, "active": 1, "total_revenue": 15.5,
+            "total_orders": 3, "total_products": 4, "total_customers": 5
+        }
+        assert snapshot["metrics"]["total_accounts"] == 1
+
+    def test_no_websites(self, db):
+        snapshot = asyncio.run(get_platform_snapshot(db))
+        assert snapshot["websites"]["total"] == 0
+        assert snapshot["websites"]["total_revenue"] == 0
+
+    def test_snapshot_of_an_older_layout_is_recomputed(self, db):
+        asyncio.run(db.platform_snapshots.insert_one({"_id": platform_snapshot.SNAPSHOT_ID, "computed_at": None}))
+        snapshot = asyncio.run(get_platform_snapshot(db))
+        assert snapshot["schema"] == platform_snapshot.SNAPSHOT_SCHEMA
+        assert "websites" in snapshot
@@ -0,0 +1,117 @@
+"""
+Report cache: reuse within the refresh interval and a single rebuild for concurrent requests
+"""
+import asyncio
+
+import pytest
+
+from core import report_cache
+from core.report_cache import cached_report, invalidate_reports
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch):
+    monkeypatch.setattr(report_cache, "_entries", {})
+    monkeypatch.setattr(report_cache, "_locks", {})
+
+
+class Builder:
+    """Counts builds; each returns the build number after an optional pause"""
+
+    def __init__(self, delay=0, fail=False):
+        self.calls = 0
+        self.delay = delay
+        self.fail = fail
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("aggregation failed")
+        return self.calls
+
+
+class TestCachedReport:
+    def test_fresh_report_is_reused(self):
+        build = Builder()
+
+        async def run():
+            return [await cached_report(("segments", None), build) for _ in range(3)]
+        assert asyncio.run(run()) == [1, 1, 1]
+        assert build.calls == 1
+
+    def test_keys_are_cached_separately(self):
+        build = Builder()
+
+        async def run():
+            return [
+                await cached_report(("segments", "store-a"), build),
+                await cached_report(("segments", "store-b"), build),
+                await cached_report(("segments", "store-a"), build),
+            ]
+        assert asyncio.run(run()) == [1, 2, 1]
+
+    def test_stale_report_is_rebuilt(self):
+        build = Builder()
+
+        async def run():
+            first = await cached_report("report", build)
+            return first, await cached_report("report", build, max_age=0)
+        assert asyncio.run(run()) == (1, 2)
+
+    def test_refresh_rebuilds(self):
+        build = Builder()
+
+        async def run():
+            first = await cached_report("report", build)
+            refreshed = await cached_report("report", build, refresh=True)
+            return first, refreshed, await cached_report("report", build)
+        assert asyncio.run(run()) == (1, 2, 2)
+
+    def test_concurrent_requests_share_one_build(self):
+        build = Builder(delay=0.01)
+
+        async def run():
+            return await asyncio.gather(*[cached_report("report", build) for _ in range(5)])
+        assert asyncio.run(run()) == [1] * 5
+        assert build.calls == 1
+
+    def test_refresh_waiting_on_a_rebuild_reuses_it(self):
+        build = Builder(delay=0.01)
+
+        async def run():
+            return await asyncio.gather(*[cached_report("report", build, refresh=True) for _ in range(3)])
+        assert asyncio.run(run()) == [1, 1, 1], "The rebuild finished after these requests were made"
+        assert build.calls == 1
+
+    def test_failed_build_is_not_cached(self):
+        build = Builder(fail=True)
+
+        async def run():
+            with pytest.raises(RuntimeError):
+                await cached_report("report", build)
+            build.fail = False
+            return await cached_report("report", build)
+        assert asyncio.run(run()) == 2
+
+
+class TestInvalidateReports:
+    def test_by_name(self):
+        build = Builder()
+
+        async def run():
+            await cached_report(("segments", "a"), build)
+            await cached_report(("cohorts", "a", "monthly"), build)
+            invalidate_reports("segments")
+            return await cached_report(("segments", "a"), build), await cached_report(("cohorts", "a", "monthly"), build)
+        assert asyncio.run(run()) == (3, 2)
+
+    def test_everything(self):
+        build = Builder()
+
+        async def run():
+            await cached_report(("segments", "a"), build)
+            await cached_report("plain", build)
+            invalidate_reports()
+            return await cached_report(("segments", "a"), build), await cached_report("plain", build)
+        assert asyncio.run(run()) == (3, 4)
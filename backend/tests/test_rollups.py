@@ -0,0 +1,139 @@
+"""
+Sales rollups: rows maintained incrementally must equal rows rebuilt from the orders
+"""
+import asyncio
+import copy
+
+from core.database import DEFAULT_STORE_ID
+from core.rollups import rebuild_rollups, record_order_change
+
+
+def order(order_id, created_at, items, **fields):
+    total = sum(item["price"] * item["quantity"] for item in items)
+    return {"id": order_id, "created_at": created_at, "status": "pending", "total": total, "items": items, **fields}
+
+
+def item(product_id, quantity, price, **fields):
+    return {"product_id": product_id, "product_name": product_id.title(), "quantity": quantity, "price": price, **fields}
+
+
+def is_zero(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and round(value, 6) == 0
+
+
+def normalized(rows):
+    """Rows by id, without bookkeeping, zero counters and breakdown entries that no longer count"""
+    def clean(value):
+        if not isinstance(value, dict):
+            return round(value, 6) if isinstance(value, float) else value
+        cleaned = {k: clean(v) for k, v in value.items() if not is_zero(v)}
+        cleaned = {k: v for k, v in cleaned.items() if v != {}}
+        if not any(isinstance(v, (int, float, dict)) for v in cleaned.values()):
+            return {}  # Only labels left, e.g. {"channel": "pos"} once its orders were removed
+        return cleaned
+
+    result = {}
+    for row in rows:
+        row = clean({k: v for k, v in row.items() if k != "updated_at"})
+        if row:
+            result[row["_id"]] = row
+    return result
+
+
+class OrderLog:
+    """Apply order writes to the collection and to the rollups, as the order routes do"""
+
+    def __init__(self, db):
+        self.db = db
+
+    async def create(self, doc):
+        await self.db.orders.insert_one(copy.deepcopy(doc))
+        await record_order_change(self.db, after=doc)
+
+    async def update(self, order_id, **changes):
+        before = await self.db.orders.find_one({"id": order_id}, {"_id": 0})
+        after = {**before, **changes}
+        await self.db.orders.replace_one({"id": order_id}, copy.deepcopy(after))
+        await record_order_change(self.db, before, after)
+
+    async def delete(self, order_id):
+        before = await self.db.orders.find_one({"id": order_id}, {"_id": 0})
+        await self.db.orders.delete_one({"id": order_id})
+        await record_order_change(self.db, before=before)
+
+
+async def rows(db):
+    return normalized(await db.sales_rollups.find({}).to_list(None))
+
+
+class TestIncrementalMatchesRebuild:
+    def run(self, db, changes):
+        async def go():
+            await db.products.insert_many([
+                {"id": "mug", "category_id": "kitchen"}, {"id": "hat", "category_id": "apparel"}, {"id": "pen"}
+            ])
+            await db.categories.insert_many([{"id": "kitchen", "name": "Kitchen"}, {"id": "apparel", "name": "Apparel"}])
+            await changes(OrderLog(db))
+            incremental = await rows(db)
+            await rebuild_rollups(db)
+            return incremental, await rows(db)
+
+        incremental, rebuilt = asyncio.run(go())
+        assert incremental == rebuilt
+        return rebuilt
+
+    def test_new_orders(self, db):
+        async def changes(log):
+            await log.create(order("o1", "2026-03-01T09:15:00Z", [item("mug", 2, 12.5), item("hat", 1, 30)]))
+            await log.create(order("o2", "2026-03-01T09:40:00+00:00", [item("mug", 1, 12.5)], source="pos"))
+            await log.create(order("o3", "2026-03-02T23:59:00Z", [item("pen", 4, 1.25)], store_id="s2"))
+        built = self.run(db, changes)
+        day = built[f"{DEFAULT_STORE_ID}:2026-03-01"]
+        assert (day["revenue"], day["orders"], day["items"]) == (67.5, 2, 4)
+        assert day["channels"] == {"online": {"channel": "online", "revenue": 55, "orders": 1},
+                                   "pos": {"channel": "pos", "revenue": 12.5, "orders": 1}}
+        assert day["categories"]["kitchen"]["orders"] == 2
+        assert built["s2:2026-03-02"]["categories"]["uncategorized"]["quantity"] == 4
+
+    def test_status_changes_cancellation_and_refunds(self, db):
+        async def changes(log):
+            await log.create(order("o1", "2026-03-01T10:00:00Z", [item("mug", 2, 12.5)]))
+            await log.create(order("o2", "2026-03-01T11:00:00Z", [item("hat", 1, 30)]))
+            await log.create(order("o3", "2026-03-01T12:00:00Z", [item("pen", 2, 2)]))
+            await log.update("o1", status="shipped")
+            await log.update("o2", status="cancelled")
+            await log.update("o3", payment_status="partial_refund", refund_amount=1.5)
+            await log.update("o1", status="refunded", payment_status="refunded")
+        built = self.run(db, changes)
+        day = built[f"{DEFAULT_STORE_ID}:2026-03-01"]
+        assert (day["revenue"], day["orders"], day["refunds"]) == (4, 1, 26.5)
+        assert set(day["products"]) == {"pen"}
+
+    def test_edits_moves_and_deletes(self, db):
+        async def changes(log):
+            await log.create(order("o1", "2026-03-01T10:00:00Z", [item("mug", 2, 12.5), item("pen", 1, 2)]))
+            await log.create(order("o2", "2026-03-01T10:30:00Z", [item("hat", 1, 30)]))
+            await log.create(order("o3", "2026-03-03T08:00:00Z", [item("pen", 1, 2)]))
+            edited = [item("mug", 1, 12.5), item("hat", 2, 28, category_id="sale", category_name="Sale")]
+            await log.update("o1", items=edited, total=68.5)
+            await log.update("o2", created_at="2026-03-02T10:30:00Z", store_id="s2")
+            await log.delete("o3")
+        built = self.run(db, changes)
+        assert set(built) == {f"{DEFAULT_STORE_ID}:2026-03-01", "s2:2026-03-02"}
+        assert built[f"{DEFAULT_STORE_ID}:2026-03-01"]["categories"]["sale"]["category"] == "Sale"
+
+    def test_single_store_rebuild_keeps_other_stores(self, db):
+        async def go():
+            log = OrderLog(db)
+            await log.create(order("o1", "2026-03-01T10:00:00Z", [item("mug", 1, 10)]))
+            await log.create(order("o2", "2026-03-01T10:00:00Z", [item("mug", 1, 10)], store_id="s2"))
+            before = await rows(db)
+            await db.sales_rollups.update_one({"_id": "s2:2026-03-01"}, {"$inc": {"revenue": 99}})
+            await rebuild_rollups(db, DEFAULT_STORE_ID)
+            after = await rows(db)
+            await rebuild_rollups(db, "s2")
+            return before, after, await rows(db)
+
+        before, after, repaired = asyncio.run(go())
+        assert after["s2:2026-03-01"]["revenue"] == 109, "Only the requested store is rebuilt"
+        assert repaired == before
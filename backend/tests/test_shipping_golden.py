@@ -0,0 +1,119 @@
+"""
+Golden shipping quotes.
+
+The expected prices were produced by the calculator before it was compiled into
+zone indexes and rate tables (one loop iteration per unit); the current
+calculator must reproduce them to the cent.
+"""
+import pytest
+
+from core.rate_tables import ServiceRates
+from core.zone_index import ZoneIndex
+from routes.shipping import ShippingCalculationRequest, price_shipping
+
+ZONES = [
+    {"id": "z-metro", "code": "METRO", "name": "Sydney Metro", "country": "AU", "is_active": True, "postcodes": ["2000-2234"]},
+    {"id": "z-nsw", "code": "NSW", "name": "Regional NSW", "country": "AU", "is_active": True, "postcodes": ["2"]},
+]
+
+SERVICES = [
+    {   # Actual weight, fuel levy % and flat levy, handling per item, GST added
+        "id": "road", "code": "ROAD", "name": "Road Express", "is_active": True, "sort_order": 1,
+        "cubic_weight_modifier": 250, "fuel_levy_percent": 12.5, "fuel_levy_amount": 1.1, "handling_fee": 0.55,
+        "tax_inclusive": False, "tax_rate": 10,
+        "rates": [
+            {"zone_code": "METRO", "min_weight": 0, "max_weight": 30, "per_parcel_rate": 5.0, "per_kg_rate": 1.27, "delivery_days": 1},
+            {"zone_code": "METRO", "min_weight": 30, "max_weight": 500, "per_parcel_rate": 9.95, "per_kg_rate": 0.85, "delivery_days": 2},
+            {"zone_code": "NSW", "min_weight": 0, "max_weight": 500, "per_parcel_rate": 12.0, "per_kg_rate": 1.5, "delivery_days": 3},
+        ],
+    },
+    {   # Per-article minimum charge with more than two decimals, GST included
+        "id": "satchel", "code": "SATCHEL", "name": "Satchel", "is_active": True, "sort_order": 2,
+        "cubic_weight_modifier": 250, "tax_inclusive": True, "tax_rate": 10,
+        "rates": [
+            {"zone_code": "NSW", "min_weight": 0, "max_weight": 100, "per_parcel_rate": 0, "per_kg_rate": 0.333, "min_charge": 7.777},
+        ],
+    },
+    {   # Cubic weight with a heavier modifier and a service minimum
+        "id": "freight", "code": "FREIGHT", "name": "Bulky Freight", "is_active": True, "sort_order": 3,
+        "cubic_weight_modifier": 333, "fuel_levy_percent": 7, "min_charge": 9, "tax_inclusive": False,
+        "rates": [
+            {"zone_code": "METRO", "min_weight": 0, "max_weight": 2000, "first_parcel": 3.3, "per_kg_rate": 2.5, "min_charge": 3.335},
+        ],
+    },
+]
+
+# One option per service, so every service's own price is quoted
+OPTIONS = [
+    {"id": f"opt-{service['id']}", "name": service["name"], "is_active": True, "countries": ["AU"],
+     "sort_order": service["sort_order"], "service_ids": [service["id"]], "free_shipping_threshold": 0}
+    for service in SERVICES
+]
+
+# name: (postcode, cart total, items)
+CARTS = {
+    "multi_quantity": ("2010", 120, [
+        {"product_id": "a", "quantity": 3, "weight": 1.2},
+        {"product_id": "b", "quantity": 2, "weight": 0.4},
+        {"product_id": "c", "quantity": 7, "weight": 0.35},
+    ]),
+    "cubic_beats_actual": ("2010", 80, [
+        {"product_id": "box", "quantity": 2, "weight": 0.5, "shipping_length": 600, "shipping_width": 400, "shipping_height": 300},
+    ]),
+    "actual_beats_cubic": ("2010", 80, [
+        {"product_id": "weights", "quantity": 3, "weight": 9.5, "shipping_length": 150, "shipping_width": 150, "shipping_height": 100},
+    ]),
+    "mixed_cubic_and_actual": ("2010", 80, [
+        {"product_id": "box", "quantity": 1, "weight": 0.5, "shipping_length": 600, "shipping_width": 400, "shipping_height": 300},
+        {"product_id": "weights", "quantity": 2, "weight": 9.5, "shipping_length": 150, "shipping_width": 150, "shipping_height": 100},
+        {"product_id": "flat", "quantity": 1, "weight": 1.25},
+    ]),
+    "min_charge_three_decimals": ("2500", 40, [
+        {"product_id": "sock", "quantity": 5, "weight": 0.1},
+        {"product_id": "cap", "quantity": 1, "weight": 0.25},
+    ]),
+    "handling_per_item": ("2010", 60, [
+        {"product_id": "mug", "quantity": 4, "weight": 0.6},
+        {"product_id": "bowl", "quantity": 9, "weight": 0.3},
+    ]),
+    "heavier_bracket": ("2010", 300, [
+        {"product_id": "tile", "quantity": 12, "weight": 2.75},
+    ]),
+    "zero_and_negative_quantities": ("2010", 30, [
+        {"product_id": "gone", "quantity": 0, "weight": 2},
+        {"product_id": "refund", "quantity": -3, "weight": 1},
+        {"product_id": "kept", "quantity": 4, "weight": 1},
+    ]),
+    "regional": ("2650", 50, [
+        {"product_id": "a", "quantity": 2, "weight": 3.3},
+    ]),
+}
+
+# name: {option id: (price, price_ex_gst, gst_amount)}
+GOLDEN = {
+    "multi_quantity": {"opt-road": (93.43, 84.94, 8.49), "opt-satchel": (93.32, 84.84, 8.48), "opt-freight": (66.8, 60.73, 6.07)},
+    "cubic_beats_actual": {"opt-road": (64.91, 59.01, 5.9), "opt-satchel": (15.55, 14.14, 1.41), "opt-freight": (148.86, 135.33, 13.53)},
+    "actual_beats_cubic": {"opt-road": (66.36, 60.33, 6.03), "opt-satchel": (23.33, 21.21, 2.12), "opt-freight": (95.51, 86.83, 8.68)},
+    "mixed_cubic_and_actual": {"opt-road": (93.1, 84.64, 8.46), "opt-satchel": (31.11, 28.28, 2.83), "opt-freight": (145.66, 132.42, 13.24)},
+    "min_charge_three_decimals": {"opt-road": (95.34, 86.67, 8.67), "opt-satchel": (46.66, 42.42, 4.24)},
+    "handling_per_item": {"opt-road": (97.5, 88.64, 8.86), "opt-satchel": (101.1, 91.91, 9.19), "opt-freight": (65.51, 59.55, 5.96)},
+    "heavier_bracket": {"opt-road": (190.97, 173.61, 17.36), "opt-satchel": (93.32, 84.84, 8.48), "opt-freight": (143.78, 130.71, 13.07)},
+    "zero_and_negative_quantities": {"opt-road": (34.66, 31.51, 3.15), "opt-satchel": (31.11, 28.28, 2.83), "opt-freight": (27.3, 24.82, 2.48)},
+    "regional": {"opt-road": (44.37, 40.34, 4.03), "opt-satchel": (15.55, 14.14, 1.41)},
+}
+
+
+def quote(name):
+    postcode, cart_total, items = CARTS[name]
+    request = ShippingCalculationRequest(country="AU", postcode=postcode, cart_total=cart_total, items=items)
+    services = [ServiceRates(service) for service in sorted(SERVICES, key=lambda s: s["sort_order"])]
+    response = price_shipping(request, ZoneIndex(ZONES), services, OPTIONS)
+    return {
+        option["id"]: (option["price"], option["price_ex_gst"], option["gst_amount"])
+        for option in response.options if option["id"] != "pickup"
+    }
+
+
+@pytest.mark.parametrize("name", sorted(CARTS))
+def test_matches_golden_quote(name):
+    assert quote(name) == GOLDEN[name]
@@ -0,0 +1,86 @@
+"""
+In-memory suburb index: postcode lookup and autocomplete search
+"""
+import asyncio
+
+from core.suburbs import SuburbIndex, builtin_suburbs, suburb_index
+
+IMPORTED = [
+    {"postcode": "5038", "suburb": "NORTH PLYMPTON", "state": "SA", "country": "AU"},
+    {"postcode": "5038", "suburb": "PLYMPTON", "state": "SA", "country": "AU"},
+    {"postcode": "2000", "suburb": "SYDNEY", "state": "NSW", "country": "AU"},
+    {"postcode": "3000", "suburb": "melbourne", "state": "VIC"},
+]
+
+STATIC = {
+    "2000": [{"suburb": "Sydney", "state": "NSW"}, {"suburb": "The Rocks", "state": "NSW"}],
+    "2010": [{"suburb": "Surry Hills", "state": "NSW"}],
+    "5000": [{"suburb": "Adelaide", "state": "SA"}],
+    "2601": [{"suburb": "Acton", "state": "ACT"}],
+}
+
+
+def names(results):
+    return [(r["postcode"], r["suburb"]) for r in results]
+
+
+class TestLookup:
+    def test_imported_postcode_replaces_built_in_list(self):
+        index = SuburbIndex(IMPORTED, STATIC)
+        assert index.lookup("2000") == [{"suburb": "Sydney", "state": "NSW"}]
+
+    def test_falls_back_to_built_in_list(self):
+        index = SuburbIndex(IMPORTED, STATIC)
+        assert index.lookup("2010") == [{"suburb": "Surry Hills", "state": "NSW"}]
+        assert index.lookup("9999") == []
+
+    def test_imported_names_are_title_cased(self):
+        index = SuburbIndex(IMPORTED, STATIC)
+        assert [s["suburb"] for s in index.lookup("5038")] == ["North Plympton", "Plympton"]
+        assert index.lookup("3000") == [{"suburb": "Melbourne", "state": "VIC"}]
+
+
+class TestSearch:
+    def test_postcode_prefix_before_name_prefix(self):
+        index = SuburbIndex([], {"2000": [{"suburb": "Sydney", "state": "NSW"}], "5000": [{"suburb": "20 Mile", "state": "SA"}]})
+        assert names(index.search("20")) == [("2000", "Sydney"), ("5000", "20 Mile")]
+
+    def test_matches_any_word_of_the_name(self):
+        index = SuburbIndex(IMPORTED, STATIC)
+        assert names(index.search("plym")) == [("5038", "North Plympton"), ("5038", "Plympton")]
+        assert names(index.search("north p")) == [("5038", "North Plympton")]
+        assert names(index.search("rocks")) == [("2000", "The Rocks")]
+
+    def test_does_not_match_inside_a_word(self):
+        index = SuburbIndex(IMPORTED, STATIC)
+        assert index.search("lympton") == []
+
+    def test_query_is_trimmed_and_case_insensitive(self):
+        index = SuburbIndex(IMPORTED, STATIC)
+        assert names(index.search("  ADEL ")) == [("5000", "Adelaide")]
+
+    def test_imported_and_built_in_duplicates_appear_once(self):
+        index = SuburbIndex(IMPORTED, STATIC)
+        assert names(index.search("sydney")) == [("2000", "Sydney")]
+        assert len(index) == 8
+
+    def test_country_only_on_entries_that_have_one(self):
+        index = SuburbIndex(IMPORTED, STATIC)
+        assert index.search("melb") == [{"postcode": "3000", "suburb": "Melbourne", "state": "VIC"}]
+        assert index.search("5038", limit=1) == [{"postcode": "5038", "suburb": "North Plympton", "state": "SA", "country": "AU"}]
+
+    def test_limit(self):
+        static = {str(2000 + i): [{"suburb": f"Town {i}", "state": "NSW"}] for i in range(80)}
+        index = SuburbIndex([], static)
+        assert len(index.search("20")) == 50
+        assert names(index.search("2", limit=3)) == [("2000", "Town 0"), ("2001", "Town 1"), ("2002", "Town 2")]
+        assert len(index.search("town", limit=70)) == 70
+
+
+class TestSuburbIndex:
+    def test_built_from_imported_collection_and_built_in_file(self, db):
+        asyncio.run(db.postcode_suburbs.insert_many([dict(doc) for doc in IMPORTED]))
+        index = asyncio.run(suburb_index(db))
+        assert index.lookup("5038")[0]["suburb"] == "North Plympton"
+        assert index.lookup("2000") == [{"suburb": "Sydney", "state": "NSW"}]
+        assert "2000" in builtin_suburbs()
@@ -0,0 +1,90 @@
+"""
+ZoneIndex must match zones exactly like the linear scan it replaced
+"""
+import random
+
+import pytest
+
+from core.zone_index import ZoneIndex
+
+
+def linear_scan(postcode, zones):
+    """The original find_all_zones_for_postcode, kept verbatim as the reference"""
+    postcode = postcode.strip()
+    matching = []
+
+    for zone in zones:
+        for pc in zone.get("postcodes", []):
+            matched = False
+            if pc == postcode:
+                matched = True
+            elif "-" in str(pc):
+                try:
+                    start, end = str(pc).split("-")
+                    if int(start) <= int(postcode) <= int(end):
+                        matched = True
+                except (ValueError, TypeError):
+                    pass
+            elif postcode.startswith(str(pc)):
+                matched = True
+
+            if matched:
+                matching.append(zone)
+                break
+
+    return matching
+
+
+ZONES = [
+    {"id": "sydney", "postcodes": ["2000-2050", "2060"]},
+    {"id": "nsw", "postcodes": ["2"]},
+    {"id": "inner", "postcodes": ["2000-2010", "2005-2020"]},
+    {"id": "numeric", "postcodes": [3000, "30"]},
+    {"id": "reversed", "postcodes": ["2100-2090"]},
+    {"id": "dashed", "postcodes": ["AB-1", "x-y"]},
+    {"id": "everywhere", "postcodes": [""]},
+    {"id": "empty", "postcodes": []},
+    {"id": "no_postcodes"},
+]
+
+
+def ids(zones):
+    return [zone["id"] for zone in zones]
+
+
+class TestZoneIndexMatch:
+    @pytest.mark.parametrize("postcode", [
+        "2000", "2060", "2005", "2050", "2051",   # exact and range edges
+        "2", "20", "2999", "3000", "30001",        # prefixes, numeric postcode entries
+        "2095", "AB-1", "x-y", "AB",               # reversed range, literal dashed codes
+        "", "   ", " 2010 ", "+2010", "abc",       # empty, whitespace, non-numeric
+    ])
+    def test_same_zones_as_linear_scan(self, postcode):
+        assert ids(ZoneIndex(ZONES).match(postcode)) == ids(linear_scan(postcode, ZONES))
+
+    def test_overlapping_ranges(self):
+        assert ids(ZoneIndex(ZONES).match("2007")) == ["sydney", "nsw", "inner", "everywhere"]
+
+    def test_empty_postcode_matches_only_empty_prefix(self):
+        zones = [{"id": "a", "postcodes": ["2000"]}, {"id": "b", "postcodes": ["", "2000-2010"]}]
+        assert ids(ZoneIndex(zones).match("")) == ["b"]
+        assert ids(ZoneIndex([]).match("2000")) == []
+
+    def test_random_zone_sets(self):
+        rng = random.Random(7)
+
+        def code():
+            kind = rng.choice(["exact", "range", "prefix"])
+            if kind == "exact":
+                return str(rng.randint(800, 9999)).zfill(4)
+            if kind == "prefix":
+                return str(rng.randint(0, 99))[:rng.randint(1, 2)]
+            start = rng.randint(800, 9999)
+            return f"{start}-{start + rng.randint(-5, 300)}"
+
+        for _ in range(50):
+            zones = [{"id": str(i), "postcodes": [code() for _ in range(rng.randint(0, 6))]} for i in range(20)]
+            index = ZoneIndex(zones)
+            for _ in range(40):
+                postcode = str(rng.randint(0, 9999)).zfill(rng.choice([3, 4]))
+                assert ids(index.match(postcode)) == ids(linear_scan(postcode, zones)), postcode